@@ -0,0 +1,137 @@
+# auto_delete.py - 定时删除临时消息：单个调度协程 + 最小堆，待删除记录持久化，重启后继续删除
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DELETE_RATE = 10     # 每秒最多调用多少次删除接口
+BATCH_SIZE = 100     # deleteMessages 单次上限
+SAVE_INTERVAL = 5    # 待删除记录最多每隔几秒落盘一次
+
+
+class DeleteScheduler:
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self.heap = []          # (due_ts, chat_id, message_id)，due_ts 为墙钟时间，重启后仍有效
+        self.bot = None
+        self._wake = None
+        self._task = None
+        self._dirty = False
+        self._last_save = 0.0
+        self._save_seq = 0
+        self._written_seq = 0
+        self._save_lock = threading.Lock()
+        self.deleted = 0
+        self.failed = 0
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                pending = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        for due, chat_id, message_id in pending:
+            heapq.heappush(self.heap, (due, chat_id, message_id))
+
+    def _write(self, pending: list, seq: int):
+        """在线程中写文件；取消后仍在写的旧快照不会覆盖更新的快照"""
+        with self._save_lock:
+            if seq < self._written_seq:
+                return
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(self.state_file), encoding="utf-8") as tf:
+                json.dump(pending, tf)
+                tempname = tf.name
+            os.replace(tempname, self.state_file)
+            self._written_seq = seq
+
+    async def _save(self):
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._save_seq += 1
+        await asyncio.to_thread(self._write, list(self.heap), self._save_seq)
+
+    def schedule(self, chat_id: int, message_id: int, delay: float):
+        entry = (time.time() + delay, chat_id, message_id)
+        heapq.heappush(self.heap, entry)
+        self._dirty = True
+        # 只有新消息比当前最早的还早到期时才需要唤醒；落盘由调度协程按间隔合并
+        if self._wake and self.heap[0] is entry:
+            self._wake.set()
+
+    def start(self, bot):
+        if self._task:
+            return
+        self.bot = bot
+        self._load()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("自动删除调度器启动，待删除 %d 条", len(self.heap))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._save()
+
+    def _pop_due(self) -> dict:
+        """取出所有到期消息，按聊天分组"""
+        now = time.time()
+        due = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self.heap)
+            due.setdefault(chat_id, []).append(message_id)
+        return due
+
+    async def _delete_batch(self, chat_id, message_ids):
+        try:
+            if hasattr(self.bot, "delete_messages"):
+                await self.bot.delete_messages(chat_id, message_ids)
+            else:
+                for message_id in message_ids:
+                    await self.bot.delete_message(chat_id, message_id)
+            self.deleted += len(message_ids)
+        except Exception as e:
+            # 消息已被删除或超过 48 小时都会失败，记录后丢弃
+            self.failed += len(message_ids)
+            logger.warning("删除消息失败: chat=%s ids=%s 错误: %s", chat_id, message_ids, e)
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            due = self._pop_due()
+            for chat_id, ids in due.items():
+                for i in range(0, len(ids), BATCH_SIZE):
+                    await self._delete_batch(chat_id, ids[i:i + BATCH_SIZE])
+                    await asyncio.sleep(1 / DELETE_RATE)
+            if due:
+                self._dirty = True
+            save_in = None
+            if self._dirty:
+                save_in = SAVE_INTERVAL - (time.monotonic() - self._last_save)
+                if save_in <= 0:
+                    await self._save()
+                    save_in = None
+
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            if timeout is not None and timeout <= 0:
+                continue
+            if save_in is not None:
+                timeout = save_in if timeout is None else min(timeout, save_in)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {"pending": len(self.heap), "deleted": self.deleted, "failed": self.failed}
@@ -0,0 +1,225 @@
+# fake_servers.py - 压测用的本地模拟服务：NodeSeek/DeepFlood 接口、FlareSolverr、Turnstile 打码接口
+#
+# 路由（一个端口）：
+#   /ns/...、/df/...          站点：签到、信用记录、登录、页面
+#   /flaresolverr/v1          FlareSolverr
+#   /solver/createTask        Turnstile 打码
+#   /solver/getTaskResult
+#   /_stats                   各路由请求数、状态码与处理耗时分位数
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHALLENGE_PAGE = "<html><head><title>Just a moment...</title></head><body>cf-chl</body></html>"
+LOGIN_PAGE = "<html><body>请先登录</body></html>"
+PAGE_SIZE = 100
+HISTORY_DAYS = 60
+
+
+class FakeState:
+    def __init__(self, latency_ms: float, error_rate: float, throttle_rate: float, solve_ms: float, seed: int):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.solve = solve_ms / 1000
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.signed = set()         # (站点, cookie) 今天已签到
+        self.tasks = {}             # taskId -> 创建时间
+        self.routes = {}            # 路由 -> {"count", "status": {}, "latency": []}
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.rng.random() < rate
+
+    def delay(self):
+        if self.latency:
+            with self.lock:
+                factor = self.rng.uniform(0.5, 1.5)
+            time.sleep(self.latency * factor)
+
+    def record(self, route: str, status: int, elapsed: float):
+        with self.lock:
+            r = self.routes.setdefault(route, {"count": 0, "status": {}, "latency": []})
+            r["count"] += 1
+            r["status"][str(status)] = r["status"].get(str(status), 0) + 1
+            r["latency"].append(elapsed)
+
+    def stats(self) -> dict:
+        with self.lock:
+            routes = {k: (v["count"], dict(v["status"]), sorted(v["latency"])) for k, v in self.routes.items()}
+        out = {}
+        for route, (count, status, lat) in routes.items():
+            def pct(q):
+                return round(lat[min(len(lat) - 1, int(q * (len(lat) - 1)))] * 1000, 1) if lat else 0
+            out[route] = {"count": count, "status": status, "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+        return out
+
+
+def credit_records(cookie: str) -> list:
+    """按 cookie 生成稳定的信用记录：每天一条签到收益，最新在前"""
+    seed = sum(cookie.encode())
+    today = datetime.now(timezone.utc).replace(hour=1, minute=0, second=0, microsecond=0)
+    records, balance = [], 1000 + seed % 500
+    for day in range(HISTORY_DAYS):
+        amount = 1 + (seed + day) % 9
+        ts = (today - timedelta(days=day)).isoformat()
+        records.append([amount, balance, f"签到收益{amount}个鸡腿", ts])
+        balance -= amount
+    return records
+
+
+def make_handler(state: FakeState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send(self, status: int, body, content_type="application/json", headers=None):
+            if not isinstance(body, (bytes, str)):
+                body = json.dumps(body, ensure_ascii=False)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+            return status
+
+        def _cookie(self) -> str:
+            m = re.search(r"session=([^;]+)", self.headers.get("Cookie", ""))
+            return m.group(1) if m else ""
+
+        def _handle(self, method: str):
+            start = time.perf_counter()
+            path = self.path.split("?")[0]
+            body = self._body() if method == "POST" else b""
+            route, status = path, 500
+            try:
+                if path == "/_stats":
+                    route = None
+                    status = self._send(200, state.stats())
+                elif path.startswith("/flaresolverr"):
+                    route = "flaresolverr"
+                    state.delay()
+                    status = self._send(200, {"status": "ok", "solution": {
+                        "cookies": [{"name": "cf_clearance", "value": uuid.uuid4().hex}]
+                    }})
+                elif path.startswith("/solver/"):
+                    route, status = self._solver(path, body)
+                elif path[:4] in ("/ns/", "/df/"):
+                    route, status = self._site(method, path[1:3], path[3:], body)
+                else:
+                    status = self._send(404, {"success": False})
+            finally:
+                if route:
+                    state.record(route, status, time.perf_counter() - start)
+
+        def _solver(self, path, body):
+            if path.endswith("/createTask"):
+                task_id = uuid.uuid4().hex
+                with state.lock:
+                    state.tasks[task_id] = time.monotonic()
+                return "solver.createTask", self._send(200, {"errorId": 0, "taskId": task_id})
+            task_id = json.loads(body or b"{}").get("taskId")
+            with state.lock:
+                created = state.tasks.get(task_id)
+            if created is None:
+                return "solver.getTaskResult", self._send(200, {"errorId": 1, "status": "failed"})
+            if time.monotonic() - created < state.solve:
+                return "solver.getTaskResult", self._send(200, {"errorId": 0, "status": "processing"})
+            with state.lock:
+                state.tasks.pop(task_id, None)
+            return "solver.getTaskResult", self._send(200, {
+                "errorId": 0, "status": "ready", "solution": {"token": f"fake-token-{task_id}"}
+            })
+
+        def _site(self, method, site, path, body):
+            state.delay()
+            api = path.startswith("/api/")
+            route = site + re.sub(r"page-\d+", "page-N", path)
+            if api and state.roll(state.throttle_rate):
+                return route, self._send(403, CHALLENGE_PAGE, "text/html")
+            if api and state.roll(state.error_rate):
+                return route, self._send(502, "Bad Gateway", "text/html")
+
+            cookie = self._cookie()
+            if path == "/api/attendance" and method == "POST":
+                if not cookie or cookie.startswith("expired"):
+                    return route, self._send(200, LOGIN_PAGE, "text/html")
+                with state.lock:
+                    first = (site, cookie) not in state.signed
+                    state.signed.add((site, cookie))
+                if first:
+                    amount = 1 + sum(cookie.encode()) % 9
+                    return route, self._send(200, {"success": True, "message": f"签到成功，获得 {amount} 个鸡腿"})
+                return route, self._send(200, {"success": False, "message": "今天已完成签到，请勿重复操作"})
+
+            m = re.match(r"/api/account/credit/page-(\d+)$", path)
+            if m:
+                if not cookie or cookie.startswith("expired"):
+                    return route, self._send(200, {"success": False, "message": "USER NOT FOUND"})
+                page = int(m.group(1))
+                records = credit_records(cookie)[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+                return route, self._send(200, {"success": True, "data": records})
+
+            if path == "/api/account/signIn" and method == "POST":
+                payload = json.loads(body or b"{}")
+                if not str(payload.get("token", "")).startswith("fake-token"):
+                    return route, self._send(200, {"success": False, "message": "验证码错误"})
+                session = f"valid-{uuid.uuid4().hex[:16]}"
+                return route, self._send(200, {"success": True, "message": "登录成功"},
+                                         headers={"Set-Cookie": f"session={session}; Path=/"})
+
+            return route, self._send(200, "<html><body>ok</body></html>", "text/html")
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return Handler
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压测用模拟站点/打码服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency-ms", type=float, default=50, help="站点接口平均延迟")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="站点接口返回 502 的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="站点接口返回 403 质询页的比例")
+    parser.add_argument("--solve-ms", type=float, default=0, help="Turnstile 打码耗时")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    state = FakeState(args.latency_ms, args.error_rate, args.throttle_rate, args.solve_ms, args.seed)
+    server = FakeServer((args.host, args.port), make_handler(state))
+    print(f"fake servers listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# fake_telegram.py - 压测用的本地 Bot API：接收 bot.py 的请求，按脚本回放合成的用户更新，统计处理延迟和发送速率
+#
+# bot.py 设置 TG_API_BASE_URL=http://127.0.0.1:<端口> 后，所有 Bot API 调用都会发到这里。
+# 单独运行时只提供接口，不产生更新：
+#   python bench/fake_telegram.py --port 18081
+import re
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.request
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_ID = 7000000000
+BOT_USER = {"id": BOT_ID, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+SEND_METHODS = {"sendMessage", "sendDocument", "editMessageText", "answerCallbackQuery"}
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * (len(values) - 1)))]
+
+
+class FakeTelegram:
+    def __init__(self, flood_control: bool = False):
+        self.flood_control = flood_control
+        self.lock = threading.Condition()
+        self.updates = []           # 待投递的更新
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.delivered = {}         # update_id -> (投递时间, chat_id, 类型)
+        self.responses = []         # (时间, chat_id, 方法)
+        self.callback_chat = {}     # callback_query_id -> chat_id
+        self.markups = {}           # chat_id -> 最近一条消息的 (message_id, 按钮 callback_data 列表)
+        self.poll_gaps = []         # 上次 getUpdates 返回到下次请求到达的间隔
+        self._last_poll_return = None
+        self.calls = {}             # 方法 -> 次数
+        self.flood_rejected = 0
+        self._sent_global = []
+        self._sent_chat = {}
+        self.webhook = None         # (url, secret_token)，设置后改为主动推送
+        self.webhook_acks = []      # 推送请求的往返耗时
+        self.webhook_errors = 0
+        self._outgoing = queue.Queue()
+        self._pushers = []
+
+    # ---------- 更新生成 ----------
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"u{uid}"}
+
+    def _push(self, update: dict, chat_id: int, kind: str):
+        with self.lock:
+            update["update_id"] = self.next_update_id
+            self.next_update_id += 1
+            update["_meta"] = (chat_id, kind)
+            if self.webhook:
+                self._outgoing.put(update)
+                return
+            self.updates.append(update)
+            self.lock.notify_all()
+
+    def push_command(self, uid: int, text: str):
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        command = text.split()[0]
+        self._push({"message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private", "first_name": f"u{uid}", "username": f"u{uid}"},
+            "from": self._user(uid),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        }}, uid, command.lstrip("/"))
+
+    def push_callback(self, uid: int, data: str, message_id: int):
+        with self.lock:
+            query_id = f"cb{self.next_update_id}"
+            self.callback_chat[query_id] = uid
+        self._push({"callback_query": {
+            "id": query_id,
+            "from": self._user(uid),
+            "chat_instance": str(uid),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": BOT_USER,
+                "text": "…",
+            },
+        }}, uid, "hz_page" if data.startswith("hz_") else "check_page")
+
+    def next_page(self, chat_id: int):
+        """管理员翻页：取该聊天最近一条带分页按钮的消息，点“下一页”或“上一页”"""
+        with self.lock:
+            message_id, buttons = self.markups.get(chat_id, (None, []))
+        pages = [b for b in buttons if b.startswith(("check_page_", "hz_page_"))]
+        if message_id and pages:
+            self.push_callback(chat_id, pages[-1], message_id)
+            return True
+        return False
+
+    # ---------- Webhook 推送 ----------
+    def _push_loop(self):
+        """与 Telegram 一样并发推送（默认最多 40 个连接），记录每次推送的往返时间"""
+        while True:
+            update = self._outgoing.get()
+            if update is None:
+                return
+            url, secret = self.webhook
+            chat_id, kind = update["_meta"]
+            body = json.dumps({k: v for k, v in update.items() if k != "_meta"}).encode("utf-8")
+            req = urllib.request.Request(url, data=body, headers={
+                "Content-Type": "application/json",
+                "X-Telegram-Bot-Api-Secret-Token": secret,
+            })
+            start = time.monotonic()
+            with self.lock:
+                self.delivered.setdefault(update["update_id"], (start, chat_id, kind))
+            try:
+                urllib.request.urlopen(req, timeout=30).read()
+                with self.lock:
+                    self.webhook_acks.append(time.monotonic() - start)
+            except Exception:
+                with self.lock:
+                    self.webhook_errors += 1
+
+    def set_webhook(self, params: dict):
+        self.webhook = (params.get("url"), params.get("secret_token", ""))
+        connections = int(params.get("max_connections") or 40)
+        while len(self._pushers) < connections:
+            t = threading.Thread(target=self._push_loop, name="fake-telegram-push", daemon=True)
+            t.start()
+            self._pushers.append(t)
+        # 之前积压的更新也改为推送
+        with self.lock:
+            pending, self.updates = self.updates, []
+        for update in pending:
+            self._outgoing.put(update)
+
+    # ---------- Bot API ----------
+    def _message(self, chat_id, text="", reply_markup=None) -> dict:
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        msg = {"message_id": message_id, "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "group"},
+               "from": BOT_USER, "text": text}
+        if reply_markup:
+            msg["reply_markup"] = reply_markup
+        return msg
+
+    def _flooded(self, chat_id) -> float:
+        """模拟 Telegram 限流：全局 30 条/秒，单聊天 1 条/秒，超出返回 retry_after"""
+        now = time.monotonic()
+        with self.lock:
+            self._sent_global = [t for t in self._sent_global if now - t < 1]
+            recent = [t for t in self._sent_chat.get(chat_id, []) if now - t < 1]
+            if len(self._sent_global) >= 30 or recent:
+                self.flood_rejected += 1
+                return 1.0
+            self._sent_global.append(now)
+            self._sent_chat[chat_id] = recent + [now]
+        return 0.0
+
+    def _record(self, method: str, chat_id):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if method in SEND_METHODS and chat_id is not None:
+                self.responses.append((time.monotonic(), int(chat_id), method))
+
+    def get_updates(self, params: dict) -> list:
+        arrived = time.monotonic()
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        with self.lock:
+            if self._last_poll_return is not None:
+                self.poll_gaps.append(arrived - self._last_poll_return)
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates and timeout:
+                self.lock.wait(timeout=min(timeout, 1.0))
+            batch = self.updates[:100]
+            now = time.monotonic()
+            out = []
+            for u in batch:
+                chat_id, kind = u["_meta"]
+                self.delivered.setdefault(u["update_id"], (now, chat_id, kind))
+                out.append({k: v for k, v in u.items() if k != "_meta"})
+            self._last_poll_return = now
+        return out
+
+    def call(self, method: str, params: dict):
+        chat_id = params.get("chat_id")
+        if method == "answerCallbackQuery":
+            chat_id = self.callback_chat.get(params.get("callback_query_id"))
+        if method == "getUpdates":
+            return self.get_updates(params)
+        if self.flood_control and method in ("sendMessage", "sendDocument") and chat_id is not None:
+            wait = self._flooded(int(chat_id))
+            if wait:
+                return {"_retry_after": wait}
+        self._record(method, chat_id)
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.set_webhook(params)
+            return True
+        if method == "deleteWebhook":
+            self.webhook = None
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook[0] if self.webhook else "", "has_custom_certificate": False,
+                    "pending_update_count": self._outgoing.qsize()}
+        if method in ("sendMessage", "sendDocument", "editMessageText"):
+            markup = params.get("reply_markup")
+            if isinstance(markup, str):
+                markup = json.loads(markup)
+            msg = self._message(chat_id, params.get("text") or params.get("caption") or "", markup)
+            if method == "editMessageText" and params.get("message_id"):
+                msg["message_id"] = int(params["message_id"])
+            if markup and chat_id is not None:
+                buttons = [b.get("callback_data", "") for row in markup.get("inline_keyboard", []) for b in row]
+                with self.lock:
+                    self.markups[int(chat_id)] = (msg["message_id"], buttons)
+            return msg
+        if method == "getMyCommands":
+            return []
+        return True
+
+    # ---------- 统计 ----------
+    def report(self, duration: float) -> dict:
+        with self.lock:
+            delivered = dict(self.delivered)
+            responses = sorted(self.responses)
+            gaps = list(self.poll_gaps)
+            acks = list(self.webhook_acks)
+            calls = dict(self.calls)
+
+        # 每个聊天的响应归到它之前最近一次投递的更新
+        by_chat = {}
+        for update_id, (t, chat_id, kind) in sorted(delivered.items(), key=lambda x: x[1][0]):
+            by_chat.setdefault(chat_id, []).append([t, kind, None, None])
+        for t, chat_id, _ in responses:
+            pending = [u for u in by_chat.get(chat_id, []) if u[0] <= t]
+            if pending:
+                u = pending[-1]
+                u[2] = u[2] if u[2] is not None else t - u[0]
+                u[3] = t - u[0]
+
+        kinds = {}
+        unanswered = 0
+        for items in by_chat.values():
+            for _, kind, first, last in items:
+                if first is None:
+                    unanswered += 1
+                    continue
+                k = kinds.setdefault(kind, {"first": [], "last": []})
+                k["first"].append(first)
+                k["last"].append(last)
+
+        handlers = {
+            kind: {
+                "count": len(v["first"]),
+                "first_p50_ms": round(percentile(v["first"], 0.5) * 1000, 1),
+                "first_p95_ms": round(percentile(v["first"], 0.95) * 1000, 1),
+                "done_p50_ms": round(percentile(v["last"], 0.5) * 1000, 1),
+                "done_p95_ms": round(percentile(v["last"], 0.95) * 1000, 1),
+                "done_max_ms": round(max(v["last"]) * 1000, 1),
+            }
+            for kind, v in kinds.items()
+        }
+
+        send_times = [t for t, _, m in responses if m in ("sendMessage", "sendDocument")]
+        per_second = {}
+        for t in send_times:
+            per_second[int(t)] = per_second.get(int(t), 0) + 1
+        return {
+            "updates": len(delivered),
+            "unanswered": unanswered,
+            "handlers": handlers,
+            "messages_sent": len(send_times),
+            "send_rate_avg": round(len(send_times) / duration, 2) if duration else 0,
+            "send_rate_peak": max(per_second.values(), default=0),
+            "flood_rejected": self.flood_rejected,
+            "poll_gap_p99_ms": round(percentile(gaps, 0.99) * 1000, 1),
+            "poll_gap_max_ms": round(max(gaps, default=0) * 1000, 1),
+            "webhook_ack_p99_ms": round(percentile(acks, 0.99) * 1000, 1),
+            "webhook_ack_max_ms": round(max(acks, default=0) * 1000, 1),
+            "webhook_errors": self.webhook_errors,
+            "calls": calls,
+        }
+
+
+def _parse_params(handler) -> dict:
+    length = int(handler.headers.get("Content-Length") or 0)
+    raw = handler.rfile.read(length) if length else b""
+    ctype = handler.headers.get("Content-Type", "")
+    if "json" in ctype:
+        return json.loads(raw or b"{}")
+    if "multipart" in ctype:
+        # 文件上传只取普通字段
+        fields = re.findall(rb'name="([^"]+)"\r\n\r\n(.*?)\r\n--', raw, re.S)
+        return {k.decode(): v.decode("utf-8", "replace") for k, v in fields}
+    params = {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+    for k, v in params.items():
+        if v[:1] in ("{", "["):
+            try:
+                params[k] = json.loads(v)
+            except ValueError:
+                pass
+    return params
+
+
+def make_handler(tg: FakeTelegram):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200 if payload.get("ok") else 429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            m = re.match(r"^/bot[^/]+/(\w+)", self.path)
+            params = _parse_params(self)
+            if not m:
+                return self._reply({"ok": False, "error_code": 404, "description": "Not Found"})
+            result = tg.call(m.group(1), params)
+            if isinstance(result, dict) and "_retry_after" in result:
+                wait = int(result["_retry_after"])
+                return self._reply({"ok": False, "error_code": 429,
+                                    "description": f"Too Many Requests: retry after {wait}",
+                                    "parameters": {"retry_after": wait}})
+            self._reply({"ok": True, "result": result})
+
+        do_GET = do_POST
+
+    return Handler
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(tg: FakeTelegram, port: int, host: str = "127.0.0.1") -> FakeTelegramServer:
+    server = FakeTelegramServer((host, port), make_handler(tg))
+    threading.Thread(target=server.serve_forever, name="fake-telegram", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压测用模拟 Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--flood-control", action="store_true", help="模拟 Telegram 限流（429 + retry_after）")
+    args = parser.parse_args()
+
+    tg = FakeTelegram(flood_control=args.flood_control)
+    server = serve(tg, args.port, args.host)
+    print(f"fake Bot API listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    start = time.monotonic()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(tg.report(time.monotonic() - start), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# run_bench.py - 离线端到端压测：启动模拟服务，用合成账号驱动签到、统计、登录流程，输出吞吐、尾延迟和峰值内存
+#
+# 用法（在项目根目录）：
+#   python bench/run_bench.py --accounts 1000 --per-user 5 --latency-ms 80 --throttle-rate 0.01 --expired-rate 0.05
+#
+# 每次运行都在临时目录里进行（复制 Node 脚本并链接 node_modules），不会改动项目自己的 data/ 和 logs/。
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * (len(values) - 1)))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_servers(args, port: int) -> subprocess.Popen:
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "bench", "fake_servers.py"),
+        "--port", str(port),
+        "--latency-ms", str(args.latency_ms),
+        "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--solve-ms", str(args.solve_ms),
+        "--seed", str(args.seed),
+    ], stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # 等待监听就绪
+    return proc
+
+
+def fetch_server_stats(base: str) -> dict:
+    with urllib.request.urlopen(f"{base}/_stats", timeout=10) as r:
+        return json.loads(r.read())
+
+
+def prepare_workdir() -> str:
+    """临时工作目录：Node 脚本用 __dirname 定位 data/ 和 logs/，因此复制脚本而不是链接"""
+    workdir = tempfile.mkdtemp(prefix="nsbench-")
+    for name in os.listdir(ROOT):
+        if name.endswith(".js") or name == "package.json":
+            shutil.copy(os.path.join(ROOT, name), workdir)
+    if os.path.isdir(os.path.join(ROOT, "node_modules")):
+        os.symlink(os.path.join(ROOT, "node_modules"), os.path.join(workdir, "node_modules"))
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    return workdir
+
+
+def configure_env(args, base: str):
+    os.environ.update({
+        "NS_BASE_URL": f"{base}/ns",
+        "DF_BASE_URL": f"{base}/df",
+        "FLARESOLVERR_URL": f"{base}/flaresolverr/v1",
+        "API_BASE_URL": f"{base}/solver",
+        "CLIENT_KEY": "bench",
+        "LOG_LEVEL": args.log_level,
+    })
+    # 默认放开限速，测的是流程本身；需要观察限速影响时用 --site-rate 指定
+    os.environ.setdefault("SITE_RATE_INIT", str(args.site_rate))
+    os.environ.setdefault("SITE_RATE_MAX", str(max(args.site_rate, 8)))
+
+
+def build_fleet(args) -> dict:
+    """合成账号：按 --per-user 分给用户，站点交替，按 --expired-rate 生成失效 Cookie"""
+    users = {}
+    expired_every = int(1 / args.expired_rate) if args.expired_rate > 0 else 0
+    for i in range(args.accounts):
+        uid = str(10_000_000 + i // args.per_user)
+        site_type = "ns" if i % 2 == 0 else "df"
+        u = users.setdefault(uid, {
+            "accounts": {"ns": {}, "df": {}},
+            "mode": {"ns": False, "df": False},
+            "tgUsername": f"bench{uid}",
+            "sign_hour": 0,
+            "sign_minute": 0,
+        })
+        state = "expired" if expired_every and i % expired_every == 0 else "valid"
+        u["accounts"][site_type][f"acc{i}"] = {
+            "username": f"acc{i}",
+            "password": "bench-password",
+            "cookie": f"session={state}-{i}",
+        }
+    return {"users": users}
+
+
+def user_targets(data: dict) -> list:
+    out = []
+    for uid, u in data["users"].items():
+        targets = {st: accs for st, accs in u["accounts"].items() if accs}
+        out.append((uid, targets, {st: u["mode"][st] for st in targets}))
+    return out
+
+
+async def drive(calls, concurrency: int):
+    """以给定并发运行协程工厂列表，返回 (每次耗时, 返回值)"""
+    sem = asyncio.Semaphore(concurrency)
+    latencies, results = [], []
+
+    async def one(factory):
+        async with sem:
+            start = time.perf_counter()
+            res = await factory()
+            latencies.append(time.perf_counter() - start)
+            results.append(res)
+
+    await asyncio.gather(*(one(f) for f in calls))
+    return latencies, results
+
+
+def report(name: str, accounts: int, wall: float, latencies, classes: Counter) -> dict:
+    return {
+        "scenario": name,
+        "accounts": accounts,
+        "wall_s": round(wall, 2),
+        "throughput_acc_s": round(accounts / wall, 2) if wall else 0,
+        "call_p50_s": round(percentile(latencies, 0.5), 3),
+        "call_p95_s": round(percentile(latencies, 0.95), 3),
+        "call_p99_s": round(percentile(latencies, 0.99), 3),
+        "call_max_s": round(max(latencies, default=0), 3),
+        "results": dict(classes),
+    }
+
+
+async def bench_sign(bot, data, args) -> dict:
+    calls = [
+        (lambda uid=uid, t=t, m=m: bot.run_sign_and_fix({uid: t}, {uid: m}, data))
+        for uid, t, m in user_targets(data)
+    ]
+    start = time.perf_counter()
+    latencies, results = await drive(calls, args.concurrency)
+    wall = time.perf_counter() - start
+    classes = Counter(
+        bot.result_class(r.get("result", ""))
+        for res in results for sites in res.values() for logs in sites.values() for r in logs
+    )
+    return report("sign", args.accounts, wall, latencies, classes)
+
+
+async def bench_stats(bot, data, args) -> dict:
+    calls = [
+        (lambda uid=uid, t=t: bot.run_stats_script(
+            {uid: {st: {n: a["cookie"] for n, a in accs.items()} for st, accs in t.items()}}, 30
+        ))
+        for uid, t, _ in user_targets(data)
+    ]
+    start = time.perf_counter()
+    latencies, results = await drive(calls, args.concurrency)
+    wall = time.perf_counter() - start
+    classes = Counter()
+    for res, err in results:
+        if err:
+            classes["script_error"] += 1
+            continue
+        for sites in res.values():
+            for logs in sites.values():
+                for r in logs:
+                    classes[r.get("result", "")[:8]] += 1
+    return report("stats", args.accounts, wall, latencies, classes)
+
+
+def bench_login(login_and_get_cookie, data, args) -> dict:
+    accounts = [
+        (a["username"], a["password"], st)
+        for u in data["users"].values() for st, accs in u["accounts"].items() for a in accs.values()
+    ][:args.login_accounts]
+
+    def one(acc):
+        start = time.perf_counter()
+        cookie = login_and_get_cookie(*acc)
+        return time.perf_counter() - start, bool(cookie)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        out = list(pool.map(one, accounts))
+    wall = time.perf_counter() - start
+    classes = Counter("ok" if ok else "failed" for _, ok in out)
+    return report("login", len(accounts), wall, [t for t, _ in out], classes)
+
+
+def peak_rss_mb() -> dict:
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"bench_process_mb": round(self_kb / 1024, 1), "largest_child_mb": round(child_kb / 1024, 1)}
+
+
+def print_report(rows, server_stats, rss):
+    print("\n==== 压测结果 ====")
+    for r in rows:
+        print(f"[{r['scenario']}] 账号 {r['accounts']}，耗时 {r['wall_s']}s，吞吐 {r['throughput_acc_s']} 个/秒")
+        print(f"    单次调用 p50 {r['call_p50_s']}s / p95 {r['call_p95_s']}s / p99 {r['call_p99_s']}s / max {r['call_max_s']}s")
+        print(f"    结果: {r['results']}")
+    print("\n---- 模拟服务 ----")
+    for route, st in sorted(server_stats.items()):
+        print(f"{route}: {st['count']} 次 {st['status']} p50 {st['p50_ms']}ms p95 {st['p95_ms']}ms p99 {st['p99_ms']}ms")
+    print(f"\n峰值内存: 压测进程 {rss['bench_process_mb']} MB，最大子进程 {rss['largest_child_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端压测")
+    parser.add_argument("--accounts", type=int, default=100, help="合成账号数（10~10000）")
+    parser.add_argument("--per-user", type=int, default=5, help="每个用户绑定的账号数")
+    parser.add_argument("--scenario", choices=["sign", "stats", "login", "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的用户调用数")
+    parser.add_argument("--login-accounts", type=int, default=50, help="login 场景最多登录多少个账号")
+    parser.add_argument("--expired-rate", type=float, default=0.05, help="Cookie 失效账号比例（触发自动登录）")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--solve-ms", type=float, default=0)
+    parser.add_argument("--site-rate", type=float, default=1000, help="站点限速器初始速率（请求/秒）")
+    parser.add_argument("--log-level", default="warn", help="Node 脚本日志级别")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args()
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_fake_servers(args, port)
+    workdir = prepare_workdir()
+    configure_env(args, base)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    try:
+        import bot
+        from nodeseek_login_dual import login_and_get_cookie
+
+        data = build_fleet(args)
+        bot.save_data(data)
+        print(f"工作目录 {workdir}，模拟服务 {base}，用户 {len(data['users'])}，账号 {args.accounts}")
+
+        rows = []
+        if args.scenario in ("sign", "all"):
+            rows.append(asyncio.run(bench_sign(bot, data, args)))
+        if args.scenario in ("stats", "all"):
+            rows.append(asyncio.run(bench_stats(bot, data, args)))
+        if args.scenario in ("login", "all"):
+            rows.append(bench_login(login_and_get_cookie, data, args))
+
+        server_stats = fetch_server_stats(base)
+        rss = peak_rss_mb()
+        print_report(rows, server_stats, rss)
+        if args.json:
+            with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "scenarios": rows, "server": server_stats, "rss": rss},
+                          f, indent=2, ensure_ascii=False)
+    finally:
+        server.terminate()
+        server.wait()
+        os.chdir(ROOT)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
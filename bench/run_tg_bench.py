@@ -0,0 +1,189 @@
+# run_tg_bench.py - 处理器压测：bot.py 连接本地模拟 Bot API 和模拟站点，回放大量用户的 /check、/stats 和翻页点击
+#
+# 用法（在项目根目录）：
+#   python bench/run_tg_bench.py --users 1000 --actions 2 --rate 50 --max-poll-gap-ms 500
+#   python bench/run_tg_bench.py --users 1000 --webhook       # webhook 模式
+#
+# 超过 --max-poll-gap-ms（事件循环被阻塞的迹象；webhook 模式下比较推送往返时间）或 --max-first-p95-ms 时
+# 以非零状态退出，便于本地回归检查。
+import os
+import sys
+import json
+import time
+import random
+import signal
+import shutil
+import argparse
+import subprocess
+
+from run_bench import ROOT, free_port, start_fake_servers, prepare_workdir, configure_env, build_fleet
+from fake_telegram import FakeTelegram, serve
+
+
+def build_schedule(args, uids, admin_uid) -> list:
+    """每个用户 --actions 个动作，均匀随机分布在 用户数×动作数/速率 秒内；翻页只由管理员触发"""
+    rng = random.Random(args.seed)
+    mix = []
+    for item in args.mix.split(","):
+        name, weight = item.split(":")
+        mix += [name] * int(weight)
+    span = len(uids) * args.actions / args.rate
+    schedule = [(0.0, admin_uid, "check")]
+    for uid in uids:
+        for _ in range(args.actions):
+            action = rng.choice(mix)
+            schedule.append((rng.uniform(0, span), admin_uid if action == "page" else uid, action))
+    return sorted(schedule)
+
+
+def replay(tg: FakeTelegram, schedule):
+    start = time.monotonic()
+    for at, uid, action in schedule:
+        delay = at - (time.monotonic() - start)
+        if delay > 0:
+            time.sleep(delay)
+        if action == "page" and tg.next_page(int(uid)):
+            continue
+        tg.push_command(int(uid), "/stats" if action == "stats" else "/check")
+
+
+def wait_until(predicate, timeout: float, interval: float = 0.2) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+def all_answered(tg: FakeTelegram) -> bool:
+    """每个聊天在最后一次收到更新之后都有过响应"""
+    with tg.lock:
+        pending = bool(tg.updates)
+        last_delivered, last_response = {}, {}
+        for t, chat, _ in tg.delivered.values():
+            last_delivered[chat] = max(t, last_delivered.get(chat, t))
+        for t, chat, _ in tg.responses:
+            last_response[chat] = max(t, last_response.get(chat, t))
+    return not pending and all(last_response.get(c, -1) >= t for c, t in last_delivered.items())
+
+
+def print_report(r: dict):
+    print("\n==== Bot 处理器压测 ====")
+    print(f"更新 {r['updates']} 条，未响应 {r['unanswered']} 条，耗时 {r['duration_s']}s")
+    for kind, h in sorted(r["handlers"].items()):
+        print(f"[{kind}] {h['count']} 次 首次响应 p50 {h['first_p50_ms']}ms / p95 {h['first_p95_ms']}ms，"
+              f"完成 p50 {h['done_p50_ms']}ms / p95 {h['done_p95_ms']}ms / max {h['done_max_ms']}ms")
+    print(f"发送消息 {r['messages_sent']} 条，平均 {r['send_rate_avg']} 条/秒，峰值 {r['send_rate_peak']} 条/秒，"
+          f"被限流 {r['flood_rejected']} 次")
+    if r["webhook_ack_max_ms"]:
+        print(f"Webhook 推送往返 p99 {r['webhook_ack_p99_ms']}ms / max {r['webhook_ack_max_ms']}ms，"
+              f"失败 {r['webhook_errors']} 次")
+    else:
+        print(f"getUpdates 间隔 p99 {r['poll_gap_p99_ms']}ms / max {r['poll_gap_max_ms']}ms")
+    print(f"接口调用: {r['calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot 处理器压测")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--per-user", type=int, default=2, help="每个用户绑定的账号数")
+    parser.add_argument("--actions", type=int, default=2, help="每个用户发送的动作数")
+    parser.add_argument("--rate", type=float, default=20, help="平均每秒产生的更新数")
+    parser.add_argument("--mix", default="check:5,stats:3,page:2", help="动作权重")
+    parser.add_argument("--drain", type=float, default=120, help="回放结束后最多等待多少秒让 bot 处理完")
+    parser.add_argument("--flood-control", action="store_true", help="模拟 Telegram 限流")
+    parser.add_argument("--webhook", action="store_true", help="以 webhook 模式运行 bot.py")
+    parser.add_argument("--max-poll-gap-ms", type=float, default=0, help="getUpdates 间隔上限，超过则失败")
+    parser.add_argument("--max-first-p95-ms", type=float, default=0, help="首次响应 p95 上限，超过则失败")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--solve-ms", type=float, default=0)
+    parser.add_argument("--expired-rate", type=float, default=0.0)
+    parser.add_argument("--site-rate", type=float, default=1000)
+    parser.add_argument("--log-level", default="warn")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args()
+    args.accounts = args.users * args.per_user
+
+    site_port, tg_port, hook_port = free_port(), free_port(), free_port()
+    site_base = f"http://127.0.0.1:{site_port}"
+    sites = start_fake_servers(args, site_port)
+    tg = FakeTelegram(flood_control=args.flood_control)
+    tg_server = serve(tg, tg_port)
+    workdir = prepare_workdir()
+    configure_env(args, site_base)
+
+    data = build_fleet(args)
+    uids = list(data["users"])
+    admin_uid = uids[0]
+    with open(os.path.join(workdir, "data.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+    env = dict(os.environ,
+               TG_BOT_TOKEN="123456:bench",
+               ADMIN_IDS=admin_uid,
+               TG_API_BASE_URL=f"http://127.0.0.1:{tg_port}",
+               PYTHONUNBUFFERED="1")
+    if args.webhook:
+        env.update(BOT_MODE="webhook",
+                   WEBHOOK_URL=f"http://127.0.0.1:{hook_port}/telegram",
+                   WEBHOOK_PORT=str(hook_port),
+                   WEBHOOK_SECRET="bench-secret")
+    ready_call = "setWebhook" if args.webhook else "getUpdates"
+    bot_log = open(os.path.join(workdir, "bot.log"), "w")
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=workdir, env=env,
+                           stdout=bot_log, stderr=subprocess.STDOUT)
+    failed = False
+    try:
+        if not wait_until(lambda: tg.calls.get(ready_call) or bot.poll() is not None, 60) or bot.poll() is not None:
+            print(f"bot.py 未能启动，日志见 {workdir}/bot.log")
+            args.keep = True
+            sys.exit(1)
+
+        schedule = build_schedule(args, uids, admin_uid)
+        print(f"工作目录 {workdir}，用户 {len(uids)}，账号 {args.accounts}，回放 {len(schedule)} 个动作")
+        start = time.monotonic()
+        replay(tg, schedule)
+        wait_until(lambda: all_answered(tg), args.drain, interval=1)
+        duration = time.monotonic() - start
+
+        result = tg.report(duration)
+        result["duration_s"] = round(duration, 1)
+        print_report(result)
+
+        first_p95 = max((h["first_p95_ms"] for h in result["handlers"].values()), default=0)
+        block_ms = result["webhook_ack_max_ms"] if args.webhook else result["poll_gap_max_ms"]
+        if args.max_poll_gap_ms and block_ms > args.max_poll_gap_ms:
+            print(f"❌ 更新接收最大延迟 {block_ms}ms 超过 {args.max_poll_gap_ms}ms，事件循环可能被阻塞")
+            failed = True
+        if args.max_first_p95_ms and first_p95 > args.max_first_p95_ms:
+            print(f"❌ 首次响应 p95 {first_p95}ms 超过 {args.max_first_p95_ms}ms")
+            failed = True
+
+        if args.json:
+            path = args.json if os.path.isabs(args.json) else os.path.join(ROOT, args.json)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "result": result}, f, indent=2, ensure_ascii=False)
+    finally:
+        if bot.poll() is None:
+            bot.send_signal(signal.SIGINT)
+            try:
+                bot.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+        bot_log.close()
+        tg_server.shutdown()
+        sites.terminate()
+        sites.wait()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
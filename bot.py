@@ -1,16 +1,23 @@
 # bot_dual.py - 支持双网站的签到机器人
 import os
 import json
+import fcntl
+import secrets
 import logging
 import random
 import asyncio
 import telegram
+import hashlib
 import tempfile
 import shutil
 import subprocess
-from datetime import datetime, time
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager, AsyncExitStack
+from time import perf_counter
+from datetime import datetime, time, timezone
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from telegram import (
     Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
 )
@@ -18,12 +25,40 @@ from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     ContextTypes, CallbackContext
 )
-from nodeseek_login_dual import login_and_get_cookie
+from nodeseek_login_dual import login_with_reason
+from circuit_breaker import get_breaker, OPEN
+from tg_outbox import Outbox
+from auto_delete import DeleteScheduler
+from ttl_cache import TTLCache
+from loop_watchdog import LoopWatchdog
+from update_processor import PerUserUpdateProcessor
+from shard import router as shard_router
+from job_store import JobStore, plan_dates
+from sign_ledger import SignLedger
+from quarantine import Quarantine
+from priority_lanes import PriorityGate, use_lane, SCHEDULED, BACKGROUND
+from retry_policy import LOGIN_REASON_CLASS, use_budget, with_retry
+from site_limiter import current_rates
+from circuit_breaker import breaker_states
+import metrics
+import tracing
+from tracing import traced
+from metrics import (
+    SIGN_RESULTS, COOKIE_REFRESHES, SUBPROCESS_SECONDS, JOB_LAG_SECONDS, STORE_SECONDS,
+)
 
 # ========== 配置 ==========
 load_dotenv()
 TOKEN = os.getenv("TG_BOT_TOKEN")
 ADMIN_IDS = [int(s.strip()) for s in os.getenv("ADMIN_IDS", "").split(",") if s.strip()]
+TG_API_BASE_URL = os.getenv("TG_API_BASE_URL")  # 可选：指向自建或压测用的 Bot API，如 http://127.0.0.1:8081
+
+# 运行模式：polling（默认）或 webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")                       # Telegram 推送的公网地址
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
 
 DATA_FILE = "data.json"
 
@@ -74,20 +109,23 @@ def ensure_user_structure(data, uid):
 
     return u
 
+@traced("save_data")
 def save_data(data):
     """安全保存 JSON 数据"""
-    with tempfile.NamedTemporaryFile("w", delete=False, encoding="utf-8") as tf:
-        json.dump(data, tf, indent=2, ensure_ascii=False)
-        tempname = tf.name
-    shutil.move(tempname, DATA_FILE)
+    with STORE_SECONDS.time(op="write"):
+        with tempfile.NamedTemporaryFile("w", delete=False, encoding="utf-8") as tf:
+            json.dump(data, tf, indent=2, ensure_ascii=False)
+            tempname = tf.name
+        shutil.move(tempname, DATA_FILE)
 
+@traced("load_data")
 def load_data():
     """加载数据并自动修复缺失字段"""
     if not os.path.exists(DATA_FILE):
         return {"users": {}}
 
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
+        with STORE_SECONDS.time(op="read"), open(DATA_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
     except json.JSONDecodeError:
         print("⚠️ data.json 损坏，已重置为空")
@@ -133,30 +171,25 @@ def has_any_accounts(user_data: dict) -> bool:
     accounts = user_data.get("accounts", {})
     return bool(accounts.get("ns", {}) or accounts.get("df", {}))
 
-async def notify_admins(app, message: str):
-    for admin_id in ADMIN_IDS:
-        try:
-            await app.bot.send_message(admin_id, message)
-        except:
-            pass
+def get_outbox(app) -> Outbox:
+    """所有主动推送统一走出站队列，受 Telegram 全局/单聊天限速保护"""
+    if "outbox" not in app.bot_data:
+        app.bot_data["outbox"] = Outbox(app.bot)
+    return app.bot_data["outbox"]
+
+async def notify_admins(app, message: str, **kwargs):
+    return await get_outbox(app).broadcast([(admin_id, message, kwargs) for admin_id in ADMIN_IDS])
 
+# 所有临时消息由同一个调度器定时删除，待删除记录落盘，重启后继续
+delete_scheduler = DeleteScheduler("./data/pending_deletes.json")
+loop_watchdog = LoopWatchdog()
+
+@traced("tg_send")
 async def send_and_auto_delete(chat, text: str, delay: int, user_msg=None):
     sent = await chat.send_message(text)
-    
-    async def _delete_later():
-        await asyncio.sleep(delay)
-        try:
-            await sent.delete()
-        except Exception as e:
-            print(f"Failed to delete bot message {sent.message_id}: {e}")
-        
-        if user_msg:
-            try:
-                await user_msg.delete()
-            except Exception as e:
-                print(f"Failed to delete user message {user_msg.message_id}: {e}")
-
-    asyncio.create_task(_delete_later())
+    delete_scheduler.schedule(sent.chat_id, sent.message_id, delay)
+    if user_msg:
+        delete_scheduler.schedule(user_msg.chat_id, user_msg.message_id, delay)
     return sent
 
 # ========== 命令保护：检查是否有账号 ==========
@@ -194,19 +227,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /stats - 签到统计
 /settime - 自动签到时间（范围 0–10 点）
 /txt  - 管理员喊话
+/perf - 耗时分析
 ------- 【说 明】 --------
 🔵 NodeSeek (ns) | 🟢 DeepFlood (df)
 默认每天0-0时5分随机时间签到
 
 add 格式: /add ns 账号@密码 或 /add df 账号@密码
 del 格式: /del ns 账号 或 /del df 账号 或 /del TGID
-check 格式: /check 或 /check ns 或 /check df
+check 格式: /check 或 /check ns 或 /check df（加 force 忽略今日已签到记录）
 mode 格式: /mode ns true 或 /mode df false
 list 格式: /list 或 /list ns 或 /list df
 log 格式: /log ns 7 账号 或 /log df 30
 stats 格式: /stats ns 30 或 /stats df 7
 settime 格式: /settime 7:00
 txt 格式: /txt 内容 或 /txt TGID,内容
+perf 格式: /perf 或 /perf 50 或 /perf 50 export
 -------------------------"""
     else:
         text = """欢迎使用双网站签到机器人！
@@ -226,7 +261,7 @@ txt 格式: /txt 内容 或 /txt TGID,内容
 
 add 格式: /add ns 账号@密码 或 /add df 账号@密码
 del 格式: /del ns 账号 或 /del df 账号 或 /del -all
-check 格式: /check 或 /check ns 或 /check df
+check 格式: /check 或 /check ns 或 /check df（加 force 忽略今日已签到记录）
 mode 格式: /mode ns true 或 /mode df false
 list 格式: /list 或 /list ns 或 /list df
 log 格式: /log ns 7 账号 或 /log df 30
@@ -281,8 +316,20 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"➡️ 正在为 {site_info['emoji']} {site_info['name']} 账号 {account_name} 登录..."
     )
 
+    breaker = get_breaker(site_type)
+    if not breaker.allow():
+        await temp_msg.delete()
+        await send_and_auto_delete(
+            update.message.chat,
+            f"⏸️ {site_info['name']} 站点暂时异常，请稍后再添加",
+            5,
+            user_msg=update.message
+        )
+        return
+
     # 调用登录逻辑
-    new_cookie = login_and_get_cookie(account_name, password, site_type)
+    new_cookie, reason = await login_account(user_id, account_name, password, site_type)
+    record_breaker(site_type, classify_login_reason(reason))
     if not new_cookie:
         await temp_msg.delete()
         await send_and_auto_delete(
@@ -310,10 +357,16 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
 
     save_data(data)
+    # 其他用户也绑定了该账号时，一并换成新 Cookie；重新绑定成功即解除暂停
+    share_cookie(site_type, account_name, new_cookie)
+    credential_quarantine.record_success(site_type, account_name)
 
-    # 如果是首次添加账号 → 刷新菜单
+    # 如果是首次添加账号 → 刷新该用户菜单，并排入定时签到队列
     if is_first_account:
-        await post_init(context.application)
+        await sync_user_menu(context.application, user_id)
+        await asyncio.to_thread(
+            sign_store.plan, {user_id: (user_data["sign_hour"], user_data["sign_minute"])}
+        )
 
     # 创建用户日志文件
     log_file = f"./data/{user_id}.json"
@@ -333,11 +386,10 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # 通知管理员
-    for admin_id in ADMIN_IDS:
-        await context.bot.send_message(
-            chat_id=admin_id,
-            text=f"✅ 用户 {tg_username or user_id} 添加 {site_info['emoji']} {site_info['name']} 账号 {account_name}"
-        )
+    await notify_admins(
+        context.application,
+        f"✅ 用户 {tg_username or user_id} 添加 {site_info['emoji']} {site_info['name']} 账号 {account_name}"
+    )
 
 # ========== /del ==========
 async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -374,7 +426,7 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 if os.path.exists(log_file):
                     os.remove(log_file)
 
-                await post_init(context.application)
+                await sync_user_menu(context.application, arg)
                 return await send_and_auto_delete(
                     update.message.chat, 
                     f"✅ 已删除用户 {arg} 的所有账号", 
@@ -404,9 +456,9 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         log_file = f"./data/{uid}.json"
                         if os.path.exists(log_file):
                             os.remove(log_file)
-                        await post_init(context.application)
                     
                     save_data(data)
+                    await sync_user_menu(context.application, uid)
                     found = True
                     
                     site_info = get_site_info(site_type)
@@ -455,7 +507,7 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if os.path.exists(log_file):
                 os.remove(log_file)
 
-            await post_init(context.application)
+            await sync_user_menu(context.application, user_id)
             await notify_admins(
                 context.application, 
                 f"用户 {tgUsername} 删除了所有账号: {', '.join(deleted_accounts)}"
@@ -492,9 +544,9 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 log_file = f"./data/{user_id}.json"
                 if os.path.exists(log_file):
                     os.remove(log_file)
-                await post_init(context.application)
             
             save_data(data)
+            await sync_user_menu(context.application, user_id)
             
             site_info = get_site_info(site_type)
             await notify_admins(
@@ -613,47 +665,301 @@ def now_str():
     return datetime.now(beijing).strftime("%Y-%m-%d %H:%M:%S")
 
 # ========== 写入日志函数 ==========
+@traced("append_user_log")
 def append_user_log(tgid: str, log_entry: dict):
-    """在 data/<TGID>.json 里追加日志，只记录含"收益"的日志"""
-    if "收益" not in str(log_entry.get("result", "")):
+    """在 data/<TGID>.json 里追加日志，只记录含"收益"的日志；标记 no_log 的结果（如共享的重复签到）不记录"""
+    if log_entry.get("no_log") or "收益" not in str(log_entry.get("result", "")):
         return
 
     path = f"./data/{tgid}.json"
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            user_data = json.load(f)
+    with STORE_SECONDS.time(op="user_log"):
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                user_data = json.load(f)
+        else:
+            user_data = {"logs": []}
+
+        user_data.setdefault("logs", [])
+        user_data["logs"].append(log_entry)
+        user_data["logs"] = user_data["logs"][-30:]  # 只保留最近 30 条
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(user_data, f, indent=2, ensure_ascii=False)
+
+# ========== Node 脚本 ==========
+NODE_CONCURRENCY = int(os.getenv("NODE_CONCURRENCY", str(os.cpu_count() or 4)))  # 同时运行的 Node 进程数
+# 名额按通道分配：手动操作优先，定时签到和后台任务按权重分享剩余名额
+node_gate = PriorityGate(NODE_CONCURRENCY)
+# 同一站点同时运行的 Node 进程数，默认 1：多个名额只用于不同站点并行，单站点的请求量不随 NODE_CONCURRENCY 放大
+NODE_SITE_CONCURRENCY = int(os.getenv("NODE_SITE_CONCURRENCY", "1"))
+# 名额按执行位置分别计算：None 为本机，分片时每个工作进程各有一份；全局请求速率由共享的站点限速器约束
+node_gates = {None: node_gate}   # 执行位置 -> PriorityGate
+site_gates = {}                  # (执行位置, site_type) -> PriorityGate
+
+@asynccontextmanager
+async def node_slots(payload: dict, host: str = None):
+    """在 host 上先按固定顺序占用涉及站点的名额（避免互相等待），再占用该位置的总名额"""
+    sites = sorted({site for sites in payload.get("targets", {}).values() for site, accs in sites.items() if accs})
+    async with AsyncExitStack() as stack:
+        for site_type in sites:
+            gate = site_gates.setdefault((host, site_type), PriorityGate(NODE_SITE_CONCURRENCY))
+            await stack.enter_async_context(gate.slot())
+        gate = node_gates.setdefault(host, PriorityGate(NODE_CONCURRENCY))
+        await stack.enter_async_context(gate.slot())
+        yield
+
+def lane_stats() -> dict:
+    """各执行位置的通道排队数和已执行数之和"""
+    total = {}
+    for gate in list(node_gates.values()):
+        for lane, st in gate.stats().items():
+            agg = total.setdefault(lane, {"queued": 0, "served": 0})
+            agg["queued"] += st["queued"]
+            agg["served"] += st["served"]
+    return total
+
+async def run_node(script: str, payload: dict, timeout: int):
+    """配置了分片工作进程时按 uid 分发，每一份在执行它的工作进程的名额内运行；否则占用本机名额后在本机运行"""
+    if shard_router.active:
+        return await shard_router.run_node(script, payload, timeout, run_node_local, node_slots)
+    async with node_slots(payload):
+        return await run_node_local(script, payload, timeout)
+
+async def run_node_local(script: str, payload: dict, timeout: int):
+    """异步运行 Node 脚本并记录耗时，不阻塞事件循环；超时杀掉进程并抛出 TimeoutExpired"""
+    args = ["node", script, json.dumps(payload, ensure_ascii=False)]
+    start = perf_counter()
+    status = "timeout"
+    try:
+        with tracing.span(f"node {script}"):
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise subprocess.TimeoutExpired(args, timeout)
+        status = "ok" if proc.returncode == 0 else "error"
+        return subprocess.CompletedProcess(
+            args, proc.returncode, stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace")
+        )
+    finally:
+        SUBPROCESS_SECONDS.observe(perf_counter() - start, script=script, status=status)
+
+# ========== 站点熔断 ==========
+# 熔断器状态只保存在内存中，重启后各站点从关闭状态重新统计；暂缓的签到写入文件，重启后继续补签
+DEFERRED_RESULT = "⏸️ 站点异常，已暂缓签到"
+DEFERRED_FILE = "./data/deferred_signs.json"
+
+def load_deferred() -> dict:
+    """只恢复当天（北京时间）暂缓的签到，更早的已由之后的定时签到覆盖"""
+    try:
+        with open(DEFERRED_FILE, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    today = datetime.now(beijing).strftime("%Y-%m-%d")
+    return {
+        (e["uid"], e["site_type"], e["acc_name"]): {"mode": e["mode"], "source": e["source"], "date": e["date"]}
+        for e in entries if e.get("date") == today
+    }
+
+def save_deferred():
+    entries = [
+        {"uid": uid, "site_type": site_type, "acc_name": acc_name, **info}
+        for (uid, site_type, acc_name), info in deferred_signs.items()
+    ]
+    os.makedirs(os.path.dirname(DEFERRED_FILE), exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(DEFERRED_FILE), encoding="utf-8") as tf:
+        json.dump(entries, tf, ensure_ascii=False, indent=2)
+        tempname = tf.name
+    os.replace(tempname, DEFERRED_FILE)
+
+# (uid, site_type, acc_name) -> {"mode": 签到模式, "source": 来源, "date": 暂缓日期}，熔断恢复后自动重新签到
+deferred_signs = load_deferred()
+
+def classify_sign_result(result: str):
+    """签到结果对站点健康的意义：True 正常 / False 站点异常 / None 与站点无关（如 Cookie 失效）"""
+    if result.startswith(("✅", "☑️")):
+        return True
+    if result.startswith(("🚫 风控拦截", "🚫 请求异常", "🚫 签到异常")):
+        return False
+    return None
+
+def classify_stats_result(result: str):
+    if result.startswith(("✅", "⚠️ 近")):
+        return True
+    if result.startswith(("🚫 风控拦截", "🚫 查询异常")):
+        return False
+    return None
+
+def classify_login_reason(reason: str):
+    """账号密码错误属于账号问题，不计入站点健康"""
+    if reason == "ok":
+        return True
+    if reason in ("rejected", "unsupported"):
+        return None
+    return False
+
+def result_class(result: str) -> str:
+    """签到结果归类，用于指标统计"""
+    if result.startswith("✅"):
+        return "ok"
+    if result.startswith("☑️"):
+        return "already"
+    if result.startswith("⏸️"):
+        return "deferred"
+    if result.startswith("🔒"):
+        return "quarantined"
+    if result.startswith("🚫 风控拦截"):
+        return "throttled"
+    if result.startswith(("🚫 请求异常", "🚫 签到异常")):
+        return "error"
+    if "Cookie" in result or "响应解析失败" in result or "USER NOT FOUND" in result:
+        return "cookie"
+    return "failed"
+
+def record_breaker(site_type: str, outcome):
+    breaker = get_breaker(site_type)
+    if outcome is None:
+        breaker.release()
     else:
-        user_data = {"logs": []}
+        breaker.record(outcome)
 
-    user_data.setdefault("logs", [])
-    user_data["logs"].append(log_entry)
-    user_data["logs"] = user_data["logs"][-30:]  # 只保留最近 30 条
+def defer_sign(uid, site_type, acc_name, mode, source):
+    deferred_signs[(uid, site_type, acc_name)] = {
+        "mode": mode, "source": source, "date": datetime.now(beijing).strftime("%Y-%m-%d"),
+    }
+    # 由 sign_targets 在批次结束时统一落盘，站点故障时整批暂缓也只写一次文件
+    return {
+        "name": acc_name,
+        "result": DEFERRED_RESULT,
+        "site_type": site_type,
+        "deferred": True,
+        "no_log": True,
+    }
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(user_data, f, indent=2, ensure_ascii=False)
+def breaker_filter_targets(targets):
+    """查询类请求：熔断中的站点直接失败返回，返回 (可请求的目标, 被拦下的结果)"""
+    allowed, skipped = {}, {}
+    for uid, sites in targets.items():
+        allowed[uid] = {}
+        for site_type, accounts in sites.items():
+            if get_breaker(site_type).allow():
+                allowed[uid][site_type] = accounts
+            else:
+                skipped.setdefault(uid, {})[site_type] = [
+                    {"name": name, "result": "⏸️ 站点暂时异常，请稍后再查询", "site_type": site_type}
+                    for name in accounts
+                ]
+    return allowed, skipped
+
+async def login_account(uid, username, password, site_type):
+    """自动登录：分片模式下交给该用户所属的工作进程，否则在线程中执行，不阻塞其他用户。
+    验证码失败（含站点报 token 无效）时重新打码登录；网络异常、5xx 只在登录流程内重发失败的那一步。都计入当前批次的重试预算"""
+    async def attempt():
+        if shard_router.active:
+            return await shard_router.login(uid, username, password, site_type, login_with_reason)
+        return await asyncio.to_thread(login_with_reason, username, password, site_type)
+
+    return await with_retry(attempt, lambda r: LOGIN_REASON_CLASS.get(r[1]))
+
+async def run_stats_script(targets, days):
+    """调用 stats_dual.js；熔断中的站点不请求，直接返回失败结果。返回 (结果, 错误信息)"""
+    allowed, skipped = breaker_filter_targets(targets)
+    results = {}
+
+    if any(allowed.values()):
+        payload = {"targets": allowed, "days": days}
+        proc = await run_node("stats_dual.js", payload, timeout=60)
+        if proc.returncode != 0:
+            return None, proc.stderr
+
+        results = json.loads(proc.stdout)
+        for sites in results.values():
+            for site_type, results_list in sites.items():
+                for r in results_list:
+                    record_breaker(site_type, classify_stats_result(r.get("result", "")))
+
+    for uid, sites in skipped.items():
+        for site_type, results_list in sites.items():
+            results.setdefault(uid, {})[site_type] = results_list
+
+    return results, None
+
+# ========== 账号隔离 ==========
+# 密码错误、被封禁等账号本身的问题：连续失败后按指数退避暂停自动登录，只通知一次
+credential_quarantine = Quarantine()
+
+def quarantine_result(res, entry):
+    until = datetime.fromtimestamp(entry["until"], beijing).strftime("%m-%d %H:%M")
+    return {**res, "result": f"🔒 登录多次失败，暂停自动登录至 {until}", "no_log": True, "quarantined": True}
+
+async def quarantine_notify_job(context: CallbackContext):
+    """新进入暂停的账号：每个绑定者和管理员各收到一条汇总，而不是每天一条失败"""
+    fresh = credential_quarantine.take_unnotified()
+    if not fresh:
+        return
+
+    data = load_data()
+    per_user, admin_lines = {}, []
+    for key, entry in fresh.items():
+        site_type, acc_name = key.split(":", 1)
+        site_info = get_site_info(site_type)
+        until = datetime.fromtimestamp(entry["until"], beijing).strftime("%m-%d %H:%M")
+        line = f"{site_info['emoji']} {site_info['name']} {acc_name}：{entry['reason']}，连续 {entry['failures']} 次，暂停至 {until}"
+        owners = account_bindings(data, site_type, acc_name)
+        for uid in owners:
+            per_user.setdefault(uid, []).append(line.replace(acc_name, mask_username(acc_name), 1))
+        admin_lines.append(f"{line}（TGID: {', '.join(owners) or '无'}）")
+
+    outbox = get_outbox(context.application)
+    for uid, lines in per_user.items():
+        await outbox.send(uid, "🔒 以下账号登录多次失败，已暂停自动登录：\n" + "\n".join(lines)
+                          + "\n\n请确认账号密码后用 /add 重新绑定，成功后自动解除。")
+    await notify_admins(context.application, "🔒 暂停自动登录的账号：\n" + "\n".join(admin_lines))
 
 # ========== 签到相关函数 ==========
-async def retry_sign_if_invalid(uid, acc_name, site_type, res, data, mode):
+@traced("retry_sign_if_invalid")
+async def retry_sign_if_invalid(uid, acc_name, site_type, res, data, mode, source="manual"):
     """Cookie 失效时自动刷新重试"""
     if "🚫 响应解析失败" not in res["result"] and "USER NOT FOUND" not in res["result"]:
         return res
 
+    # 先看账号是否暂停：暂停的账号不发请求，不能占用半开状态唯一的探测名额
+    held = credential_quarantine.blocked(site_type, acc_name)
+    if held:
+        logging.info("[%s] %s %s 处于暂停期，跳过自动登录", uid, site_type, acc_name)
+        return quarantine_result(res, held)
+
+    # 站点熔断中，重新登录只会白白消耗验证码额度
+    breaker = get_breaker(site_type)
+    if not breaker.allow():
+        logging.warning("[%s] %s %s 站点熔断中，暂缓刷新 cookie", uid, site_type, acc_name)
+        return defer_sign(uid, site_type, acc_name, mode, source)
+
     logging.warning("[%s] %s %s cookie 失效，尝试自动刷新...", uid, site_type, acc_name)
 
     account = data["users"][uid]["accounts"][site_type][acc_name]
     username, password = account["username"], account["password"]
 
     # 调用自动登录获取新 cookie
-    new_cookie = login_and_get_cookie(username, password, site_type)
+    new_cookie, reason = await login_account(uid, username, password, site_type)
+    record_breaker(site_type, classify_login_reason(reason))
+    COOKIE_REFRESHES.inc(site=site_type, reason=reason)
     if not new_cookie:
         logging.error("[%s] %s %s cookie 刷新失败", uid, site_type, acc_name)
+        if reason == "rejected":
+            credential_quarantine.record_failure(site_type, acc_name, "站点拒绝登录")
         return {**res, "result": "🚫 Cookie 刷新失败", "no_log": True}
 
-    # 保存新 cookie
+    # 保存新 cookie：写入该账号的所有绑定
     account["cookie"] = new_cookie
-    save_data(data)
+    share_cookie(site_type, acc_name, new_cookie)
 
     # 再次签到
     payload = {
@@ -662,12 +968,7 @@ async def retry_sign_if_invalid(uid, acc_name, site_type, res, data, mode):
     }
 
     try:
-        proc = subprocess.run(
-            ["node", "sign_dual.js", json.dumps(payload, ensure_ascii=False)],
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
+        proc = await run_node("sign_dual.js", payload, timeout=60)
         if proc.returncode != 0:
             logging.error("sign_dual.js 重试执行失败: %s", proc.stderr.strip())
             return {**res, "result": "🚫 Cookie 刷新后签到失败", "no_log": True}
@@ -675,42 +976,180 @@ async def retry_sign_if_invalid(uid, acc_name, site_type, res, data, mode):
         retry_results = json.loads(proc.stdout)
         retry_res = retry_results.get(uid, {}).get(site_type, [{}])[0]
         retry_res["cookie_refreshed"] = True
+        retry_result = retry_res.get("result", "")
+        record_breaker(site_type, classify_sign_result(retry_result))
+        if "🚫 响应解析失败" in retry_result or "USER NOT FOUND" in retry_result:
+            # 登录成功但新 Cookie 仍然无效，多半是账号被封禁
+            credential_quarantine.record_failure(site_type, acc_name, "登录后仍无法签到")
+        elif retry_result.startswith(("✅", "☑️")):
+            credential_quarantine.record_success(site_type, acc_name)
         return retry_res
 
     except Exception as e:
         logging.error("sign_dual.js 重试调用异常: %s", e)
         return {**res, "result": "🚫 Cookie 刷新后签到异常", "no_log": True}
 
-async def run_sign_and_fix(targets, user_modes, data):
-    """执行签到并处理 Cookie 刷新"""
+# ========== 账号注册表 ==========
+# 同一站点账号可能被多个 TG 用户绑定：以（站点, 账号）为唯一账号，网络请求只做一次，结果分发给所有绑定者，Cookie 共用
+
+def account_bindings(data, site_type: str, acc_name: str) -> list:
+    """返回绑定了该账号的 uid 列表"""
+    return [
+        uid for uid, u in data.get("users", {}).items()
+        if acc_name in u.get("accounts", {}).get(site_type, {})
+    ]
+
+def share_cookie(site_type: str, acc_name: str, cookie: str) -> list:
+    """把新 Cookie 写入该账号的所有绑定（重新读取最新数据，避免覆盖其他修改），返回更新了的 uid"""
+    data = load_data()
+    uids = account_bindings(data, site_type, acc_name)
+    for uid in uids:
+        data["users"][uid]["accounts"][site_type][acc_name]["cookie"] = cookie
+    if uids:
+        save_data(data)
+    return uids
+
+# ========== 今日已签到 ==========
+sign_ledger = SignLedger()
+
+def ledger_filter(targets):
+    """今天已签到的账号直接返回记录的结果，返回 (仍需签到的目标, 缓存结果)"""
+    remaining, cached = {}, {}
+    for uid, sites in targets.items():
+        for site_type, accounts in sites.items():
+            for name, acc in accounts.items():
+                entry = sign_ledger.get(site_type, name)
+                if entry is None:
+                    remaining.setdefault(uid, {}).setdefault(site_type, {})[name] = acc
+                    continue
+                # 同一账号被其他用户先签过时，本用户当天的第一次结果仍然记日志
+                cached.setdefault(uid, {}).setdefault(site_type, []).append({
+                    "name": name,
+                    "result": f"{entry['result']}（今日 {entry['time']} 已签）",
+                    "site_type": site_type,
+                    "cached": True,
+                    "no_log": not sign_ledger.claim_log(site_type, name, uid),
+                })
+    return remaining, cached
+
+# ========== 签到去重 ==========
+# (站点, 账号) -> (发起签到的 uid, Future)：同一账号正在签到时，后来的请求等待并共享结果
+inflight_signs = {}
+
+def sign_key(site_type: str, acc_name: str) -> tuple:
+    return (site_type, acc_name.strip())
+
+def claim_signs(targets):
+    """把目标分成需要自己签到的和已在签到中的，返回 (自己签到的目标, {(uid, 站点, 账号): Future})"""
+    own, shared = {}, {}
+    for uid, sites in targets.items():
+        for site_type, accounts in sites.items():
+            for name, acc in accounts.items():
+                key = sign_key(site_type, name)
+                if key in inflight_signs:
+                    shared[(uid, site_type, name)] = inflight_signs[key][1]
+                    continue
+                inflight_signs[key] = (uid, asyncio.get_running_loop().create_future())
+                own.setdefault(uid, {}).setdefault(site_type, {})[name] = acc
+    return own, shared
+
+def settle_sign(site_type: str, acc_name: str, res):
+    entry = inflight_signs.pop(sign_key(site_type, acc_name), None)
+    if entry and not entry[1].done():
+        entry[1].set_result((entry[0], res))
+
+async def shared_sign_result(uid, site_type, acc_name, fut):
+    """等待同一账号正在进行的签到；同一用户的结果已由发起方记录日志，其他用户当天只在第一次拿到结果时记录"""
+    leader_uid, res = await asyncio.shield(fut)
+    if res is None:
+        return {"name": acc_name, "result": "🚫 签到异常", "site_type": site_type, "no_log": True, "shared": True}
+    shared = {**res, "name": acc_name, "shared": True}
+    if leader_uid == uid:
+        shared["no_log"] = True
+    else:
+        shared["no_log"] = not sign_ledger.claim_log(site_type, acc_name, uid)
+    return shared
+
+@traced("run_sign_and_fix")
+async def run_sign_and_fix(targets, user_modes, data, source="manual", force=False):
+    """执行签到并处理 Cookie 刷新；今天已签到的账号直接返回记录（force 时照常请求），同一账号已在签到中时共享其结果"""
+    cached = {}
+    if not force:
+        targets, cached = ledger_filter(targets)
+    targets, shared = claim_signs(targets)
+    try:
+        # 本批次的登录重试共用一个预算，按账号数计算
+        with use_budget(sum(len(accounts) for sites in targets.values() for accounts in sites.values())):
+            results = await sign_targets(targets, user_modes, data, source)
+    finally:
+        # 异常或提前返回时也要唤醒等待方
+        for sites in targets.values():
+            for site_type, accounts in sites.items():
+                for name in accounts:
+                    settle_sign(site_type, name, None)
+        sign_ledger.flush()
+
+    for (uid, site_type, name), fut in shared.items():
+        res = await shared_sign_result(uid, site_type, name, fut)
+        results.setdefault(uid, {}).setdefault(site_type, []).append(res)
+    if shared:
+        sign_ledger.flush()
+
+    for uid, sites in cached.items():
+        for site_type, logs in sites.items():
+            results.setdefault(uid, {}).setdefault(site_type, []).extend(logs)
+
+    return results
+
+async def sign_targets(targets, user_modes, data, source):
     results = {}
 
+    # 熔断中的站点不发请求：半开时只放行探测账号，其余排队等待恢复
+    site_totals = {}
+    for sites in targets.values():
+        for site_type, accounts in sites.items():
+            site_totals[site_type] = site_totals.get(site_type, 0) + len(accounts)
+    permits = {site_type: get_breaker(site_type).acquire(n) for site_type, n in site_totals.items()}
+
     # 转换为 sign_dual.js 需要的格式
     targets_for_js = {}
+    deferred = {}
     for uid, sites in targets.items():
         targets_for_js[uid] = {}
         for site_type, accounts in sites.items():
-            targets_for_js[uid][site_type] = {
-                name: acc["cookie"] for name, acc in accounts.items()
-            }
+            mode = user_modes.get(uid, {}).get(site_type, False)
+            site_targets = {}
+            for name, acc in accounts.items():
+                if permits[site_type] > 0:
+                    permits[site_type] -= 1
+                    site_targets[name] = acc["cookie"]
+                else:
+                    deferred.setdefault(uid, {}).setdefault(site_type, []).append(
+                        defer_sign(uid, site_type, name, mode, source)
+                    )
+            if site_targets:
+                targets_for_js[uid][site_type] = site_targets
 
-    payload = {"targets": targets_for_js, "userModes": user_modes}
+    if any(targets_for_js.values()):
+        payload = {"targets": targets_for_js, "userModes": user_modes}
 
-    try:
-        proc = subprocess.run(
-            ["node", "sign_dual.js", json.dumps(payload, ensure_ascii=False)],
-            capture_output=True,
-            text=True,
-            timeout=120,
-        )
-        if proc.returncode != 0:
-            logging.error("sign_dual.js 执行失败: %s", proc.stderr.strip())
-            return {}
+        failed = False
+        try:
+            proc = await run_node("sign_dual.js", payload, timeout=120)
+            if proc.returncode != 0:
+                logging.error("sign_dual.js 执行失败: %s", proc.stderr.strip())
+                failed = True
+            else:
+                results = json.loads(proc.stdout)
+        except Exception as e:
+            logging.error("调用 sign_dual.js 异常: %s", e)
+            failed = True
 
-        results = json.loads(proc.stdout)
-    except Exception as e:
-        logging.error("调用 sign_dual.js 异常: %s", e)
-        return {}
+        if failed:
+            # 脚本整体失败：发出名额的熔断器记一次失败（半开时重新打开，不会卡在半开），暂缓的账号照常返回
+            results = {}
+            for site_type in {site_type for sites in targets_for_js.values() for site_type in sites}:
+                get_breaker(site_type).record(False)
 
     # 处理失败重试
     for uid, sites in results.items():
@@ -719,21 +1158,102 @@ async def run_sign_and_fix(targets, user_modes, data):
             for res in logs:
                 acc_name = res["name"]
                 mode = user_modes.get(uid, {}).get(site_type, False)
-                fixed_res = await retry_sign_if_invalid(uid, acc_name, site_type, res, data, mode)
+                if res.get("deferred"):
+                    # Node 端已中途熔断
+                    get_breaker(site_type).trip()
+                    fixed_res = defer_sign(uid, site_type, acc_name, mode, source)
+                else:
+                    record_breaker(site_type, classify_sign_result(res["result"]))
+                    fixed_res = await retry_sign_if_invalid(uid, acc_name, site_type, res, data, mode, source)
+                sign_ledger.record(site_type, acc_name, fixed_res.get("result", ""), uid)
+                settle_sign(site_type, acc_name, fixed_res)
                 fixed_logs.append(fixed_res)
             results[uid][site_type] = fixed_logs
 
+    for uid, sites in deferred.items():
+        for site_type, logs in sites.items():
+            for r in logs:
+                settle_sign(site_type, r["name"], r)
+            results.setdefault(uid, {}).setdefault(site_type, []).extend(logs)
+
+    if any(r.get("deferred") for sites in results.values() for logs in sites.values() for r in logs):
+        save_deferred()
+
+    for sites in results.values():
+        for site_type, logs in sites.items():
+            for r in logs:
+                SIGN_RESULTS.inc(site=site_type, result=result_class(r.get("result", "")))
+
     return results
 
+@tracing.root("deferred")
+async def retry_deferred_job(context: CallbackContext):
+    """熔断恢复（半开/关闭）后，重新执行被暂缓的签到并推送结果"""
+    if not deferred_signs:
+        return
+
+    app = context.application
+    data = load_data()
+    today = datetime.now(beijing).strftime("%Y-%m-%d")
+    groups = {}  # source -> (targets, user_modes)
+    changed = False
+    for key, info in list(deferred_signs.items()):
+        uid, site_type, acc_name = key
+        if info.get("date") == today and get_breaker(site_type).snapshot()["state"] == OPEN:
+            continue
+        del deferred_signs[key]
+        changed = True
+        if info.get("date") != today:
+            # 跨天仍未恢复：当天的签到已经错过，今天的由定时签到负责
+            continue
+        acc = data["users"].get(uid, {}).get("accounts", {}).get(site_type, {}).get(acc_name)
+        if not acc:
+            continue
+        targets, user_modes = groups.setdefault(info["source"], ({}, {}))
+        targets.setdefault(uid, {}).setdefault(site_type, {})[acc_name] = acc
+        user_modes.setdefault(uid, {})[site_type] = info["mode"]
+    if changed:
+        save_deferred()
+
+    for source, (targets, user_modes) in groups.items():
+        with use_lane(BACKGROUND):
+            results = await run_sign_and_fix(targets, user_modes, data, source=source)
+
+        for uid, sites in results.items():
+            text = ""
+            for site_type, logs in sites.items():
+                done = [r for r in logs if not r.get("deferred")]
+                if not done:
+                    continue
+                site_info = get_site_info(site_type)
+                text += f"\n{site_info['emoji']} {site_info['name']}【{mode_text(user_modes[uid].get(site_type, False))}】:\n"
+                for r in done:
+                    append_user_log(uid, {
+                        **r,
+                        "site_type": site_type,
+                        "source": source,
+                        "time": now_str(),
+                        "by": "system"
+                    })
+                    line = f"{mask_username(r['name'])} - {r['result']}"
+                    if r.get("cookie_refreshed"):
+                        line += " [♻️ Cookie]"
+                    text += line + "\n"
+
+            if text:
+                await get_outbox(app).send(uid, "📋 站点恢复，补签结果:\n" + text)
+
 # ========== /check ==========
+@tracing.root("check")
 async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     data = load_data()
     
-    # 解析参数
+    # 解析参数：force 跳过今日已签到记录，照常请求站点
     site_filter = None
     if context.args and context.args[0] in ["ns", "df"]:
         site_filter = context.args[0]
+    force = "force" in (context.args or [])
 
     targets, user_modes = {}, {}
 
@@ -792,7 +1312,7 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     waiting_msg = await update.message.chat.send_message("⏳ 签到中...")
 
-    results = await run_sign_and_fix(targets, user_modes, data)
+    results = await run_sign_and_fix(targets, user_modes, data, force=force)
 
     manual_by = "admin" if is_admin(user_id) else "user"
 
@@ -842,6 +1362,17 @@ async def check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         pass
 
+# ========== 收益账本 ==========
+def stale_note(r) -> str:
+    """账本同步失败时沿用本地记录，提示数据可能不是最新"""
+    if not r.get("stale"):
+        return ""
+    synced = r.get("synced_at")
+    if not synced:
+        return "   ⏳ 同步未完成，只统计了已拉取的记录，可能不全\n"
+    when = datetime.fromtimestamp(synced / 1000, beijing).strftime("%m-%d %H:%M")
+    return f"   ⏳ 同步失败，数据截至 {when}，可能不是最新\n"
+
 # ========== /log ==========
 @require_account
 async def log(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -900,24 +1431,18 @@ async def log(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_msg=update.message
         )
 
-    payload = {"targets": targets, "days": days}
     waiting_msg = await update.message.chat.send_message("⏳ 正在查询中，请稍候...")
 
     try:
-        res = subprocess.run(
-            ["node", "stats_dual.js", json.dumps(payload)],
-            capture_output=True, text=True, timeout=60
-        )
-        if res.returncode != 0:
+        results, err = await run_stats_script(targets, days)
+        if err is not None:
             await waiting_msg.delete()
             return await send_and_auto_delete(
                 update.message.chat, 
-                f"⚠️ stats_dual.js 执行失败: {res.stderr}", 
+                f"⚠️ stats_dual.js 执行失败: {err}", 
                 3, 
                 user_msg=update.message
             )
-
-        results = json.loads(res.stdout)
     except Exception as e:
         await waiting_msg.delete()
         return await send_and_auto_delete(
@@ -936,7 +1461,7 @@ async def log(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         for r in results_list:
             acc_name = mask_username(r["name"])
-            text += f"\n🔸 {acc_name} (签到收益)\n"
+            text += f"\n🔸 {acc_name} (签到收益)\n" + stale_note(r)
 
             if r.get("stats") and r["stats"]["days_count"] > 0:
                 records = r["stats"]["records"]
@@ -1002,24 +1527,18 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_msg=update.message
         )
 
-    payload = {"targets": targets, "days": days}
     waiting_msg = await update.message.chat.send_message("⏳ 正在查询中，请稍候...")
 
     try:
-        res = subprocess.run(
-            ["node", "stats_dual.js", json.dumps(payload)],
-            capture_output=True, text=True, timeout=60
-        )
-        if res.returncode != 0:
+        results, err = await run_stats_script(targets, days)
+        if err is not None:
             await waiting_msg.delete()
             return await send_and_auto_delete(
                 update.message.chat, 
-                f"⚠️ stats_dual.js 执行失败: {res.stderr}", 
+                f"⚠️ stats_dual.js 执行失败: {err}", 
                 3, 
                 user_msg=update.message
             )
-
-        results = json.loads(res.stdout)
     except Exception as e:
         await waiting_msg.delete()
         return await send_and_auto_delete(
@@ -1042,12 +1561,13 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 stats_data = r["stats"]
                 text += (
                     f"\n🔸 {acc_name}\n"
+                    + stale_note(r) +
                     f"   🗓️ 签到天数 : {stats_data['days_count']} 天\n"
                     f"   🍗 总收益   : {stats_data['total_amount']} 个\n"
                     f"   📈 日均收益 : {stats_data['average']} 个\n"
                 )
             else:
-                text += f"\n🔸 {acc_name}\n   ⚠️ {r['result']}\n"
+                text += f"\n🔸 {acc_name}\n{stale_note(r)}   ⚠️ {r['result']}\n"
 
     await waiting_msg.delete()
     await send_and_auto_delete(update.message.chat, text, 20, user_msg=update.message)
@@ -1114,182 +1634,194 @@ async def settime(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_msg=update.message
     )
 
-    # 重新注册用户的定时任务
-    app: Application = context.application
-    job_name = f"user_{user_id}_daily_check"
-
-    # 移除旧任务
-    old_jobs = app.job_queue.get_jobs_by_name(job_name)
-    for j in old_jobs:
-        j.schedule_removal()
-
-    # 添加新任务（北京时间）
-    app.job_queue.run_daily(
-        lambda ctx, uid=user_id: asyncio.create_task(user_daily_check(app, uid)),
-        time=time(hour=hour, minute=minute, tzinfo=beijing),
-        name=job_name
-    )
+    # 更新签到队列中尚未执行的任务（北京时间）
+    await asyncio.to_thread(sign_store.reschedule, user_id, hour, minute)
 
 # ========== 定时签到 ==========
-async def user_daily_check(app: Application, uid: str):
+async def user_daily_check(app: Application, uid: str) -> bool:
+    """执行一个用户的定时签到；没有账号签到成功且有账号因脚本或站点异常没签上时返回 False，由队列稍后重试"""
     uid = str(uid)
     data = load_data()
     u = data["users"].get(uid)
     if not u or not has_any_accounts(u):
-        return
+        return True
 
-    delay = random.randint(0, 5 * 60)
-    await asyncio.sleep(delay)
-
-    # 构建签到目标
-    targets = {uid: {}}
-    user_modes = {uid: {}}
+    # 随机延迟已计入队列中的计划时间
+    with tracing.trace("auto"):
+        # 构建签到目标
+        targets = {uid: {}}
+        user_modes = {uid: {}}
     
-    for site_type in ["ns", "df"]:
-        accounts = u.get("accounts", {}).get(site_type, {})
-        if accounts:
-            targets[uid][site_type] = accounts
-            user_modes[uid][site_type] = u.get("mode", {}).get(site_type, False)
+        for site_type in ["ns", "df"]:
+            # 暂停中的账号不参与自动签到，也不推送失败
+            accounts = {
+                name: acc for name, acc in u.get("accounts", {}).get(site_type, {}).items()
+                if not credential_quarantine.blocked(site_type, name)
+            }
+            if accounts:
+                targets[uid][site_type] = accounts
+                user_modes[uid][site_type] = u.get("mode", {}).get(site_type, False)
 
-    if not any(targets[uid].values()):
-        return
+        if not any(targets[uid].values()):
+            return True
 
-    # 执行签到
-    results = await run_sign_and_fix(targets, user_modes, data)
+        # 执行签到
+        results = await run_sign_and_fix(targets, user_modes, data, source="auto")
 
-    # 写入日志
-    for site_type, logs in results.get(uid, {}).items():
-        for r in logs:
-            append_user_log(uid, {
-                **r,
-                "site_type": site_type,
-                "source": "auto",
-                "time": now_str(),
-                "by": "system"
-            })
+        # 写入日志
+        for site_type, logs in results.get(uid, {}).items():
+            for r in logs:
+                append_user_log(uid, {
+                    **r,
+                    "site_type": site_type,
+                    "source": "auto",
+                    "time": now_str(),
+                    "by": "system"
+                })
 
-    # 推送结果给用户
-    text = "📋 自动签到结果:\n"
-    for site_type, logs in results.get(uid, {}).items():
-        site_info = get_site_info(site_type)
-        mode = user_modes[uid].get(site_type, False)
-        text += f"\n{site_info['emoji']} {site_info['name']}【{mode_text(mode)}】:\n"
+        # 推送结果给用户
+        text = "📋 自动签到结果:\n"
+        for site_type, logs in results.get(uid, {}).items():
+            site_info = get_site_info(site_type)
+            mode = user_modes[uid].get(site_type, False)
+            text += f"\n{site_info['emoji']} {site_info['name']}【{mode_text(mode)}】:\n"
         
-        for r in logs:
-            line = f"{mask_username(r['name'])} - {r['result']}"
-            if r.get("cookie_refreshed"):
-                line += " [♻️ Cookie]"
-            text += line + "\n"
+            for r in logs:
+                line = f"{mask_username(r['name'])} - {r['result']}"
+                if r.get("cookie_refreshed"):
+                    line += " [♻️ Cookie]"
+                text += line + "\n"
+
+        all_logs = [r for logs in results.get(uid, {}).values() for r in logs]
+        if all_logs:
+            await get_outbox(app).send(uid, text)
+
+        # 脚本整体失败时账号没有结果；风控、请求异常等记为站点异常。暂缓的账号由熔断恢复后的补签负责
+        signed = any(classify_sign_result(r.get("result", "")) for r in all_logs)
+        expected = sum(len(accounts) for accounts in targets[uid].values())
+        errored = len(all_logs) < expected or any(classify_sign_result(r.get("result", "")) is False for r in all_logs)
+        return signed or not errored
 
+# ========== 签到队列 ==========
+SIGN_QUEUE_POLL = int(os.getenv("SIGN_QUEUE_POLL", "15"))     # 检查到点任务的间隔（秒）
+SIGN_QUEUE_BATCH = int(os.getenv("SIGN_QUEUE_BATCH", "20"))   # 本进程同时执行的定时签到数
+
+sign_store = JobStore()
+sign_queue_state = {"planned": None}
+running_sign_jobs = set()
+
+def sign_schedule(users: dict) -> dict:
+    return {
+        uid: (u.get("sign_hour", 0), u.get("sign_minute", 0))
+        for uid, u in users.items() if has_any_accounts(u)
+    }
+
+async def run_sign_job(app: Application, job_id: str, uid: str, due_at: float):
+    lag = datetime.now(timezone.utc).timestamp() - due_at
+    if lag > 2 * SIGN_QUEUE_POLL:
+        logger.info(f"补签: {job_id}，比计划晚 {int(lag)} 秒")
     try:
-        await app.bot.send_message(chat_id=uid, text=text)
-    except Exception:
-        pass
+        with use_lane(SCHEDULED):
+            ok = await user_daily_check(app, uid)
+    except Exception as e:
+        logger.warning(f"定时签到失败: {job_id}, 错误: {e}")
+        await asyncio.to_thread(sign_store.fail, job_id, str(e))
+        return
+    if ok:
+        await asyncio.to_thread(sign_store.complete, job_id)
+    else:
+        logger.warning(f"定时签到未成功: {job_id}，脚本或站点异常，稍后重试")
+        await asyncio.to_thread(sign_store.fail, job_id, "脚本或站点异常，没有账号签到成功")
+
+async def sign_queue_tick(context: CallbackContext):
+    """每个北京日期排一次当天和次日的任务，然后领取到点（或错过但仍在补签窗口内）的任务执行"""
+    app = context.application
+    today = plan_dates()[0]
+    if sign_queue_state["planned"] != today:
+        data = load_data()
+        added = await asyncio.to_thread(sign_store.plan, sign_schedule(data.get("users", {})))
+        await asyncio.to_thread(sign_store.prune)
+        sign_queue_state["planned"] = today
+        logger.info(f"签到队列已排期: {today}，新增 {added} 个任务")
+
+    free = SIGN_QUEUE_BATCH - len(running_sign_jobs)
+    if free <= 0:
+        return
+    for job_id, uid, due_at in await asyncio.to_thread(sign_store.claim, free):
+        task = asyncio.create_task(run_sign_job(app, job_id, uid, due_at))
+        running_sign_jobs.add(task)
+        task.add_done_callback(running_sign_jobs.discard)
 
 # ========== 管理员签到结果分页 ==========
-async def get_admin_check_page_content(results, user_modes, data, page: int = 0):
-    """生成管理员签到结果分页内容"""
-    # 收集所有有签到结果的用户
-    users_with_results = []
-    
+PAGE_TEXT_LIMIT = 4000  # Telegram 单条消息上限 4096 字符，预留页眉余量
+
+def tg_len(text: str) -> int:
+    """Telegram 按 UTF-16 码元计算长度"""
+    return len(text.encode("utf-16-le")) // 2
+
+def pages_size(pages) -> int:
+    return sum(len(text.encode("utf-8")) + 256 for text, _ in pages)
+
+# 管理员签到结果缓存：签到结束时一次性渲染好的分页（不可变），过期/超量自动淘汰
+check_results_cache = TTLCache(maxsize=50, ttl=6 * 3600, max_bytes=8 * 1024 * 1024, sizer=pages_size)
+
+def render_admin_check_pages(results, user_modes, data, result_id: str) -> tuple:
+    """把签到结果按字符上限切成若干页，返回 ((文本, 键盘), ...)"""
+    # 每个用户一块；超长的块按行拆开
+    blocks = []
     for uid, sites in results.items():
-        if sites:  # 有签到结果
-            users_with_results.append({
-                'uid': uid,
-                'user_info': data["users"][uid],
-                'sites': sites
-            })
-    
-    # 分页设置
-    per_page = 5
-    total_users = len(users_with_results)
-    total_pages = (total_users + per_page - 1) // per_page if total_users > 0 else 1
-    
-    # 确保页码在有效范围内
-    page = max(0, min(page, total_pages - 1))
-    
-    # 获取当前页的用户
-    start_idx = page * per_page
-    end_idx = min(start_idx + per_page, total_users)
-    current_page_users = users_with_results[start_idx:end_idx]
-    
-    # 构建消息文本
-    text = f"📋 手动签到结果 (第{page + 1}/{total_pages}页):\n"
-    
-    if not current_page_users:
-        text += "\n（暂无签到结果）"
-    else:
-        for user_data in current_page_users:
-            uid = user_data['uid']
-            u = user_data['user_info']
-            sites = user_data['sites']
-            
-            text += f"\n👤 {u.get('tgUsername', uid)}\n🆔 {uid}\n"
-            
-            for site_type, logs in sites.items():
-                site_info = get_site_info(site_type)
-                mode = user_modes.get(uid, {}).get(site_type, False)
-                text += f"{site_info['emoji']} {site_info['name']}【{mode_text(mode)}】:\n"
-                
-                for r in logs:
-                    line = f"{mask_username(r['name'])} - {r['result']}"
-                    if r.get("cookie_refreshed"):
-                        line += " [♻️ Cookie]"
-                    text += line + "\n"
-    
-    # 创建分页按钮
-    keyboard = []
-    nav_buttons = []
-    
-    if total_pages > 1:
+        if not sites:
+            continue
+        u = data["users"].get(uid, {})
+        lines = [f"👤 {u.get('tgUsername', uid)}", f"🆔 {uid}"]
+        for site_type, logs in sites.items():
+            site_info = get_site_info(site_type)
+            mode = user_modes.get(uid, {}).get(site_type, False)
+            lines.append(f"{site_info['emoji']} {site_info['name']}【{mode_text(mode)}】:")
+            for r in logs:
+                line = f"{mask_username(r['name'])} - {r['result']}"
+                if r.get("cookie_refreshed"):
+                    line += " [♻️ Cookie]"
+                lines.append(line)
+        blocks.append("\n" + "\n".join(lines) + "\n")
+
+    bodies = []
+    body = ""
+    for block in blocks:
+        pieces = [block] if tg_len(block) <= PAGE_TEXT_LIMIT else [l + "\n" for l in block.split("\n") if l]
+        for piece in pieces:
+            if body and tg_len(body) + tg_len(piece) > PAGE_TEXT_LIMIT:
+                bodies.append(body)
+                body = ""
+            body += piece
+    if body or not bodies:
+        bodies.append(body or "\n（暂无签到结果）")
+
+    total_pages = len(bodies)
+    pages = []
+    for page, body in enumerate(bodies):
+        text = f"📋 手动签到结果 (第{page + 1}/{total_pages}页):\n" + body
+
+        nav_buttons = []
         if page > 0:
-            nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f"check_page_{page-1}"))
-        
+            nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f"check_page_{page-1}_{result_id}"))
         if page < total_pages - 1:
-            nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f"check_page_{page+1}"))
-        
-        keyboard.append(nav_buttons)
-    
-    reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-    return text, reply_markup
+            nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f"check_page_{page+1}_{result_id}"))
+
+        reply_markup = InlineKeyboardMarkup([nav_buttons]) if nav_buttons else None
+        pages.append((text, reply_markup))
 
+    return tuple(pages)
+
+@traced("tg_send")
 async def send_admin_check_results_paginated(app: Application, chat_id: int, results, user_modes, data, page: int = 0):
-    """发送管理员签到结果分页消息"""
-    text, reply_markup = await get_admin_check_page_content(results, user_modes, data, page)
-    
-    # 存储结果数据供分页回调使用
-    if not hasattr(app, 'temp_check_results'):
-        app.temp_check_results = {}
-    
-    # 使用简化的时间戳作为唯一标识（避免下划线冲突）
-    result_id = str(int(datetime.now().timestamp()))
-    app.temp_check_results[result_id] = {
-        'results': results,
-        'user_modes': user_modes,
-        'data': data,
-        'chat_id': chat_id
-    }
-    
-    print(f"DEBUG: 存储结果数据，ID: {result_id}")
-    print(f"DEBUG: 当前存储的所有ID: {list(app.temp_check_results.keys())}")
-    
-    # 在按钮数据中包含结果ID
-    if reply_markup:
-        new_keyboard = []
-        for row in reply_markup.inline_keyboard:
-            new_row = []
-            for button in row:
-                callback_data = button.callback_data
-                if callback_data.startswith("check_page_"):
-                    page_num = callback_data.split("_")[2]
-                    new_callback_data = f"check_page_{page_num}_{result_id}"
-                    print(f"DEBUG: 生成按钮回调数据: {new_callback_data}")
-                    new_row.append(InlineKeyboardButton(button.text, callback_data=new_callback_data))
-                else:
-                    new_row.append(button)
-            new_keyboard.append(new_row)
-        reply_markup = InlineKeyboardMarkup(new_keyboard)
-    
+    """渲染全部分页并缓存，发送指定页"""
+    # 使用时间戳+随机后缀作为唯一标识（避免下划线冲突和同一秒内重复）
+    result_id = f"{int(datetime.now().timestamp())}{random.randint(100, 999)}"
+    pages = render_admin_check_pages(results, user_modes, data, result_id)
+    check_results_cache.set(result_id, pages)
+
+    text, reply_markup = pages[max(0, min(page, len(pages) - 1))]
     await app.bot.send_message(
         chat_id=chat_id,
         text=text,
@@ -1297,7 +1829,7 @@ async def send_admin_check_results_paginated(app: Application, chat_id: int, res
     )
 
 async def check_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """处理签到结果分页回调"""
+    """处理签到结果分页回调：直接取预渲染好的页面"""
     query = update.callback_query
     user_id = str(query.from_user.id)
     
@@ -1307,60 +1839,24 @@ async def check_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     data = query.data
     
-    # 添加调试日志
-    print(f"DEBUG: 收到回调数据: {data}")
-    
     if data.startswith("check_page_"):
         try:
             # 格式: check_page_页码_结果ID
-            # 由于结果ID可能包含下划线，需要特殊处理
-            prefix = "check_page_"
-            remaining = data[len(prefix):]  # 去掉前缀
+            remaining = data[len("check_page_"):]
             parts = remaining.split("_", 1)  # 只分割一次
             page = int(parts[0])
             result_id = parts[1] if len(parts) > 1 else None
             
-            print(f"DEBUG: 解析结果 - page: {page}, result_id: {result_id}")
-            
             if not result_id:
                 await query.answer("⚠️ 缺少结果ID", show_alert=True)
                 return
                 
-            if not hasattr(context.application, 'temp_check_results'):
-                print("DEBUG: temp_check_results 属性不存在")
-                await query.answer("⚠️ 数据存储未初始化，请重新执行签到", show_alert=True)
-                return
-            
-            print(f"DEBUG: 可用的结果ID: {list(context.application.temp_check_results.keys())}")
-            
-            stored_data = context.application.temp_check_results.get(result_id)
-            if not stored_data:
-                print(f"DEBUG: 未找到结果ID {result_id} 对应的数据")
+            pages = check_results_cache.get(result_id)
+            if not pages:
                 await query.answer("⚠️ 数据已过期，请重新执行签到", show_alert=True)
                 return
             
-            text, reply_markup = await get_admin_check_page_content(
-                stored_data['results'],
-                stored_data['user_modes'], 
-                stored_data['data'],
-                page
-            )
-            
-            # 更新按钮数据中的结果ID
-            if reply_markup:
-                new_keyboard = []
-                for row in reply_markup.inline_keyboard:
-                    new_row = []
-                    for button in row:
-                        callback_data = button.callback_data
-                        if callback_data.startswith("check_page_"):
-                            page_num = callback_data.split("_")[2]
-                            new_callback_data = f"check_page_{page_num}_{result_id}"
-                            new_row.append(InlineKeyboardButton(button.text, callback_data=new_callback_data))
-                        else:
-                            new_row.append(button)
-                    new_keyboard.append(new_row)
-                reply_markup = InlineKeyboardMarkup(new_keyboard)
+            text, reply_markup = pages[max(0, min(page, len(pages) - 1))]
             
             try:
                 await query.edit_message_text(text=text, reply_markup=reply_markup)
@@ -1575,6 +2071,8 @@ async def txt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     data = load_data()
+    # 同一次喊话的所有按钮共用一个编号，已知晓记录按喊话保存
+    broadcast_id = secrets.token_hex(4)
 
     # 单发
     if "," in args and args.split(",", 1)[0].isdigit():
@@ -1589,10 +2087,10 @@ async def txt(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         keyboard = [[
             InlineKeyboardButton("去回复", url="https://t.me/SerokBot_bot"),
-            InlineKeyboardButton("己知晓", callback_data=f"ack_{user_id}")
+            InlineKeyboardButton("己知晓", callback_data=f"ack_{user_id}_{broadcast_id}")
         ]]
 
-        await context.application.bot.send_message(
+        sent = await get_outbox(context.application).send(
             target,
             f"📢 管理员 {admin_name} 喊话:\n{content}",
             reply_markup=InlineKeyboardMarkup(keyboard)
@@ -1600,41 +2098,80 @@ async def txt(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         return await send_and_auto_delete(
             update.message.chat,
-            f"✅ 已向 {target} 发送喊话",
+            f"✅ 已向 {target} 发送喊话" if sent else f"⚠️ 向 {target} 发送喊话失败",
             10,
             user_msg=update.message
         )
 
-    # 群发
-    sent = 0
-    for uid in data["users"]:
-        if uid == user_id:
-            continue
-
-        keyboard = [[
-            InlineKeyboardButton("去回复", url="https://t.me/SerokBot_bot"),
-            InlineKeyboardButton("己知晓", callback_data=f"ack_{user_id}")
-        ]]
-
-        try:
-            await context.application.bot.send_message(
-                uid,
-                f"📢 管理员 {admin_name} 喊话:\n{args}",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            sent += 1
-        except Exception as e:
-            logger.warning(f"发送失败: {uid}, 错误: {e}")
+    # 群发：并发投递，受全局/单聊天限速约束
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("去回复", url="https://t.me/SerokBot_bot"),
+        InlineKeyboardButton("己知晓", callback_data=f"ack_{user_id}_{broadcast_id}")
+    ]])
+    messages = [
+        (uid, f"📢 管理员 {admin_name} 喊话:\n{args}", {"reply_markup": keyboard})
+        for uid in data["users"] if uid != user_id
+    ]
+    report = await get_outbox(context.application).broadcast(messages)
 
     await send_and_auto_delete(
         update.message.chat,
-        f"✅ 已发送 {sent} 个用户",
+        f"✅ 已发送 {report['delivered']} 个用户，失败 {report['failed']} 个",
         10,
         user_msg=update.message
     )
 
-# 存放 每条喊话消息 -> 已确认的用户集合
-acknowledged_users = {}
+# ========== /perf ==========
+PERF_STAGE_ORDER = ["total", "load_data", "run_sign_and_fix", "node sign_dual.js", "retry_sign_if_invalid",
+                    "login", "save_data", "append_user_log", "tg_send"]
+PERF_RUN_NAMES = {"check": "手动签到", "auto": "自动签到", "deferred": "熔断补签"}
+PERF_LANE_NAMES = {"interactive": "手动", "scheduled": "定时", "background": "后台"}
+
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """管理员查看最近 N 次签到流程各阶段耗时 p50/p95，可导出 trace 文件"""
+    user_id = str(update.effective_user.id)
+    if not is_admin(user_id):
+        return
+
+    last = 50
+    if context.args and context.args[0].isdigit():
+        last = max(1, int(context.args[0]))
+
+    lanes = "，".join(
+        f"{PERF_LANE_NAMES.get(lane, lane)} {st['queued']} 排队 / {st['served']} 已执行"
+        for lane, st in lane_stats().items()
+    )
+    gates = list(node_gates.values())
+    lanes_text = (f"🚦 Node 名额 {sum(g.in_use for g in gates)}/{sum(g.capacity for g in gates)}"
+                  f"（{len(gates)} 个执行位置）：{lanes}\n")
+
+    report = tracing.summary(last)
+    if not report:
+        return await send_and_auto_delete(
+            update.message.chat, lanes_text + "⚠️ 暂无耗时记录", 10, user_msg=update.message
+        )
+
+    text = lanes_text + f"\n⏱️ 最近 {last} 次运行耗时（p50 / p95，秒）\n"
+    for name, entry in report.items():
+        text += f"\n【{PERF_RUN_NAMES.get(name, name)}】{entry['runs']} 次\n"
+        stages = entry["stages"]
+        order = [k for k in PERF_STAGE_ORDER if k in stages] + sorted(k for k in stages if k not in PERF_STAGE_ORDER)
+        for stage in order:
+            st = stages[stage]
+            text += f"{stage}: {st['p50']:.2f} / {st['p95']:.2f}（{st['count']} 次）\n"
+
+    await send_and_auto_delete(update.message.chat, text, 60, user_msg=update.message)
+
+    if "export" in (context.args or []):
+        path = f"./data/traces/perf-{datetime.now(beijing).strftime('%Y%m%d-%H%M%S')}.json"
+        count = tracing.export(path, last)
+        with open(path, "rb") as f:
+            await update.message.chat.send_document(
+                f, caption=f"📎 {count} 次运行，可用 chrome://tracing 或 Perfetto 打开"
+            )
+
+# 存放 每次喊话 -> 已确认的用户集合（7 天后过期，最多保留 500 次喊话，不受收件人数影响）
+acknowledged_users = TTLCache(maxsize=500, ttl=7 * 86400)
 
 async def ack_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -1645,32 +2182,30 @@ async def ack_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not data.startswith("ack_"):
         return
 
-    admin_id = int(data.split("_")[1])
-    key = (query.message.chat.id, query.message.message_id)
+    parts = data.split("_")
+    admin_id = int(parts[1])
+    # 旧按钮没有喊话编号，按消息记录
+    key = parts[2] if len(parts) > 2 else (query.message.chat.id, query.message.message_id)
 
-    if key not in acknowledged_users:
-        acknowledged_users[key] = set()
+    acked = acknowledged_users.get(key)
+    if acked is None:
+        acked = set()
+        acknowledged_users.set(key, acked)
 
-    if user_id in acknowledged_users[key]:
+    if user_id in acked:
         await query.answer("⚠️ 你已知晓", show_alert=True)
         return
 
-    acknowledged_users[key].add(user_id)
+    acked.add(user_id)
 
-    try:
-        await context.application.bot.send_message(
-            admin_id,
-            f"📣 用户 {username} 已知晓喊话内容"
-        )
-    except Exception as e:
-        logger.warning(f"通知管理员失败: {admin_id}, 错误: {e}")
+    await get_outbox(context.application).send(admin_id, f"📣 用户 {username} 已知晓喊话内容")
 
     await query.answer("✅ 已知晓")
 
 # ========== 定时任务注册 ==========
-def register_jobs(app: Application):
-    data = load_data()
+METRICS_SNAPSHOT_INTERVAL = 5   # 秒
 
+def register_jobs(app: Application):
     # 管理员汇总任务 → 每天 10:05 (北京时间)
     async def admin_job(context: CallbackContext):
         for admin_id in ADMIN_IDS:
@@ -1685,106 +2220,246 @@ def register_jobs(app: Application):
         name="admin_summary"
     )
 
-    # 用户签到任务
-    for uid, u in data.get("users", {}).items():
-        hour = u.get("sign_hour", 0)
-        minute = u.get("sign_minute", 0)
+    # 熔断暂缓的签到，每分钟检查一次是否可以补签
+    app.job_queue.run_repeating(retry_deferred_job, interval=60, first=60, name="retry_deferred")
 
-        async def user_job(context: CallbackContext, user_id=uid):
-            await user_daily_check(app, user_id)
+    # 新进入暂停的账号，汇总通知
+    app.job_queue.run_repeating(quarantine_notify_job, interval=60, first=30, name="quarantine_notify")
 
-        app.job_queue.run_daily(
-            user_job,
-            time=time(hour=hour, minute=minute, tzinfo=beijing),
-            name=f"user_{uid}_daily_check"
-        )
+    # 指标和就绪状态快照，供 /metrics、/readyz 读取；未开启指标端点时不需要
+    if metrics.METRICS_PORT:
+        app.job_queue.run_repeating(metrics_snapshot_job, interval=METRICS_SNAPSHOT_INTERVAL, first=0,
+                                    name="metrics_snapshot")
+
+    # 用户签到任务：由持久化队列调度，启动后第一次检查即补签停机期间错过的任务
+    app.job_queue.run_repeating(sign_queue_tick, interval=SIGN_QUEUE_POLL, first=1, name="sign_queue")
 
 # ========== 设置命令菜单 ==========
-async def post_init(application: Application):
+# 普通用户菜单
+USER_NO_ACC = [
+    BotCommand("start", "显示帮助"),
+    BotCommand("add", "添加账号"),
+]
+USER_WITH_ACC = [
+    BotCommand("start", "显示帮助"),
+    BotCommand("check", "手动签到"),
+    BotCommand("add", "添加账号"),
+    BotCommand("del", "删除账号"),
+    BotCommand("mode", "签到模式"),
+    BotCommand("list", "账号列表"),
+    BotCommand("log", "签到记录"),
+    BotCommand("stats", "签到统计"),
+    BotCommand("settime", "设置签到时间"),
+]
+
+# 管理员菜单
+ADMIN_NO_ACC = [
+    BotCommand("start", "显示帮助"),
+    BotCommand("check", "手动签到"),
+    BotCommand("add", "添加账号"),
+    BotCommand("del", "删除账号"),
+    BotCommand("list", "账号列表"),
+    BotCommand("hz", "每日汇总"),
+    BotCommand("txt", "管理员喊话"),
+    BotCommand("perf", "耗时分析"),
+]
+ADMIN_WITH_ACC = [
+    BotCommand("start", "显示帮助"),
+    BotCommand("check", "手动签到"),
+    BotCommand("add", "添加账号"),
+    BotCommand("del", "删除账号"),
+    BotCommand("mode", "签到模式"),
+    BotCommand("list", "账号列表"),
+    BotCommand("log", "签到记录"),
+    BotCommand("settime", "设置签到时间"),
+    BotCommand("stats", "签到统计"),
+    BotCommand("hz", "每日汇总"),
+    BotCommand("txt", "管理员喊话"),
+    BotCommand("perf", "耗时分析"),
+]
+
+# 群聊菜单
+GROUP_COMMANDS = [
+    BotCommand("start", "显示帮助"),
+    BotCommand("check", "手动签到"),
+    BotCommand("add", "添加账号"),
+    BotCommand("del", "删除账号"),
+    BotCommand("mode", "签到模式"),
+    BotCommand("list", "账号列表"),
+    BotCommand("log", "签到记录"),
+    BotCommand("stats", "签到统计"),
+    BotCommand("settime", "设置签到时间"),
+]
+
+# 已下发菜单的哈希：{"uid": hash, "_default": hash, "_groups": hash, "_bot": bot_id}
+MENU_STATE_FILE = "./data/menu_state.json"
+
+def menu_hash(commands) -> str:
+    raw = json.dumps([[c.command, c.description] for c in commands], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def load_menu_state() -> dict:
+    try:
+        with open(MENU_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_menu_state(state: dict):
+    os.makedirs(os.path.dirname(MENU_STATE_FILE), exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(MENU_STATE_FILE), encoding="utf-8") as tf:
+        json.dump(state, tf, indent=2)
+        tempname = tf.name
+    os.replace(tempname, MENU_STATE_FILE)
+
+def menu_for(uid: str, user_data) -> list:
+    """返回该用户应有的菜单；None 表示使用默认菜单"""
+    has_account = bool(user_data) and has_any_accounts(user_data)
+    if int(uid) in ADMIN_IDS:
+        return ADMIN_WITH_ACC if has_account else ADMIN_NO_ACC
+    return USER_WITH_ACC if has_account else None
+
+async def _sync_menu(application: Application, uid: str, user_data, state: dict) -> bool:
+    """按哈希比对，只在菜单变化时调用 Telegram API，返回是否有改动"""
+    commands = menu_for(uid, user_data)
+    scope = telegram.BotCommandScopeChat(int(uid))
+    if commands is None:
+        # 回落到默认菜单
+        if uid not in state:
+            return False
+        await application.bot.delete_my_commands(scope=scope)
+        del state[uid]
+        return True
+
+    h = menu_hash(commands)
+    if state.get(uid) == h:
+        return False
+    await application.bot.set_my_commands(commands, scope=scope)
+    state[uid] = h
+    return True
+
+async def sync_user_menu(application: Application, uid: str):
+    """账号增删后只刷新受影响用户的菜单"""
+    uid = str(uid)
     data = load_data()
+    state = load_menu_state()
+    try:
+        if await _sync_menu(application, uid, data.get("users", {}).get(uid), state):
+            save_menu_state(state)
+    except Exception as e:
+        logger.warning(f"同步菜单失败: {uid}, 错误: {e}")
+
+# ========== 指标 ==========
+def on_job_submitted(event):
+    """任务提交时计算与计划时间的偏差，反映事件循环是否被阻塞"""
+    if event.scheduled_run_times:
+        lag = (datetime.now(timezone.utc) - max(event.scheduled_run_times)).total_seconds()
+        JOB_LAG_SECONDS.observe(max(lag, 0.0))
+
+async def metrics_snapshot_job(context: CallbackContext):
+    """在事件循环中定期把限速器、熔断器、缓存、队列等状态写入 Gauge 和就绪快照；
+    /metrics 所在的 HTTP 线程只读取这些快照，不接触事件循环持有的对象。读文件和数据库的部分放到线程中"""
+    app = context.application
+    metrics.set_ready(app.running, queue=app.update_queue.qsize())
+
+    rates, queue_counts = await asyncio.gather(
+        asyncio.to_thread(current_rates), asyncio.to_thread(sign_store.counts)
+    )
+    for site_type, info in rates.items():
+        metrics.SITE_RATE.set(info["rate"], site=site_type)
+    for state, n in queue_counts.items():
+        metrics.SIGN_QUEUE.set(n, state=state)
+
+    state_value = {"closed": 0, "half_open": 0.5, "open": 1}
+    for site_type, snap in breaker_states().items():
+        metrics.BREAKER_OPEN.set(state_value.get(snap["state"], 0), site=site_type)
+    for name, cache in (("check_pages", check_results_cache), ("acks", acknowledged_users),
+                        ("signed_today", sign_ledger)):
+        cache_stats = cache.stats()
+        metrics.CACHE_ENTRIES.set(cache_stats["entries"], cache=name)
+        metrics.CACHE_HITS.set(cache_stats["hits"], cache=name)
+    metrics.PENDING_DELETES.set(delete_scheduler.stats()["pending"])
+    metrics.QUARANTINED.set(credential_quarantine.stats()["quarantined"])
+    for lane, st in lane_stats().items():
+        metrics.LANE_QUEUE.set(st["queued"], lane=lane)
 
-    # 普通用户菜单
-    user_no_acc = [
-        BotCommand("start", "显示帮助"),
-        BotCommand("add", "添加账号"),
-    ]
-    user_with_acc = [
-        BotCommand("start", "显示帮助"),
-        BotCommand("check", "手动签到"),
-        BotCommand("add", "添加账号"),
-        BotCommand("del", "删除账号"),
-        BotCommand("mode", "签到模式"),
-        BotCommand("list", "账号列表"),
-        BotCommand("log", "签到记录"),
-        BotCommand("stats", "签到统计"),
-        BotCommand("settime", "设置签到时间"),
-    ]
+async def post_init(application: Application):
+    """启动时恢复待删除消息，并对账菜单：只为哈希与记录不一致的聊天调用 set_my_commands"""
+    delete_scheduler.start(application.bot)
+    loop_watchdog.start()
+    metrics.start_server()
+    await shard_router.start()
+    if application.job_queue:
+        application.job_queue.scheduler.add_listener(on_job_submitted, EVENT_JOB_SUBMITTED)
 
-    # 管理员菜单
-    admin_no_acc = [
-        BotCommand("start", "显示帮助"),
-        BotCommand("check", "手动签到"),
-        BotCommand("add", "添加账号"),
-        BotCommand("del", "删除账号"),
-        BotCommand("list", "账号列表"),
-        BotCommand("hz", "每日汇总"),
-        BotCommand("txt", "管理员喊话"),
-    ]
-    admin_with_acc = [
-        BotCommand("start", "显示帮助"),
-        BotCommand("check", "手动签到"),
-        BotCommand("add", "添加账号"),
-        BotCommand("del", "删除账号"),
-        BotCommand("mode", "签到模式"),
-        BotCommand("list", "账号列表"),
-        BotCommand("log", "签到记录"),
-        BotCommand("settime", "设置签到时间"),
-        BotCommand("stats", "签到统计"),
-        BotCommand("hz", "每日汇总"),
-        BotCommand("txt", "管理员喊话"),
-    ]
+    data = load_data()
+    state = load_menu_state()
 
-    # 群聊菜单
-    group_commands = [
-        BotCommand("start", "显示帮助"),
-        BotCommand("check", "手动签到"),
-        BotCommand("add", "添加账号"),
-        BotCommand("del", "删除账号"),
-        BotCommand("mode", "签到模式"),
-        BotCommand("list", "账号列表"),
-        BotCommand("log", "签到记录"),
-        BotCommand("stats", "签到统计"),
-        BotCommand("settime", "设置签到时间"),
-    ]
-    await application.bot.set_my_commands(group_commands, scope=telegram.BotCommandScopeAllGroupChats())
+    # 换了 Bot Token 时记录全部作废
+    if state.get("_bot") != application.bot.id:
+        state = {"_bot": application.bot.id}
 
-    # 默认菜单
-    await application.bot.set_my_commands(user_no_acc)
+    changed = False
+    for key, commands, scope in (
+        ("_groups", GROUP_COMMANDS, telegram.BotCommandScopeAllGroupChats()),
+        ("_default", USER_NO_ACC, None),
+    ):
+        h = menu_hash(commands)
+        if state.get(key) != h:
+            await application.bot.set_my_commands(commands, scope=scope)
+            state[key] = h
+            changed = True
 
-    # 为每个用户设置专属菜单
-    for uid, u in data.get("users", {}).items():
-        has_account = has_any_accounts(u)
-        if int(uid) in ADMIN_IDS:
-            commands = admin_with_acc if has_account else admin_no_acc
-        else:
-            commands = user_with_acc if has_account else user_no_acc
+    # 用户、未绑定账号的管理员、以及已删除但仍有专属菜单的用户
+    users = data.get("users", {})
+    uids = set(users) | {str(a) for a in ADMIN_IDS} | {k for k in state if not k.startswith("_")}
+    for uid in sorted(uids):
+        try:
+            changed |= await _sync_menu(application, uid, users.get(uid), state)
+        except Exception as e:
+            logger.warning(f"同步菜单失败: {uid}, 错误: {e}")
 
-        await application.bot.set_my_commands(
-            commands,
-            scope=telegram.BotCommandScopeChat(int(uid))
-        )
+    if changed:
+        save_menu_state(state)
 
-    # 处理未绑定账号的管理员
-    for admin_id in ADMIN_IDS:
-        if str(admin_id) not in data.get("users", {}):
-            await application.bot.set_my_commands(
-                admin_no_acc,
-                scope=telegram.BotCommandScopeChat(admin_id)
-            )
+async def post_stop(application: Application):
+    metrics.set_ready(False)
+
+async def post_shutdown(application: Application):
+    await delete_scheduler.stop()
+    await loop_watchdog.stop()
+    await shard_router.stop()
+    sign_store.release()
+    metrics.stop_server()
 
 # ========== 启动 ==========
+INSTANCE_LOCK = "./data/bot.lock"
+
+def acquire_instance_lock():
+    """同一份数据只允许一个 bot 实例：定时任务、data.json 等文件和内存中的暂缓/去重状态都没有跨实例协调"""
+    os.makedirs(os.path.dirname(INSTANCE_LOCK), exist_ok=True)
+    lock_file = open(INSTANCE_LOCK, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        raise SystemExit(f"❌ 已有 bot 实例在运行（{INSTANCE_LOCK} 被占用），同一份数据不能同时运行多个实例")
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file   # 进程退出时自动释放
+
 def main():
-    app = Application.builder().token(TOKEN).post_init(post_init).build()
+    instance_lock = acquire_instance_lock()
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if TG_API_BASE_URL:
+        builder = builder.base_url(f"{TG_API_BASE_URL}/bot").base_file_url(f"{TG_API_BASE_URL}/file/bot")
+    app = builder.build()
 
     # 注册命令处理器
     app.add_handler(CommandHandler("start", start))
@@ -1798,6 +2473,7 @@ def main():
     app.add_handler(CommandHandler("settime", settime))
     app.add_handler(CommandHandler("stats", stats))
     app.add_handler(CommandHandler("txt", txt))
+    app.add_handler(CommandHandler("perf", perf))
 
     # 注册回调处理器
     app.add_handler(CallbackQueryHandler(hz_page_callback, pattern=r"^hz_"))
@@ -1810,8 +2486,21 @@ def main():
     print("🚀 双网站签到机器人启动成功！")
     print(f"🔵 NodeSeek: {SITES['ns']['domain']}")
     print(f"🟢 DeepFlood: {SITES['df']['domain']}")
-    
-    app.run_polling()
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise SystemExit("❌ webhook 模式需要配置 WEBHOOK_URL 和 WEBHOOK_SECRET")
+        # 本地监听路径与 WEBHOOK_URL 的路径一致；secret token 由 PTB 校验
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=urlparse(WEBHOOK_URL).path.lstrip("/"),
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=WEBHOOK_URL,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,114 @@
+# circuit_breaker.py - 按站点的熔断器（closed / open / half_open）
+import os
+import time
+import threading
+from collections import deque
+
+WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))            # 统计最近多少次调用
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))       # 少于该次数不判定
+ERROR_RATIO = float(os.getenv("BREAKER_ERROR_RATIO", "0.5"))
+OPEN_SECONDS = int(os.getenv("BREAKER_OPEN_SECONDS", "300"))
+HALF_OPEN_PROBES = 1
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, site_type: str):
+        self.site_type = site_type
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.outcomes = deque(maxlen=WINDOW)
+        self.probes = 0
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def _maybe_half_open(self):
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= OPEN_SECONDS:
+            self.state = HALF_OPEN
+            self.probes = 0
+            self.probe_started = now
+        elif self.state == HALF_OPEN and now - self.probe_started >= OPEN_SECONDS:
+            # 探测迟迟没有结果，重新放一次
+            self.probes = 0
+            self.probe_started = now
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+
+    def acquire(self, n: int = 1) -> int:
+        """申请 n 次调用，返回允许的次数：closed 全放行，half_open 只放探测，open 为 0"""
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == CLOSED:
+                return n
+            if self.state == HALF_OPEN:
+                allowed = min(n, HALF_OPEN_PROBES - self.probes)
+                self.probes += max(allowed, 0)
+                return max(allowed, 0)
+            return 0
+
+    def allow(self) -> bool:
+        return self.acquire(1) == 1
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if success:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                else:
+                    self._open()
+                return
+            if self.state == OPEN:
+                return
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= MIN_CALLS and failures / len(self.outcomes) >= ERROR_RATIO:
+                self._open()
+
+    def release(self):
+        """调用结果与站点状态无关（如账号密码错误），归还探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def trip(self):
+        """外部已确认站点异常（如 Node 脚本中途熔断），直接打开"""
+        with self._lock:
+            if self.state != OPEN:
+                self._open()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            failures = self.outcomes.count(False)
+            retry_in = 0
+            if self.state == OPEN:
+                retry_in = max(0, int(OPEN_SECONDS - (time.monotonic() - self.opened_at)))
+            return {
+                "state": self.state,
+                "calls": len(self.outcomes),
+                "failures": failures,
+                "retry_in": retry_in,
+            }
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(site_type: str) -> CircuitBreaker:
+    with _registry_lock:
+        if site_type not in _breakers:
+            _breakers[site_type] = CircuitBreaker(site_type)
+        return _breakers[site_type]
+
+
+def breaker_states() -> dict:
+    return {k: b.snapshot() for k, b in _breakers.items()}
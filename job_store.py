@@ -0,0 +1,191 @@
+# job_store.py - 持久化的定时签到队列（SQLite）：任务状态、租约、重启后补签
+#
+# 每个用户每天一条任务，id 为 "<uid>:<北京日期>"。状态：
+#   pending  等待到点    running  已被某个进程领取（租约到期未完成视为进程崩溃，可被重新领取）
+#   done     已完成      failed   重试次数用尽，或错过补签窗口
+# 领取在 BEGIN IMMEDIATE 事务中进行，多个进程共用同一个数据库文件也不会重复执行。
+import os
+import time
+import socket
+import random
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+DB_FILE = "./data/jobs.db"
+
+CATCHUP_GRACE = int(os.getenv("SIGN_CATCHUP_GRACE", "3600"))    # 错过计划时间多久以内仍然补签（秒）
+LEASE_SECONDS = int(os.getenv("SIGN_LEASE_SECONDS", "900"))     # 领取后多久未完成视为失败
+MAX_ATTEMPTS = int(os.getenv("SIGN_MAX_ATTEMPTS", "3"))
+RETRY_DELAY = 300                                               # 失败后多久重试（秒）
+JITTER = 5 * 60                                                 # 计划时间后随机推迟，错开请求
+KEEP_DAYS = 7
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+beijing = ZoneInfo("Asia/Shanghai")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sign_jobs (
+    id          TEXT PRIMARY KEY,
+    uid         TEXT NOT NULL,
+    run_date    TEXT NOT NULL,
+    due_at      REAL NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    error       TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sign_jobs_due ON sign_jobs (state, due_at);
+"""
+
+
+def due_time(run_date: str, hour: int, minute: int) -> float:
+    day = datetime.strptime(run_date, "%Y-%m-%d").replace(hour=hour, minute=minute, tzinfo=beijing)
+    return day.timestamp()
+
+
+def plan_dates(now: float = None) -> list:
+    """今天和明天（北京时间），提前排好明天的任务，零点前后重启也不会漏"""
+    today = datetime.fromtimestamp(now or time.time(), beijing).date()
+    return [str(today), str(today + timedelta(days=1))]
+
+
+class JobStore:
+    def __init__(self, path: str = DB_FILE, owner: str = None):
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # 每次操作单独连接，可以在任意线程中调用；异常时关闭连接即回滚未提交的事务
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def plan(self, users: dict, now: float = None) -> int:
+        """为每个用户排好今天和明天的任务（已存在的不动）；今天已超过补签窗口的不再排。返回新增数"""
+        now = now or time.time()
+        rows = []
+        for run_date in plan_dates(now):
+            for uid, (hour, minute) in users.items():
+                due = due_time(run_date, hour, minute) + random.randint(0, JITTER)
+                if due < now - CATCHUP_GRACE:
+                    continue
+                rows.append((f"{uid}:{run_date}", str(uid), run_date, due, now))
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO sign_jobs (id, uid, run_date, due_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        return added
+
+    def reschedule(self, uid: str, hour: int, minute: int, now: float = None):
+        """修改签到时间：尚未执行的任务改到新时间；今天的新时间已过则保持原计划"""
+        now = now or time.time()
+        uid = str(uid)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for run_date in plan_dates(now):
+                due = due_time(run_date, hour, minute) + random.randint(0, JITTER)
+                if due <= now:
+                    continue
+                cur = conn.execute(
+                    "UPDATE sign_jobs SET due_at = ?, updated_at = ? WHERE id = ? AND state = ?",
+                    (due, now, f"{uid}:{run_date}", PENDING),
+                )
+                if not cur.rowcount:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO sign_jobs (id, uid, run_date, due_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (f"{uid}:{run_date}", uid, run_date, due, now),
+                    )
+            conn.execute("COMMIT")
+
+    def claim(self, limit: int, now: float = None) -> list:
+        """领取到点的任务（包括租约过期的），超过补签窗口的标记为 failed。返回 [(id, uid, 计划时间)]"""
+        now = now or time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE sign_jobs SET state = ?, error = 'missed', updated_at = ? "
+                "WHERE (state = ? OR (state = ? AND lease_until < ?)) AND due_at < ?",
+                (FAILED, now, PENDING, RUNNING, now, now - CATCHUP_GRACE),
+            )
+            conn.execute(
+                "UPDATE sign_jobs SET state = ?, error = 'lease expired', updated_at = ? "
+                "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, MAX_ATTEMPTS),
+            )
+            rows = conn.execute(
+                "SELECT id, uid, due_at FROM sign_jobs "
+                "WHERE (state = ? AND due_at <= ?) OR (state = ? AND lease_until < ?) "
+                "ORDER BY due_at LIMIT ?",
+                (PENDING, now, RUNNING, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE sign_jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_until = ?, "
+                "updated_at = ? WHERE id = ?",
+                [(RUNNING, self.owner, now + LEASE_SECONDS, now, r["id"]) for r in rows],
+            )
+            conn.execute("COMMIT")
+        return [(r["id"], r["uid"], r["due_at"]) for r in rows]
+
+    def complete(self, job_id: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sign_jobs SET state = ?, lease_owner = NULL, lease_until = NULL, error = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (DONE, time.time(), job_id, self.owner),
+            )
+
+    def fail(self, job_id: str, error: str):
+        """还有重试次数则稍后重试，否则标记为 failed"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sign_jobs SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                "due_at = CASE WHEN attempts < ? THEN ? ELSE due_at END, "
+                "lease_owner = NULL, lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (MAX_ATTEMPTS, PENDING, FAILED, MAX_ATTEMPTS, now + RETRY_DELAY, error[:500], now,
+                 job_id, self.owner),
+            )
+
+    def release(self, owner: str = None):
+        """正常退出时交还本进程未完成的任务，下次启动或其他进程可立即领取"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sign_jobs SET state = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+                "lease_until = NULL, updated_at = ? WHERE state = ? AND lease_owner = ?",
+                (PENDING, time.time(), RUNNING, owner or self.owner),
+            )
+
+    def prune(self, keep_days: int = KEEP_DAYS):
+        cutoff = str(datetime.now(beijing).date() - timedelta(days=keep_days))
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sign_jobs WHERE run_date < ?", (cutoff,))
+
+    def counts(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT state, COUNT(*) AS n FROM sign_jobs WHERE run_date IN (?, ?) GROUP BY state",
+                plan_dates(),
+            ).fetchall()
+        return {r["state"]: r["n"] for r in rows}
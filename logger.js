@@ -0,0 +1,173 @@
+// logger.js - Node 脚本共用的分级缓冲日志：内存缓冲、定时异步写入、按天切分并压缩旧日志
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+const { pipeline } = require('stream/promises');
+
+const LOG_DIR = process.env.LOG_DIR || path.join(__dirname, 'logs');
+const LEVELS = { debug: 10, info: 20, warn: 30, error: 40 };
+const LEVEL = LEVELS[(process.env.LOG_LEVEL || 'info').toLowerCase()] || LEVELS.info;
+const FLUSH_INTERVAL_MS = 1000;
+const FLUSH_BYTES = 64 * 1024;
+const RETENTION_DAYS = Number(process.env.LOG_RETENTION_DAYS || 30);
+const ROTATE_QUIET_MS = 60 * 1000;           // 最近仍有写入的旧日志暂不压缩，其他进程可能还在写昨天的最后几行
+const ROTATE_LOCK = path.join(LOG_DIR, '.rotate.lock');
+const ROTATE_LOCK_STALE_MS = 10 * 60 * 1000;  // 轮转锁超过该时长视为持锁进程已崩溃
+
+fs.mkdirSync(LOG_DIR, { recursive: true });
+
+// 北京时间，与 Python 端日志保持一致
+function beijingNow() {
+  const iso = new Date(Date.now() + 8 * 3600 * 1000).toISOString();
+  return { date: iso.slice(0, 10), time: `${iso.slice(0, 10)} ${iso.slice(11, 19)}` };
+}
+
+let buffer = [];    // [date, line]
+let bufferBytes = 0;
+let unwritten = []; // 已交给异步写入、尚未确认写完的 [date, text]，按写入顺序排列
+let flushing = Promise.resolve();
+
+function write(level, message) {
+  if (LEVELS[level] < LEVEL) return;
+  const { date, time } = beijingNow();
+  const line = `[${time}] ${level === 'info' ? '' : `[${level.toUpperCase()}] `}${message}\n`;
+  buffer.push([date, line]);
+  bufferBytes += line.length;
+  if (bufferBytes >= FLUSH_BYTES) flush();
+}
+
+// 按日期分组后异步追加；串行执行保证顺序
+function flush() {
+  if (!buffer.length) return flushing;
+  const byDate = new Map();
+  for (const [date, line] of buffer) byDate.set(date, (byDate.get(date) || '') + line);
+  buffer = [];
+  bufferBytes = 0;
+  const chunks = [...byDate];
+  unwritten.push(...chunks);
+  flushing = flushing.then(async () => {
+    for (const [date, text] of chunks) {
+      try {
+        await fs.promises.appendFile(path.join(LOG_DIR, `${date}.log`), text);
+      } catch (e) {
+        process.stderr.write(`日志写入失败: ${e.message}\n`);
+      }
+      unwritten.shift();
+    }
+  });
+  return flushing;
+}
+
+// 进程退出时异步写入不会再继续：同步补写尚未确认写完的块和缓冲。
+// 退出瞬间正在写的那一块可能因此重复一次，但不会丢
+function flushSync() {
+  const chunks = unwritten.concat(buffer);
+  unwritten = [];
+  buffer = [];
+  bufferBytes = 0;
+  for (const [date, text] of chunks) {
+    try { fs.appendFileSync(path.join(LOG_DIR, `${date}.log`), text); } catch (e) { /* 忽略 */ }
+  }
+}
+
+// 轮转锁：同一时间只有一个进程压缩日志，拿不到锁就跳过，由之后的脚本完成
+async function acquireRotateLock() {
+  try {
+    await fs.promises.writeFile(ROTATE_LOCK, String(process.pid), { flag: 'wx' });
+    return true;
+  } catch (e) {
+    if (e.code !== 'EEXIST') return false;
+  }
+  try {
+    if (Date.now() - (await fs.promises.stat(ROTATE_LOCK)).mtimeMs <= ROTATE_LOCK_STALE_MS) return false;
+    // 清理崩溃进程留下的锁：先改名再确认改走的仍是旧锁，两个进程同时清理时不会误删对方刚建的锁
+    const stale = `${ROTATE_LOCK}.${process.pid}.stale`;
+    await fs.promises.rename(ROTATE_LOCK, stale);
+    const fresh = Date.now() - (await fs.promises.stat(stale)).mtimeMs <= ROTATE_LOCK_STALE_MS;
+    if (fresh) await fs.promises.link(stale, ROTATE_LOCK).catch(() => {});
+    await fs.promises.unlink(stale);
+    if (fresh) return false;
+    await fs.promises.writeFile(ROTATE_LOCK, String(process.pid), { flag: 'wx' });
+    return true;
+  } catch (e) {
+    return false;
+  }
+}
+
+async function releaseRotateLock() {
+  try {
+    if ((await fs.promises.readFile(ROTATE_LOCK, 'utf-8')) === String(process.pid)) {
+      await fs.promises.unlink(ROTATE_LOCK);
+    }
+  } catch (e) { /* 锁已被当作过期锁清理 */ }
+}
+
+// 压缩好的临时文件放到目标位置；已有压缩包时不覆盖，作为新的 gzip 成员追加在后面（zcat 会依次解压）
+async function placeArchive(tmp, dest) {
+  try {
+    await fs.promises.link(tmp, dest);
+  } catch (e) {
+    if (e.code !== 'EEXIST') throw e;
+    await fs.promises.appendFile(dest, await fs.promises.readFile(tmp));
+  }
+  await fs.promises.unlink(tmp);
+}
+
+// 压缩今天之前、且已有一段时间没有写入的 .log，删除超过保留期的日志
+async function rotate() {
+  if (!(await acquireRotateLock())) return;
+  try {
+    const { date: today } = beijingNow();
+    const expire = new Date(Date.now() + 8 * 3600 * 1000 - RETENTION_DAYS * 86400 * 1000).toISOString().slice(0, 10);
+    const files = await fs.promises.readdir(LOG_DIR);
+    for (const file of files) {
+      const m = file.match(/^(\d{4}-\d{2}-\d{2})\.log(\.gz)?$/);
+      if (!m) continue;
+      const src = path.join(LOG_DIR, file);
+      if (m[1] < expire) {
+        await fs.promises.unlink(src).catch(() => {});
+        continue;
+      }
+      if (m[2] || m[1] >= today) continue;
+      try {
+        if (Date.now() - (await fs.promises.stat(src)).mtimeMs < ROTATE_QUIET_MS) continue;
+      } catch (e) {
+        continue;
+      }
+      const tmp = `${src}.gz.${process.pid}.tmp`;
+      try {
+        await pipeline(fs.createReadStream(src), zlib.createGzip(), fs.createWriteStream(tmp));
+        await placeArchive(tmp, `${src}.gz`);
+        await fs.promises.unlink(src);
+      } catch (e) {
+        await fs.promises.unlink(tmp).catch(() => {});
+      }
+    }
+  } catch (e) {
+    /* 日志目录不可读，下次再试 */
+  } finally {
+    await releaseRotateLock();
+  }
+}
+
+const timer = setInterval(flush, FLUSH_INTERVAL_MS);
+timer.unref();
+process.on('exit', flushSync);
+
+let rotated = null;
+
+module.exports = {
+  debug: (msg) => write('debug', msg),
+  info: (msg) => write('info', msg),
+  warn: (msg) => write('warn', msg),
+  error: (msg) => write('error', msg),
+  enabled: (level) => LEVELS[level] >= LEVEL,
+  flush,
+  rotate,
+  // 脚本结束前调用：写完缓冲并完成当天的日志轮转
+  async close() {
+    rotated = rotated || rotate();
+    await rotated;
+    await flush();
+  },
+};
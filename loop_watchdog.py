@@ -0,0 +1,82 @@
+# loop_watchdog.py - 事件循环卡顿监控：循环内心跳测量延迟，独立线程发现卡顿时抓取事件循环线程的调用栈
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+from metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = 0.1                                                   # 心跳间隔（秒）
+THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "500")) / 1000
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _where(frame) -> str:
+    """调用栈中最内层的项目代码位置，作为指标标签"""
+    for fs in reversed(traceback.extract_stack(frame)):
+        if fs.filename.startswith(PROJECT_DIR) and not fs.filename.endswith("loop_watchdog.py"):
+            return f"{os.path.basename(fs.filename)}:{fs.name}"
+    return "other"
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self.beat = time.monotonic()
+        self.stalls = 0
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(INTERVAL)
+            now = time.monotonic()
+            LOOP_LAG_SECONDS.observe(max(0.0, now - start - INTERVAL))
+            self.beat = now
+
+    def _watch(self):
+        reported = None   # 已报告的卡顿对应的心跳时间，同一次卡顿只报告一次
+        while not self._stop.wait(INTERVAL):
+            beat = self.beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or reported == beat:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            where = _where(frame)
+            self.stalls += 1
+            LOOP_STALLS.inc(where=where)
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning("事件循环已阻塞 %.0f ms（%s），调用栈:\n%s", stalled * 1000, where, stack)
+
+    def start(self):
+        """在事件循环中调用"""
+        if self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("事件循环监控启动，阈值 %.0f ms", self.threshold * 1000)
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
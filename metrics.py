@@ -0,0 +1,230 @@
+# metrics.py - 进程内指标（Counter / Histogram / Gauge），以 Prometheus 文本格式通过本地 /metrics 暴露
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))     # 0 表示不开启端点
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _fmt_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _fmt_value(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}_total{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, doc, labels)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = (("le", _fmt_value(bound)),)
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+_collectors = []
+
+
+def register_collector(func):
+    """抓取时在 HTTP 线程中调用的回调，只能读取线程安全的状态；事件循环持有的对象应由循环定期写入 Gauge"""
+    _collectors.append(func)
+    return func
+
+
+def render() -> str:
+    for func in list(_collectors):
+        try:
+            func()
+        except Exception as e:
+            logger.warning("指标采集回调失败: %s", e)
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# 就绪状态快照：由事件循环定期写入，HTTP 线程只读
+_health = {"ready": False}
+
+
+def set_ready(ready: bool, **details):
+    _health.update(details, ready=ready)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/healthz":
+            self._send(200, json.dumps({"status": "ok"}), "application/json")
+        elif path == "/readyz":
+            # 负载均衡据此判断是否转发，未就绪返回 503
+            health = dict(_health)
+            health["status"] = "ready" if health.pop("ready") else "not_ready"
+            self._send(200 if health["status"] == "ready" else 503, json.dumps(health), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, text: str, content_type: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """在后台线程启动 /metrics、/healthz、/readyz；port 为 0 时不启动"""
+    global _server
+    if not port or _server:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("指标端点已启动: http://%s:%d/metrics", host, port)
+    return _server
+
+
+def stop_server():
+    global _server
+    if _server:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+
+# ========== 指标定义 ==========
+SIGN_RESULTS = Counter("nodeseek_sign_results", "签到结果数", ("site", "result"))
+COOKIE_REFRESHES = Counter("nodeseek_cookie_refreshes", "Cookie 自动刷新次数", ("site", "reason"))
+LOGIN_STAGE_SECONDS = Histogram("nodeseek_login_stage_seconds", "登录各阶段耗时", ("site", "stage"))
+SUBPROCESS_SECONDS = Histogram("nodeseek_subprocess_seconds", "Node 脚本运行耗时", ("script", "status"))
+JOB_LAG_SECONDS = Histogram("nodeseek_job_lag_seconds", "定时任务实际执行相对计划时间的延迟",
+                            buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60))
+STORE_SECONDS = Histogram("nodeseek_store_seconds", "数据文件读写耗时", ("op",),
+                          buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+TG_SEND_FAILURES = Counter("nodeseek_telegram_send_failures", "Telegram 消息最终发送失败数", ("reason",))
+TG_SENT = Counter("nodeseek_telegram_sent", "Telegram 消息发送成功数")
+SITE_RATE = Gauge("nodeseek_site_rate", "站点限速器当前速率（请求/秒）", ("site",))
+BREAKER_OPEN = Gauge("nodeseek_breaker_open", "站点熔断器状态（0 关闭 / 0.5 半开 / 1 打开）", ("site",))
+CACHE_ENTRIES = Gauge("nodeseek_cache_entries", "缓存条目数", ("cache",))
+CACHE_HITS = Gauge("nodeseek_cache_hits", "缓存累计命中次数", ("cache",))
+PENDING_DELETES = Gauge("nodeseek_pending_deletes", "等待自动删除的消息数")
+LOOP_LAG_SECONDS = Histogram("nodeseek_loop_lag_seconds", "事件循环调度延迟",
+                             buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 30))
+LOOP_STALLS = Counter("nodeseek_loop_stalls", "事件循环阻塞超过阈值的次数", ("where",))
+SHARD_WORKERS = Gauge("nodeseek_shard_workers", "在线的分片工作进程数")
+SHARD_CALLS = Counter("nodeseek_shard_calls", "分发给分片工作进程的调用数", ("worker", "status"))
+SIGN_QUEUE = Gauge("nodeseek_sign_queue", "今明两天定时签到任务数", ("state",))
+LANE_QUEUE = Gauge("nodeseek_lane_queue", "各优先级通道等待 Node 名额的请求数", ("lane",))
+LANE_WAIT_SECONDS = Histogram("nodeseek_lane_wait_seconds", "各优先级通道等待 Node 名额的时间", ("lane",),
+                              buckets=(0.01, 0.1, 0.5, 1, 5, 15, 30, 60, 120, 300))
+QUARANTINED = Gauge("nodeseek_quarantined_accounts", "登录多次失败、暂停自动登录的账号数")
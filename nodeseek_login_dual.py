@@ -2,29 +2,38 @@
 import os
 import time
 import json
-from typing import Optional
+from typing import Optional, Tuple
 from curl_cffi import requests
 from dotenv import load_dotenv
+from site_limiter import get_limiter, is_throttled
+from metrics import LOGIN_STAGE_SECONDS
+from tracing import traced
+from retry_policy import retry_call
 
 # 加载配置
 load_dotenv()
 
-# 网站配置
+# 网站配置（NS_BASE_URL / DF_BASE_URL 可指向本地模拟站点，用于压测）
+NS_BASE_URL = os.getenv("NS_BASE_URL", "https://www.nodeseek.com")
+DF_BASE_URL = os.getenv("DF_BASE_URL", "https://www.deepflood.com")
+
 SITES_CONFIG = {
     "ns": {
         "name": "NodeSeek",
         "domain": "www.nodeseek.com",
-        "login_url": "https://www.nodeseek.com/signIn.html",
-        "api_signin": "https://www.nodeseek.com/api/account/signIn",
-        "attendance_url": "https://www.nodeseek.com/api/attendance",
+        "base_url": NS_BASE_URL,
+        "login_url": f"{NS_BASE_URL}/signIn.html",
+        "api_signin": f"{NS_BASE_URL}/api/account/signIn",
+        "attendance_url": f"{NS_BASE_URL}/api/attendance",
         "sitekey": "0x4AAAAAAAaNy7leGjewpVyR"
     },
     "df": {
         "name": "DeepFlood", 
         "domain": "www.deepflood.com",
-        "login_url": "https://www.deepflood.com/signIn.html",
-        "api_signin": "https://www.deepflood.com/api/account/signIn",
-        "attendance_url": "https://www.deepflood.com/api/attendance",
+        "base_url": DF_BASE_URL,
+        "login_url": f"{DF_BASE_URL}/signIn.html",
+        "api_signin": f"{DF_BASE_URL}/api/account/signIn",
+        "attendance_url": f"{DF_BASE_URL}/api/attendance",
         "sitekey": "0x4AAAAAAAaNy7leGjewpVyR"  # 假设使用相同的 sitekey，实际可能不同
     }
 }
@@ -128,6 +137,18 @@ def get_cookies_from_flaresolverr(url: str, flaresolverr_url: str = FLARESOLVERR
         return {}
 
 
+# 站点对 Turnstile token 的报错（过期、无效、校验失败）属于验证码服务的问题，不是账号密码错误
+TOKEN_ERROR_MARKERS = ("验证码", "人机验证", "token", "turnstile", "captcha")
+
+
+def signin_failure_reason(j: dict) -> str:
+    """signIn 返回 success:false 时区分原因：验证码问题为 solver，其余视为站点拒绝登录"""
+    message = str(j.get("message") or j.get("msg") or "").lower()
+    if any(marker in message for marker in TOKEN_ERROR_MARKERS):
+        return "solver"
+    return "rejected"
+
+
 def login_and_get_cookie(user: str, password: str, site_type: str = "ns") -> Optional[str]:
     """
     登录并获取 Cookie
@@ -140,26 +161,40 @@ def login_and_get_cookie(user: str, password: str, site_type: str = "ns") -> Opt
     Returns:
         Cookie 字符串或 None
     """
+    return login_with_reason(user, password, site_type)[0]
+
+
+@traced("login")
+def login_with_reason(user: str, password: str, site_type: str = "ns") -> Tuple[Optional[str], str]:
+    """
+    登录并返回 (Cookie, 原因)
+
+    原因: ok / solver(验证码服务失败) / throttled(风控) / network(请求异常) / server(5xx) / rejected(站点拒绝登录) / unsupported
+    """
     if site_type not in SITES_CONFIG:
         print(f"❌ 不支持的网站类型: {site_type}")
-        return None
+        return None, "unsupported"
     
     config = SITES_CONFIG[site_type]
     print(f"🔐 开始登录 {config['name']} ({config['domain']})...")
     
     # 1. 先尝试 FlareSolverr
-    flare_cookies = get_cookies_from_flaresolverr(config["login_url"])
+    with LOGIN_STAGE_SECONDS.time(site=site_type, stage="flaresolverr"):
+        flare_cookies = get_cookies_from_flaresolverr(config["login_url"])
 
     # 2. 获取 Turnstile token
-    token = solve_turnstile_token(API_BASE_URL, CLIENT_KEY, config["login_url"], config["sitekey"])
+    with LOGIN_STAGE_SECONDS.time(site=site_type, stage="turnstile"):
+        token = solve_turnstile_token(API_BASE_URL, CLIENT_KEY, config["login_url"], config["sitekey"])
     if not token:
-        return None
+        return None, "solver"
 
     # 3. 初始化 session 并注入 cookies
     s = get_session()
+    limiter = get_limiter(site_type)
     
     # 先访问登录页面
     try:
+        limiter.acquire()
         s.get(config["login_url"], timeout=15)
     except Exception as e:
         print(f"[WARN] 初始访问 {config['name']} 登录页失败: {e}")
@@ -170,7 +205,7 @@ def login_and_get_cookie(user: str, password: str, site_type: str = "ns") -> Opt
 
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
-        "Origin": f"https://{config['domain']}",
+        "Origin": config["base_url"],
         "Referer": config["login_url"],
         "Content-Type": "application/json",
     }
@@ -186,30 +221,53 @@ def login_and_get_cookie(user: str, password: str, site_type: str = "ns") -> Opt
     else:
         payload["username"] = user
 
-    # 4. 登录请求
-    try:
-        print(f"📤 发送登录请求到 {config['name']}...")
-        resp = s.post(config["api_signin"], json=payload, headers=headers, timeout=30)
-        j = resp.json()
-    except Exception as e:
-        print(f"❌ {config['name']} 登录异常:", e)
-        return None
+    # 4. 登录请求：网络异常和 5xx 只重发这一步，不重新打码；token 已被用掉时站点会报 token 错误，由上层重新打码
+    def post_signin():
+        try:
+            limiter.acquire()
+            with LOGIN_STAGE_SECONDS.time(site=site_type, stage="signin"):
+                resp = s.post(config["api_signin"], json=payload, headers=headers, timeout=30)
+        except Exception as e:
+            print(f"❌ {config['name']} 登录异常:", e)
+            return None, "network"
+        if is_throttled(resp.status_code, resp.text):
+            limiter.on_throttle()
+            print(f"🚫 {config['name']} 登录被风控拦截 (HTTP {resp.status_code})，当前速率 {limiter.rate:.2f}/s")
+            return None, "throttled"
+        limiter.on_success()
+        try:
+            return resp.json(), None
+        except ValueError:
+            print(f"❌ {config['name']} 登录响应无法解析 (HTTP {resp.status_code})")
+            return None, "server"
+
+    print(f"📤 发送登录请求到 {config['name']}...")
+    j, error_class = retry_call(post_signin, lambda r: r[1])
+    if j is None:
+        return None, error_class
 
     if j.get("success"):
         print(f"✅ {config['name']} 登录成功，获取完整 cookies...")
-        try:
-            # 访问主页和用户资料页面以获取完整 cookies
-            s.get(f"https://{config['domain']}/", headers=headers, timeout=30)
-            s.get(f"https://{config['domain']}/user/profile", headers=headers, timeout=30)
-        except Exception as e:
-            print(f"[WARN] 拉取 {config['name']} 用户信息时失败: {e}")
+
+        # 访问主页和用户资料页面以获取完整 cookies，失败时只重试这一步
+        def fetch_profile():
+            try:
+                with LOGIN_STAGE_SECONDS.time(site=site_type, stage="profile"):
+                    s.get(f"{config['base_url']}/", headers=headers, timeout=30)
+                    s.get(f"{config['base_url']}/user/profile", headers=headers, timeout=30)
+                return None
+            except Exception as e:
+                print(f"[WARN] 拉取 {config['name']} 用户信息时失败: {e}")
+                return "network"
+
+        retry_call(fetch_profile, lambda r: r)
         
         cookies = cookie_string_from_session(s, important_only=False)
         print(f"🍪 {config['name']} Cookie 获取成功")
-        return cookies
+        return cookies, "ok"
     else:
         print(f"❌ {config['name']} 登录失败：", j)
-        return None
+        return None, signin_failure_reason(j)
 
 
 def cookie_valid(ns_cookie: str, site_type: str = "ns") -> bool:
@@ -227,9 +285,15 @@ def cookie_valid(ns_cookie: str, site_type: str = "ns") -> bool:
         return False
     
     config = SITES_CONFIG[site_type]
+    limiter = get_limiter(site_type)
     
     try:
+        limiter.acquire()
         r = requests.get(config["attendance_url"], headers={"Cookie": ns_cookie}, timeout=20)
+        if is_throttled(r.status_code, r.text):
+            limiter.on_throttle()
+        else:
+            limiter.on_success()
         return r.status_code not in (401, 403)
     except Exception:
         return False
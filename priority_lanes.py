@@ -0,0 +1,115 @@
+# priority_lanes.py - 签到引擎的优先级通道：手动操作优先于定时批量签到，按权重公平分配 Node 进程名额，等待过久的请求优先放行
+import os
+import asyncio
+from time import monotonic
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from metrics import LANE_WAIT_SECONDS
+
+INTERACTIVE = "interactive"   # 用户手动 /check、/stats、/log
+SCHEDULED = "scheduled"       # 定时签到
+BACKGROUND = "background"     # 熔断补签等后台任务
+
+LANE_WEIGHTS = {
+    INTERACTIVE: int(os.getenv("LANE_WEIGHT_INTERACTIVE", "8")),
+    SCHEDULED: int(os.getenv("LANE_WEIGHT_SCHEDULED", "3")),
+    BACKGROUND: int(os.getenv("LANE_WEIGHT_BACKGROUND", "1")),
+}
+LANE_MAX_WAIT = float(os.getenv("LANE_MAX_WAIT", "60"))   # 等待超过该秒数的请求不论通道优先放行
+
+# 当前代码所属通道，随 asyncio 任务和 to_thread 传递；处理器里默认为 interactive
+current_lane = ContextVar("sign_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def use_lane(lane: str):
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class PriorityGate:
+    """带优先级的信号量：空闲名额按步幅调度（stride scheduling）在各通道间按权重分配"""
+
+    def __init__(self, capacity: int, weights: dict = LANE_WEIGHTS, max_wait: float = LANE_MAX_WAIT):
+        self.capacity = capacity
+        self.weights = weights
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.vtime = 0.0
+        self.waiters = {lane: deque() for lane in weights}   # lane -> deque[(入队时间, future)]
+        self.passes = {lane: 0.0 for lane in weights}
+        self.served = {lane: 0 for lane in weights}
+
+    def _charge(self, lane: str):
+        self.vtime = self.passes[lane]
+        self.passes[lane] += 1 / max(self.weights[lane], 1)
+        self.served[lane] += 1
+
+    def _pick(self):
+        lanes = [lane for lane, q in self.waiters.items() if q]
+        if not lanes:
+            return None
+        oldest = min(lanes, key=lambda lane: self.waiters[lane][0][0])
+        if monotonic() - self.waiters[oldest][0][0] >= self.max_wait:
+            return oldest
+        return min(lanes, key=lambda lane: self.passes[lane])
+
+    def _wake(self):
+        while self.in_use < self.capacity:
+            lane = self._pick()
+            if lane is None:
+                return
+            _, fut = self.waiters[lane].popleft()
+            if fut.done():
+                continue
+            self.in_use += 1
+            self._charge(lane)
+            fut.set_result(None)
+
+    async def acquire(self, lane: str = None):
+        lane = lane or current_lane.get()
+        if lane not in self.waiters:
+            lane = INTERACTIVE
+        if self.in_use < self.capacity and not any(self.waiters.values()):
+            self.in_use += 1
+            self._charge(lane)
+            LANE_WAIT_SECONDS.observe(0, lane=lane)
+            return
+
+        queue = self.waiters[lane]
+        if not queue:
+            # 空闲了一段时间的通道不能攒下额度一次性抢占
+            self.passes[lane] = max(self.passes[lane], self.vtime)
+        entry = (monotonic(), asyncio.get_running_loop().create_future())
+        queue.append(entry)
+        try:
+            await entry[1]
+        except asyncio.CancelledError:
+            if entry[1].done() and not entry[1].cancelled():
+                self.release()
+            elif entry in queue:
+                queue.remove(entry)
+            raise
+        LANE_WAIT_SECONDS.observe(monotonic() - entry[0], lane=lane)
+
+    def release(self):
+        self.in_use -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = None):
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            lane: {"queued": len(q), "served": self.served[lane]}
+            for lane, q in self.waiters.items()
+        }
@@ -0,0 +1,77 @@
+# quarantine.py - 登录屡次失败的账号（密码错误、被封禁等）按指数退避暂停自动登录，避免每天白白消耗验证码和 FlareSolverr 额度
+import os
+import json
+import time
+import tempfile
+import threading
+
+STATE_FILE = "./data/quarantine.json"
+
+QUARANTINE_AFTER = int(os.getenv("QUARANTINE_AFTER", "2"))             # 连续失败几次后开始暂停
+QUARANTINE_BASE = int(os.getenv("QUARANTINE_BASE_HOURS", "12")) * 3600  # 第一次暂停时长，之后每次翻倍
+QUARANTINE_MAX = int(os.getenv("QUARANTINE_MAX_DAYS", "14")) * 86400
+
+
+class Quarantine:
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}   # "站点:账号" -> {"failures", "reason", "until", "notified"}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def blocked(self, site_type: str, acc_name: str):
+        """暂停期内返回记录，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(f"{site_type}:{acc_name}")
+            if entry and entry.get("until", 0) > time.time():
+                return dict(entry)
+            return None
+
+    def record_failure(self, site_type: str, acc_name: str, reason: str) -> dict:
+        """记一次账号本身导致的失败；达到阈值后暂停，时长按次数指数增长"""
+        with self._lock:
+            entry = self._entries.setdefault(f"{site_type}:{acc_name}", {"failures": 0, "until": 0})
+            entry["failures"] += 1
+            entry["reason"] = reason
+            if entry["failures"] >= QUARANTINE_AFTER:
+                duration = min(QUARANTINE_BASE * 2 ** (entry["failures"] - QUARANTINE_AFTER), QUARANTINE_MAX)
+                entry["until"] = time.time() + duration
+                entry["notified"] = False
+            self._save()
+            return dict(entry)
+
+    def record_success(self, site_type: str, acc_name: str):
+        with self._lock:
+            if self._entries.pop(f"{site_type}:{acc_name}", None) is not None:
+                self._save()
+
+    def take_unnotified(self) -> dict:
+        """取出新进入暂停、还没通知过的账号，并标记为已通知"""
+        with self._lock:
+            now = time.time()
+            fresh = {
+                key: dict(entry) for key, entry in self._entries.items()
+                if entry.get("until", 0) > now and not entry.get("notified", True)
+            }
+            for key in fresh:
+                self._entries[key]["notified"] = True
+            if fresh:
+                self._save()
+            return fresh
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.time()
+            return {"quarantined": sum(1 for e in self._entries.values() if e.get("until", 0) > now),
+                    "tracked": len(self._entries)}
@@ -0,0 +1,61 @@
+// retry_policy.js - 重试策略：按错误类别决定是否重试和退避时长（指数退避 + 抖动），每批次共享一个重试预算
+// 签到、统计脚本共用；类别和默认值与 Python 端 retry_policy.py 保持一致
+
+// retries: 最多重试次数；baseMs/maxMs: 第 n 次重试前等待 random(0, min(maxMs, baseMs * 2^(n-1)))
+const POLICIES = {
+  network: { retries: 3, baseMs: 500, maxMs: 8000 },    // 请求异常、超时：值得重试
+  server: { retries: 2, baseMs: 1000, maxMs: 8000 },    // 5xx
+  rejected: { retries: 1, baseMs: 1000, maxMs: 4000 },  // 站点返回失败信息
+  solver: { retries: 1, baseMs: 2000, maxMs: 10000 },   // 验证码服务失败（登录）
+  throttled: { retries: 0 },                            // 风控：重试只会更糟
+  auth: { retries: 0 },                                 // Cookie 失效 / 密码错误：重试无意义
+};
+
+// 每批次最多重试 max(RETRY_BUDGET_MIN, 请求数 × RETRY_BUDGET_RATIO) 次，故障期间不会把请求量放大
+const BUDGET_RATIO = Number(process.env.RETRY_BUDGET_RATIO || 0.2);
+const BUDGET_MIN = Number(process.env.RETRY_BUDGET_MIN || 3);
+
+class RetryBudget {
+  constructor(requests) {
+    this.total = Math.max(BUDGET_MIN, Math.ceil(requests * BUDGET_RATIO));
+    this.used = 0;
+    this.denied = 0;
+  }
+
+  tryConsume() {
+    if (this.used >= this.total) {
+      this.denied++;
+      return false;
+    }
+    this.used++;
+    return true;
+  }
+
+  stats() {
+    return { total: this.total, used: this.used, denied: this.denied };
+  }
+}
+
+function backoffMs(errorClass, attempt) {
+  const policy = POLICIES[errorClass];
+  const cap = Math.min(policy.maxMs, policy.baseMs * 2 ** (attempt - 1));
+  return Math.floor(Math.random() * cap);
+}
+
+// attempt 为已进行的次数（从 1 开始）
+function shouldRetry(errorClass, attempt, budget) {
+  const policy = POLICIES[errorClass];
+  if (!policy || attempt > policy.retries) return false;
+  return budget ? budget.tryConsume() : true;
+}
+
+// fn(attempt) 返回 [结果, 错误类别]，类别为 null 表示无需重试；返回最后一次的结果
+async function withRetry(fn, budget) {
+  for (let attempt = 1; ; attempt++) {
+    const [result, errorClass] = await fn(attempt);
+    if (!errorClass || !shouldRetry(errorClass, attempt, budget)) return result;
+    await new Promise(res => setTimeout(res, backoffMs(errorClass, attempt)));
+  }
+}
+
+module.exports = { POLICIES, RetryBudget, backoffMs, shouldRetry, withRetry };
@@ -0,0 +1,102 @@
+# retry_policy.py - 重试策略：按错误类别决定是否重试和退避时长（指数退避 + 抖动），每批次共享一个重试预算
+# 类别和默认值与 Node 端 retry_policy.js 保持一致，修改时两边同步
+import os
+import math
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# retries: 最多重试次数；base/cap: 第 n 次重试前等待 random(0, min(cap, base * 2^(n-1))) 秒
+POLICIES = {
+    "network": {"retries": 3, "base": 0.5, "cap": 8},     # 请求异常、超时：值得重试
+    "server": {"retries": 2, "base": 1, "cap": 8},        # 5xx
+    "rejected": {"retries": 1, "base": 1, "cap": 4},      # 站点返回失败信息
+    "solver": {"retries": 1, "base": 2, "cap": 10},       # 验证码服务失败（登录）
+    "throttled": {"retries": 0},                          # 风控：重试只会更糟
+    "auth": {"retries": 0},                               # Cookie 失效 / 密码错误：重试无意义
+}
+
+# 登录失败原因 -> 整个登录流程是否重来。只有验证码失败需要重新打码；网络异常、5xx 在
+# nodeseek_login_dual 里只重发失败的那一步，风控和站点拒绝登录（账号问题）不重试
+LOGIN_REASON_CLASS = {
+    "solver": "solver",
+}
+
+# 每批次最多重试 max(RETRY_BUDGET_MIN, 请求数 × RETRY_BUDGET_RATIO) 次，故障期间不会把请求量放大
+BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+BUDGET_MIN = int(os.getenv("RETRY_BUDGET_MIN", "3"))
+
+
+class RetryBudget:
+    def __init__(self, requests: int):
+        self.total = max(BUDGET_MIN, math.ceil(requests * BUDGET_RATIO))
+        self.used = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def try_consume(self) -> bool:
+        with self._lock:
+            if self.used >= self.total:
+                self.denied += 1
+                return False
+            self.used += 1
+            return True
+
+    def stats(self) -> dict:
+        return {"total": self.total, "used": self.used, "denied": self.denied}
+
+
+# 当前批次的预算，随 asyncio 任务和 to_thread 传递；没有批次时每次调用单独计算
+current_budget = ContextVar("retry_budget", default=None)
+
+
+@contextmanager
+def use_budget(requests: int):
+    budget = RetryBudget(requests)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_budget.reset(token)
+
+
+def backoff(error_class: str, attempt: int) -> float:
+    policy = POLICIES[error_class]
+    return random.uniform(0, min(policy["cap"], policy["base"] * 2 ** (attempt - 1)))
+
+
+def should_retry(error_class: str, attempt: int, budget: RetryBudget = None) -> bool:
+    """attempt 为已进行的次数（从 1 开始）"""
+    policy = POLICIES.get(error_class)
+    if not policy or attempt > policy["retries"]:
+        return False
+    return budget.try_consume() if budget else True
+
+
+async def with_retry(fn, classify, budget: RetryBudget = None):
+    """反复调用 fn()，classify(结果) 返回错误类别（None 表示无需重试）；返回最后一次的结果"""
+    budget = budget or current_budget.get() or RetryBudget(1)
+    attempt = 1
+    while True:
+        result = await fn()
+        error_class = classify(result)
+        if not error_class or not should_retry(error_class, attempt, budget):
+            return result
+        await asyncio.sleep(backoff(error_class, attempt))
+        attempt += 1
+
+
+def retry_call(fn, classify, budget: RetryBudget = None):
+    """with_retry 的同步版本，供在线程中运行的登录流程使用"""
+    budget = budget or current_budget.get() or RetryBudget(1)
+    attempt = 1
+    while True:
+        result = fn()
+        error_class = classify(result)
+        if not error_class or not should_retry(error_class, attempt, budget):
+            return result
+        time.sleep(backoff(error_class, attempt))
+        attempt += 1
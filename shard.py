@@ -0,0 +1,230 @@
+# shard.py - 协调者/工作进程分片：按 uid 一致性哈希把签到、统计、登录任务分发到多个工作进程（本机或远程）
+import os
+import sys
+import json
+import hmac
+import bisect
+import socket
+import asyncio
+import hashlib
+import logging
+import secrets
+import subprocess
+import httpx
+from metrics import SHARD_WORKERS, SHARD_CALLS
+
+logger = logging.getLogger(__name__)
+
+SHARD_WORKERS_ENV = os.getenv("SHARD_WORKERS", "")                    # 远程工作进程地址，逗号分隔
+SHARD_LOCAL_WORKERS = int(os.getenv("SHARD_LOCAL_WORKERS", "0"))      # 本机启动的工作进程数
+SHARD_SECRET = os.getenv("SHARD_SECRET", "")
+# 远程节点必须与本机挂载同一个 data/（限速器共享速率和收益账本都在里面），确认后设为 1 才会启用
+SHARD_SHARED_DATA = os.getenv("SHARD_SHARED_DATA", "0") == "1"
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "100"))                 # 每个节点在环上的虚拟节点数
+SHARD_HEALTH_INTERVAL = float(os.getenv("SHARD_HEALTH_INTERVAL", "5"))
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性哈希环：节点增减时只有相邻区间的 uid 换归属"""
+
+    def __init__(self, vnodes: int = SHARD_VNODES):
+        self.vnodes = vnodes
+        self._points = []   # 已排序的哈希值
+        self._owners = {}   # 哈希值 -> 节点
+        self.nodes = set()
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            h = _hash(f"{node}#{i}")
+            self._owners[h] = node
+            bisect.insort(self._points, h)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [h for h in self._points if self._owners[h] != node]
+        self._owners = {h: n for h, n in self._owners.items() if n != node}
+
+    def node_for(self, key: str):
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+
+class WorkerDown(Exception):
+    pass
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ShardRouter:
+    """协调者一侧：维护工作进程成员、按 uid 拆分任务并合并结果；工作进程不可用时回落到本进程执行"""
+
+    def __init__(self, workers=(), local_workers: int = 0, secret: str = SHARD_SECRET,
+                 shared_data: bool = SHARD_SHARED_DATA):
+        self.configured = [w.rstrip("/") for w in workers if w]
+        if self.configured and not shared_data:
+            # 各节点各有一份限速状态和账本时，站点请求速率按节点数翻倍，账本也会分散在各节点
+            logger.warning("未设置 SHARD_SHARED_DATA=1，忽略远程工作进程: %s", ", ".join(self.configured))
+            self.configured = []
+        self.local_workers = local_workers
+        self.secret = secret
+        self.ring = HashRing()
+        self._procs = []
+        self._client = None
+        self._health_task = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.configured)
+
+    async def start(self):
+        if self.local_workers and not self.secret:
+            # 本机工作进程监听回环地址，本机其他用户也能访问，没有配置时生成随机 secret
+            self.secret = secrets.token_hex(16)
+        for _ in range(self.local_workers):
+            port = _free_port()
+            proc = subprocess.Popen(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "shard_worker.py"),
+                 "--host", "127.0.0.1", "--port", str(port)],
+                env=dict(os.environ, SHARD_SECRET=self.secret),
+            )
+            self._procs.append(proc)
+            self.configured.append(f"http://127.0.0.1:{port}")
+        if not self.configured:
+            return
+        self._client = httpx.AsyncClient(headers={"X-Shard-Secret": self.secret}, timeout=10)
+        await self.check_health()
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            try:
+                await asyncio.to_thread(proc.wait, 10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._procs.clear()
+
+    # ---------- 成员 ----------
+    def _join(self, worker: str):
+        if worker not in self.ring.nodes:
+            self.ring.add(worker)
+            logger.info("分片工作进程加入: %s（共 %d 个）", worker, len(self.ring.nodes))
+        SHARD_WORKERS.set(len(self.ring.nodes))
+
+    def _leave(self, worker: str, reason: str):
+        if worker in self.ring.nodes:
+            self.ring.remove(worker)
+            logger.warning("分片工作进程离开: %s（%s），剩余 %d 个", worker, reason, len(self.ring.nodes))
+        SHARD_WORKERS.set(len(self.ring.nodes))
+
+    async def _probe(self, worker: str):
+        try:
+            r = await self._client.get(f"{worker}/healthz", timeout=3)
+            if r.status_code == 200:
+                self._join(worker)
+                return
+            self._leave(worker, f"HTTP {r.status_code}")
+        except httpx.HTTPError as e:
+            self._leave(worker, type(e).__name__)
+
+    async def check_health(self):
+        await asyncio.gather(*(self._probe(w) for w in self.configured))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(SHARD_HEALTH_INTERVAL)
+            await self.check_health()
+
+    def owner(self, uid: str):
+        return self.ring.node_for(str(uid))
+
+    # ---------- 调用 ----------
+    async def _post(self, worker: str, path: str, body: dict, timeout: float) -> dict:
+        try:
+            r = await self._client.post(f"{worker}{path}", json=body, timeout=timeout)
+        except httpx.HTTPError as e:
+            self._leave(worker, type(e).__name__)
+            SHARD_CALLS.inc(worker=worker, status="down")
+            raise WorkerDown(worker) from e
+        if r.status_code != 200:
+            SHARD_CALLS.inc(worker=worker, status="error")
+            raise WorkerDown(f"{worker} HTTP {r.status_code}")
+        SHARD_CALLS.inc(worker=worker, status="ok")
+        return r.json()
+
+    async def run_node(self, script: str, payload: dict, timeout: int, local_run, slots):
+        """按 uid 拆分 payload["targets"]，分发给各自的工作进程后合并 stdout；失败的部分在本进程执行。
+        slots(part, host) 返回占用 host（None 为本机）名额的异步上下文，每份任务只占用执行它的位置的名额"""
+        parts = {}
+        for uid, sites in payload.get("targets", {}).items():
+            parts.setdefault(self.owner(uid), {})[uid] = sites
+
+        async def run_part(worker, targets):
+            part = {**payload, "targets": targets}
+            if worker:
+                try:
+                    async with slots(part, worker):
+                        res = await self._post(worker, "/run",
+                                               {"script": script, "payload": part, "timeout": timeout}, timeout + 10)
+                    if res.get("timeout"):
+                        raise subprocess.TimeoutExpired(script, timeout)
+                    return subprocess.CompletedProcess(script, res["returncode"], res["stdout"], res["stderr"])
+                except WorkerDown as e:
+                    logger.warning("分片 %s 执行失败，改为本机执行: %s", worker, e)
+            async with slots(part, None):
+                return await local_run(script, part, timeout)
+
+        procs = await asyncio.gather(*(run_part(w, t) for w, t in parts.items()))
+        failed = [p for p in procs if p.returncode != 0]
+        if failed:
+            return subprocess.CompletedProcess(script, failed[0].returncode, "", "\n".join(p.stderr for p in failed))
+        merged = {}
+        for p in procs:
+            merged.update(json.loads(p.stdout))
+        return subprocess.CompletedProcess(script, 0, json.dumps(merged, ensure_ascii=False), "")
+
+    async def login(self, uid: str, username: str, password: str, site_type: str, local_login):
+        worker = self.owner(uid)
+        if worker:
+            try:
+                res = await self._post(worker, "/login",
+                                       {"username": username, "password": password, "site_type": site_type}, 300)
+                return res.get("cookie"), res.get("reason", "error")
+            except WorkerDown as e:
+                logger.warning("分片 %s 登录失败，改为本机执行: %s", worker, e)
+        return await asyncio.to_thread(local_login, username, password, site_type)
+
+    def stats(self) -> dict:
+        return {"configured": len(self.configured), "alive": len(self.ring.nodes)}
+
+
+def check_secret(received: str, secret: str = SHARD_SECRET) -> bool:
+    """未配置 secret 时拒绝所有请求"""
+    if not secret:
+        return False
+    return hmac.compare_digest((received or "").encode(), secret.encode())
+
+
+router = ShardRouter(SHARD_WORKERS_ENV.split(","), SHARD_LOCAL_WORKERS)
@@ -0,0 +1,123 @@
+# shard_worker.py - 分片工作进程：接收协调者（bot.py）分发的 Node 脚本和登录任务并在本机执行
+#
+# 用法：
+#   python shard_worker.py --host 0.0.0.0 --port 9200      # 远程节点，需配置 SHARD_SECRET，且与协调者共用同一个 data/
+# 协调者一侧在 SHARD_WORKERS 中列出各节点地址，或用 SHARD_LOCAL_WORKERS 在本机自动启动。
+import os
+import json
+import logging
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from nodeseek_login_dual import login_with_reason
+from shard import check_secret, SHARD_SECRET
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCRIPTS = ("sign_dual.js", "stats_dual.js")
+NODE_CONCURRENCY = int(os.getenv("NODE_CONCURRENCY", str(os.cpu_count() or 4)))
+node_slots = threading.BoundedSemaphore(NODE_CONCURRENCY)
+inflight = {"run": 0, "login": 0}
+inflight_lock = threading.Lock()
+
+
+def run_script(script: str, payload: dict, timeout: int) -> dict:
+    with node_slots:
+        try:
+            proc = subprocess.run(
+                ["node", script, json.dumps(payload, ensure_ascii=False)],
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return {"timeout": True}
+    return {"returncode": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
+
+
+def do_login(body: dict) -> dict:
+    cookie, reason = login_with_reason(body["username"], body["password"], body.get("site_type", "ns"))
+    return {"cookie": cookie, "reason": reason}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/healthz":
+            self._reply(404, {"ok": False})
+            return
+        with inflight_lock:
+            self._reply(200, {"status": "ok", **inflight})
+
+    def do_POST(self):
+        if not check_secret(self.headers.get("X-Shard-Secret")):
+            self._reply(403, {"ok": False})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        except ValueError:
+            self._reply(400, {"ok": False})
+            return
+
+        path = self.path.split("?")[0]
+        if path == "/run":
+            if body.get("script") not in SCRIPTS:
+                self._reply(400, {"ok": False})
+                return
+            kind, work = "run", lambda: run_script(body["script"], body["payload"], int(body.get("timeout", 60)))
+        elif path == "/login":
+            kind, work = "login", lambda: do_login(body)
+        else:
+            self._reply(404, {"ok": False})
+            return
+
+        with inflight_lock:
+            inflight[kind] += 1
+        try:
+            self._reply(200, work())
+        except Exception as e:
+            logger.error("分片任务 %s 执行异常: %s", kind, e)
+            self._reply(500, {"ok": False, "error": str(e)})
+        finally:
+            with inflight_lock:
+                inflight[kind] -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片工作进程")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    args = parser.parse_args()
+
+    if not SHARD_SECRET:
+        raise SystemExit("❌ 必须配置 SHARD_SECRET（SHARD_LOCAL_WORKERS 启动的本机工作进程会自动生成）")
+
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.daemon_threads = True
+    logger.info("分片工作进程已启动: http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
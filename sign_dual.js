@@ -1,46 +1,30 @@
 // sign_dual.js - 支持双网站的签到脚本
-const fs = require('fs');
-const path = require('path');
 const cloudscraper = require('cloudscraper');
+const { getLimiter, limiterStats, saveLimiterState, isThrottled } = require('./site_limiter');
+const log = require('./logger');
+const { RetryBudget, withRetry } = require('./retry_policy');
 
-const LOG_DIR = path.join(__dirname, 'logs');
-if (!fs.existsSync(LOG_DIR)) fs.mkdirSync(LOG_DIR);
-
-// 网站配置
+// 网站配置（NS_BASE_URL / DF_BASE_URL 可指向本地模拟站点，用于压测）
 const SITES_CONFIG = {
   ns: {
     name: 'NodeSeek',
     domain: 'www.nodeseek.com',
-    baseUrl: 'https://www.nodeseek.com',
+    baseUrl: process.env.NS_BASE_URL || 'https://www.nodeseek.com',
     emoji: '🔵'
   },
   df: {
     name: 'DeepFlood',
     domain: 'www.deepflood.com', 
-    baseUrl: 'https://www.deepflood.com',
+    baseUrl: process.env.DF_BASE_URL || 'https://www.deepflood.com',
     emoji: '🟢'
   }
 };
 
-function writeLog(message) {
-  const filePath = path.join(LOG_DIR, `${new Date().toLocaleDateString('sv-SE')}.log`);
-  const time = new Date().toLocaleString('zh-CN', { hour12: false });
-  fs.appendFileSync(filePath, `[${time}] ${message}\n`);
-}
-
-function chunkString(str, length = 1000) {
-  const chunks = [];
-  for (let i = 0; i < str.length; i += length) {
-    chunks.push(str.slice(i, i + length));
-  }
-  return chunks;
-}
-
-async function signSingle(name, cookie, siteType = 'ns', randomMode = false) {
+async function signSingle(name, cookie, siteType = 'ns', randomMode = false, budget = null) {
   const siteConfig = SITES_CONFIG[siteType];
   if (!siteConfig) {
     const errorMsg = `❌ 不支持的网站类型: ${siteType}`;
-    writeLog(errorMsg);
+    log.error(errorMsg);
     return { name, result: errorMsg, time: new Date().toLocaleString(), site_type: siteType };
   }
 
@@ -49,14 +33,15 @@ async function signSingle(name, cookie, siteType = 'ns', randomMode = false) {
     ? cookie.slice(0, 8) + '...' + cookie.slice(-5)
     : cookie;
 
-  const maxRetries = 3;
-  let lastErrorResult = null;
+  const limiter = getLimiter(siteType);
+  const done = (msg) => ({ name, result: msg, time: new Date().toLocaleString(), site_type: siteType });
 
-  for (let attempt = 1; attempt <= maxRetries; attempt++) {
-    writeLog(`==== 开始签到: ${siteConfig.emoji} ${siteConfig.name} - ${name} (第 ${attempt} 次尝试) ====`);
-    writeLog(`请求 URL: ${url}`);
-    writeLog(`使用 Cookie(部分隐藏): ${maskedCookie}`);
-    writeLog(`随机模式: ${randomMode}`);
+  // 单次请求，返回 [结果, 错误类别]；是否重试、等多久由 retry_policy 决定
+  const attemptSign = async (attempt) => {
+    log.info(`==== 开始签到: ${siteConfig.emoji} ${siteConfig.name} - ${name} (第 ${attempt} 次尝试) ====`);
+    log.debug(`请求 URL: ${url}`);
+    log.debug(`使用 Cookie(部分隐藏): ${maskedCookie}`);
+    log.debug(`随机模式: ${randomMode}`);
 
     const headers = {
       'Accept': '*/*',
@@ -69,6 +54,7 @@ async function signSingle(name, cookie, siteType = 'ns', randomMode = false) {
     };
 
     try {
+      await limiter.acquire();
       const res = await cloudscraper.post({
         uri: url,
         headers,
@@ -79,79 +65,81 @@ async function signSingle(name, cookie, siteType = 'ns', randomMode = false) {
       });
 
       const text = res.body;
-      writeLog(`响应正文长度: ${text.length}`);
+      log.debug(`响应正文长度: ${text.length}`);
+
+      // 风控/质询页：降速并立即返回，重试只会让拦截更严重
+      if (isThrottled(res.statusCode, text)) {
+        limiter.onThrottle();
+        const msg = `🚫 风控拦截`;
+        log.warn(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg} (HTTP ${res.statusCode}, 当前速率 ${limiter.rate.toFixed(2)}/s)`);
+        return [done(msg), 'throttled'];
+      }
+      limiter.onSuccess();
 
-      // 优先尝试解析为 JSON
-      let parsed;
-      try {
-        parsed = JSON.parse(text);
-      } catch (e) {
-        parsed = null;
+      // 完整响应只在 debug 级别输出，常规运行不落盘
+      if (log.enabled('debug')) {
+        log.debug(`响应正文: ${text}`);
       }
 
-      if (parsed && typeof parsed === "object") {
-        writeLog(`响应正文(JSON): ${text}`);
-      } else {
-        writeLog(`响应正文长度: ${text.length}`); 
-        chunkString(text, 2000).forEach((chunk, i) => {
-          writeLog(`响应正文第 ${i + 1} 段: （隐藏）`);
-        });
+      // 5xx 是站点故障而不是 Cookie 失效，不能触发重新登录
+      if (res.statusCode >= 500) {
+        const msg = `🚫 请求异常：HTTP ${res.statusCode}`;
+        log.warn(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
+        return [done(msg), 'server'];
       }
 
       try {
         const data = JSON.parse(text);
         const msgRaw = (data.message || '').toLowerCase();
 
-        if (res.statusCode === 403) {
-          const msg = `🚫 风控拦截`;
-          writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
-          return { name, result: msg, time: new Date().toLocaleString(), site_type: siteType };
-        }
-
         if (data.success) {
           const amountMatch = data.message.match(/(\d+)/);
           const amount = amountMatch ? amountMatch[1] : '未知';
           const msg = `✅ 签到收益 ${amount} 个 🍗`;
-          writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
-          return { name, result: msg, time: new Date().toLocaleString(), site_type: siteType };
+          log.info(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
+          return [done(msg), null];
         } else if (msgRaw.includes('重复') || msgRaw.includes('already')) {
           const msg = `☑️ 已签到`;
-          writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
-          return { name, result: msg, time: new Date().toLocaleString(), site_type: siteType };
+          log.info(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
+          return [done(msg), null];
         } else {
           const msg = `🚫 签到失败：${data.message || '未知错误'}`;
-          writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
-          lastErrorResult = { name, result: msg, time: new Date().toLocaleString(), site_type: siteType };
+          log.warn(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
+          return [done(msg), 'rejected'];
         }
       } catch (jsonErr) {
-        writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 响应解析异常:（隐藏）`);
+        log.warn(`${siteConfig.emoji} ${siteConfig.name} - ${name} 响应解析异常:（隐藏）`);
         const msg = `🚫 响应解析失败，非 JSON 格式或登录失效`;
-        writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
-        lastErrorResult = { name, result: msg, time: new Date().toLocaleString(), site_type: siteType };
+        log.warn(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
+        return [done(msg), 'auth'];
       }
     } catch (err) {
-      writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 请求异常: ${err.stack || err.message}`);
+      log.error(`${siteConfig.emoji} ${siteConfig.name} - ${name} 请求异常: ${err.stack || err.message}`);
       const msg = `🚫 请求异常：${err.message}`;
-      writeLog(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
-      lastErrorResult = { name, result: msg, time: new Date().toLocaleString(), site_type: siteType };
+      log.warn(`${siteConfig.emoji} ${siteConfig.name} - ${name} 签到结果: ${msg}`);
+      return [done(msg), 'network'];
     }
+  };
 
-    if (attempt < maxRetries) {
-      await new Promise(res => setTimeout(res, 500));
-    }
-  }
+  return withRetry(attemptSign, budget);
+}
 
-  return lastErrorResult || { 
-    name, 
-    result: '🚫 未知错误', 
-    time: new Date().toLocaleString(), 
-    site_type: siteType 
-  };
+// 同一站点连续出现风控/请求异常后，剩余账号不再请求，标记 deferred 交给 Python 端熔断后重新排队
+const SITE_TRIP_THRESHOLD = Number(process.env.BREAKER_TRIP_THRESHOLD || 5);
+
+function isSiteFailure(result) {
+  return result.startsWith('🚫 风控拦截') || result.startsWith('🚫 请求异常');
 }
 
 // 双网站签到函数
 async function signAccounts(targets, userModes) {
   const results = {};
+  const siteFailures = {};
+  let total = 0;
+  for (const userId in targets) {
+    for (const siteType in targets[userId]) total += Object.keys(targets[userId][siteType]).length;
+  }
+  const budget = new RetryBudget(total);
   
   for (const userId in targets) {
     results[userId] = {};
@@ -164,9 +152,27 @@ async function signAccounts(targets, userModes) {
       const mode = userSiteModes[siteType] || false;
 
       for (const [name, cookie] of Object.entries(accounts)) {
+        if ((siteFailures[siteType] || 0) >= SITE_TRIP_THRESHOLD) {
+          results[userId][siteType].push({
+            name,
+            result: '⏸️ 站点异常，已暂缓签到',
+            deferred: true,
+            time: new Date().toLocaleString(),
+            site_type: siteType
+          });
+          continue;
+        }
         try {
-          const res = await signSingle(name, cookie, siteType, mode);
+          const res = await signSingle(name, cookie, siteType, mode, budget);
           results[userId][siteType].push(res);
+          if (isSiteFailure(res.result)) {
+            siteFailures[siteType] = (siteFailures[siteType] || 0) + 1;
+            if (siteFailures[siteType] === SITE_TRIP_THRESHOLD) {
+              log.warn(`⏸️ ${SITES_CONFIG[siteType].emoji} ${SITES_CONFIG[siteType].name} 连续 ${SITE_TRIP_THRESHOLD} 次站点级失败，暂缓剩余账号`);
+            }
+          } else if (res.result.startsWith('✅') || res.result.startsWith('☑️')) {
+            siteFailures[siteType] = 0;
+          }
         } catch (e) {
           const siteConfig = SITES_CONFIG[siteType] || { emoji: '❓', name: 'Unknown' };
           results[userId][siteType].push({
@@ -175,16 +181,20 @@ async function signAccounts(targets, userModes) {
             time: new Date().toLocaleString(),
             site_type: siteType
           });
-          writeLog(`⚠️ 用户 ${userId} ${siteConfig.emoji} ${siteConfig.name} 账号 ${name} 签到异常: ${e.stack || e.message}`);
+          log.error(`⚠️ 用户 ${userId} ${siteConfig.emoji} ${siteConfig.name} 账号 ${name} 签到异常: ${e.stack || e.message}`);
         }
       }
     }
   }
   
+  const retryStats = budget.stats();
+  if (retryStats.used || retryStats.denied) {
+    log.info(`重试预算: 已用 ${retryStats.used}/${retryStats.total}，拒绝 ${retryStats.denied} 次`);
+  }
   return results;
 }
 
-module.exports = { signSingle, signAccounts };
+module.exports = { signSingle, signAccounts, limiterStats };
 
 // CLI 入口：供 Python 调用
 if (require.main === module) {
@@ -193,9 +203,13 @@ if (require.main === module) {
       const payload = JSON.parse(process.argv[2]);
       const { targets, userModes } = payload;
       const results = await signAccounts(targets, userModes);
+      await saveLimiterState();
+      log.info(`限速器状态: ${JSON.stringify(limiterStats())}`);
+      await log.close();
       console.log(JSON.stringify(results));
     } catch (err) {
       console.error("sign_dual.js 运行出错:", err.message);
+      log.error(`sign_dual.js 运行出错: ${err.stack || err.message}`);
       process.exit(1);
     }
   })();
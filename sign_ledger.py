@@ -0,0 +1,100 @@
+# sign_ledger.py - 今日已签到记录：按（站点, 账号, 北京日期）保存当天签到结果，重复签到直接返回，不再请求 /api/attendance
+import os
+import json
+import tempfile
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+LEDGER_FILE = "./data/signed_today.json"
+
+beijing = ZoneInfo("Asia/Shanghai")
+
+
+def is_signed(result: str) -> bool:
+    """签到成功或站点返回已签到，当天都不必再请求"""
+    return result.startswith(("✅", "☑️"))
+
+
+class SignLedger:
+    def __init__(self, path: str = LEDGER_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._date = None
+        self._entries = {}   # "站点:账号" -> {"result": 结果, "time": "HH:MM"}
+        self._dirty = False
+        self.hits = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._date = state.get("date")
+            self._entries = state.get("entries", {})
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    def _roll(self):
+        # 北京时间换日后清空
+        today = datetime.now(beijing).strftime("%Y-%m-%d")
+        if self._date != today:
+            self._date = today
+            self._entries = {}
+            self._dirty = True
+
+    def get(self, site_type: str, acc_name: str):
+        with self._lock:
+            self._roll()
+            entry = self._entries.get(f"{site_type}:{acc_name}")
+            if entry:
+                self.hits += 1
+            return entry
+
+    def record(self, site_type: str, acc_name: str, result: str, uid: str = None):
+        if not is_signed(result):
+            return
+        with self._lock:
+            self._roll()
+            key = f"{site_type}:{acc_name}"
+            uids = self._entries.get(key, {}).get("uids", [])
+            if uid and uid not in uids:
+                uids = uids + [uid]
+            if key in self._entries and result.startswith("☑️"):
+                # 强制重签得到的“已签到”不覆盖当天的收益记录
+                self._entries[key]["uids"] = uids
+            else:
+                self._entries[key] = {
+                    "result": result,
+                    "time": datetime.now(beijing).strftime("%H:%M"),
+                    "uids": uids,
+                }
+            self._dirty = True
+
+    def claim_log(self, site_type: str, acc_name: str, uid: str) -> bool:
+        """多个用户绑定同一账号时，每个用户当天只记一次日志：该用户首次拿到结果返回 True"""
+        with self._lock:
+            self._roll()
+            entry = self._entries.get(f"{site_type}:{acc_name}")
+            if entry is None or uid in entry.setdefault("uids", []):
+                return False
+            entry["uids"].append(uid)
+            self._dirty = True
+            return True
+
+    def flush(self):
+        """批量签到结束后统一落盘"""
+        with self._lock:
+            if not self._dirty:
+                return
+            state = {"date": self._date, "entries": self._entries}
+            self._dirty = False
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits}
@@ -0,0 +1,235 @@
+// site_limiter.js - 按站点的自适应限速器（令牌桶 + AIMD）
+// 与 Python 端 site_limiter.py 共用 data/site_limits.json：文件里保存各站点的共享速率和正在取令牌的进程。
+// 每个进程在本地令牌桶里按 共享速率 / 活跃进程数 取令牌，并发运行的多个脚本和 bot 加起来不超过共享速率。
+// 取令牌不读写文件；只有定期同步（登记心跳、合并成功带来的增量）和风控降速时才在锁内改写文件，且都是异步 IO
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+
+const STATE_FILE = process.env.SITE_LIMITS_FILE || path.join(__dirname, 'data', 'site_limits.json');
+const LOCK_FILE = `${STATE_FILE}.lock`;
+const LOCK_STALE_MS = 10000;   // 锁文件超过该时长未释放视为持锁进程已崩溃
+const SYNC_INTERVAL_MS = 2000; // 与共享状态同步的间隔：登记本进程、合并速率增量、读取其他进程的降速
+const ACTIVE_WINDOW_S = 3 * SYNC_INTERVAL_MS / 1000;  // 超过该秒数没有同步的进程不再参与分配
+const QUICK_SYNC_MS = 200;     // 活跃进程数有变化（如几个脚本同时启动）时提前再同步一次，尽快按新的进程数分配
+
+// 速率单位：请求/秒
+const LIMIT_CONFIG = {
+  initRate: Number(process.env.SITE_RATE_INIT || 2),
+  minRate: Number(process.env.SITE_RATE_MIN || 0.2),
+  maxRate: Number(process.env.SITE_RATE_MAX || 8),
+  increase: Number(process.env.SITE_RATE_STEP || 0.1),  // 成功后加性增长
+  decrease: 0.5,                                         // 风控后乘性下降
+  burst: 3,
+  cooldownMs: 2000,  // 同一波 403 只降一次速
+};
+
+const CHALLENGE_MARKERS = ['just a moment', 'cf-chl', 'challenge-platform', 'attention required'];
+
+function isThrottled(statusCode, body = '') {
+  if (statusCode === 403 || statusCode === 429) return true;
+  // Cloudflare 质询页可能以 503 甚至 200 返回，按页面特征识别
+  const head = String(body || '').slice(0, 4000).toLowerCase();
+  return CHALLENGE_MARKERS.some(m => head.includes(m));
+}
+
+async function readState() {
+  try {
+    return JSON.parse(await fs.promises.readFile(STATE_FILE, 'utf-8'));
+  } catch (e) {
+    return {};
+  }
+}
+
+async function writeState(state) {
+  const tmp = `${STATE_FILE}.${process.pid}.tmp`;
+  await fs.promises.writeFile(tmp, JSON.stringify(state, null, 2));
+  await fs.promises.rename(tmp, STATE_FILE);
+}
+
+async function lockAge(file) {
+  return Date.now() - (await fs.promises.stat(file)).mtimeMs;
+}
+
+// 锁文件超时未释放：先改名再确认改走的仍是旧锁，两个进程同时清理时不会误删对方刚建的锁
+async function breakStaleLock() {
+  const stale = `${LOCK_FILE}.${process.pid}.${crypto.randomBytes(4).toString('hex')}.stale`;
+  try {
+    if (await lockAge(LOCK_FILE) <= LOCK_STALE_MS) return;
+    await fs.promises.rename(LOCK_FILE, stale);
+  } catch (e) {
+    return;
+  }
+  try {
+    // 改走的是别人刚建的锁，放回原处；已有新锁时放弃，原持有者释放时按内容核对，不会删错
+    if (await lockAge(stale) <= LOCK_STALE_MS) await fs.promises.link(stale, LOCK_FILE).catch(() => {});
+  } finally {
+    await fs.promises.unlink(stale).catch(() => {});
+  }
+}
+
+// 跨进程互斥：以 wx 方式创建锁文件并写入本次持有的标记，与 Python 端的 O_EXCL 等价
+async function withFileLock(fn) {
+  await fs.promises.mkdir(path.dirname(STATE_FILE), { recursive: true });
+  const token = `js:${process.pid}:${crypto.randomBytes(4).toString('hex')}`;
+  for (;;) {
+    try {
+      await fs.promises.writeFile(LOCK_FILE, token, { flag: 'wx' });
+      break;
+    } catch (e) {
+      if (e.code !== 'EEXIST') throw e;
+      await breakStaleLock();
+      await sleep(2);
+    }
+  }
+  try {
+    return await fn();
+  } finally {
+    try {
+      if ((await fs.promises.readFile(LOCK_FILE, 'utf-8')) === token) await fs.promises.unlink(LOCK_FILE);
+    } catch (e) { /* 已被当作过期锁清理 */ }
+  }
+}
+
+class SiteLimiter {
+  constructor(siteType) {
+    this.siteType = siteType;
+    this.procId = `js:${process.pid}:${crypto.randomBytes(4).toString('hex')}`;
+    this.rate = LIMIT_CONFIG.initRate;  // 最近一次同步的共享速率
+    this.share = this.rate;             // 本进程可用的速率
+    this.burst = LIMIT_CONFIG.burst;
+    this.tokens = 1;
+    this.refillAt = Date.now();
+    this.pending = 0;  // 尚未写回的加性增量
+    this.syncedAt = 0;
+    this.syncAfterMs = SYNC_INTERVAL_MS;
+    this.active = 0;
+    this.successes = 0;
+    this.throttles = 0;
+    this._chain = Promise.resolve();
+  }
+
+  // 在锁内读出共享状态：合并本进程的增量、登记心跳，fn 可再修改；按活跃进程数重新计算本进程的份额
+  async _sync(fn) {
+    const { rate, active } = await withFileLock(async () => {
+      const state = await readState();
+      const entry = state[this.siteType] = state[this.siteType] || {};
+      const now = Date.now() / 1000;
+      const pending = this.pending;
+      this.pending = 0;
+      entry.rate = clamp((entry.rate || this.rate) + pending);
+      const procs = {};
+      for (const [id, seen] of Object.entries(entry.procs || {})) {
+        if (now - seen < ACTIVE_WINDOW_S) procs[id] = seen;
+      }
+      procs[this.procId] = now;
+      entry.procs = procs;
+      if (fn) fn(entry, now);
+      entry.updated_at = now;
+      await writeState(state);
+      return { rate: entry.rate, active: Object.keys(procs).length };
+    });
+    this._refill();
+    this.rate = rate;
+    this.share = rate / active;
+    this.burst = Math.max(1, LIMIT_CONFIG.burst / active);
+    this.tokens = Math.min(this.tokens, this.burst);
+    this.syncAfterMs = active === this.active ? SYNC_INTERVAL_MS : QUICK_SYNC_MS;
+    this.active = active;
+    this.syncedAt = Date.now();
+  }
+
+  _refill() {
+    const now = Date.now();
+    this.tokens = Math.min(this.burst, this.tokens + (now - this.refillAt) / 1000 * this.share);
+    this.refillAt = now;
+  }
+
+  // 排队取令牌，本进程内按顺序放行；等待期间照常同步，其他进程能看到本进程仍在使用
+  acquire() {
+    const next = this._chain.then(async () => {
+      for (;;) {
+        if (Date.now() - this.syncedAt >= this.syncAfterMs) await this._sync();
+        this._refill();
+        if (this.tokens >= 1) {
+          this.tokens -= 1;
+          return;
+        }
+        await sleep(Math.min((1 - this.tokens) / this.share * 1000, this.syncAfterMs));
+      }
+    });
+    this._chain = next.catch(() => {});
+    return next;
+  }
+
+  // 增量先攒在内存里，下次同步时写回
+  onSuccess() {
+    this.successes++;
+    this.pending += LIMIT_CONFIG.increase;
+  }
+
+  onThrottle() {
+    this.throttles++;
+    this.pending = 0;
+    this.tokens = 0;
+    return this._sync((entry, now) => {
+      if ((now - (entry.last_decrease || 0)) * 1000 < LIMIT_CONFIG.cooldownMs) return;
+      entry.last_decrease = now;
+      entry.rate = clamp(entry.rate * LIMIT_CONFIG.decrease);
+    }).catch(() => {});
+  }
+
+  // 写回尚未提交的增量并注销本进程，脚本结束前调用
+  async flush() {
+    await withFileLock(async () => {
+      const state = await readState();
+      const entry = state[this.siteType] = state[this.siteType] || {};
+      const pending = this.pending;
+      this.pending = 0;
+      entry.rate = clamp((entry.rate || this.rate) + pending);
+      if (entry.procs) delete entry.procs[this.procId];
+      entry.updated_at = Date.now() / 1000;
+      await writeState(state);
+      this.rate = entry.rate;
+    });
+    this.syncedAt = 0;
+    this.active = 0;
+  }
+
+  stats() {
+    return {
+      rate: Number(this.rate.toFixed(3)),
+      share: Number(this.share.toFixed(3)),
+      successes: this.successes,
+      throttles: this.throttles,
+    };
+  }
+}
+
+function clamp(rate) {
+  return Math.min(LIMIT_CONFIG.maxRate, Math.max(LIMIT_CONFIG.minRate, rate));
+}
+
+function sleep(ms) {
+  return new Promise(res => setTimeout(res, ms));
+}
+
+const limiters = {};
+
+function getLimiter(siteType) {
+  if (!limiters[siteType]) limiters[siteType] = new SiteLimiter(siteType);
+  return limiters[siteType];
+}
+
+function limiterStats() {
+  const out = {};
+  for (const [siteType, limiter] of Object.entries(limiters)) out[siteType] = limiter.stats();
+  return out;
+}
+
+// 脚本结束前写回尚未提交的速率增量，并从共享状态中注销本进程
+async function saveLimiterState() {
+  await Promise.all(Object.values(limiters).map(l => l.flush()));
+}
+
+module.exports = { SiteLimiter, getLimiter, limiterStats, saveLimiterState, isThrottled };
@@ -0,0 +1,236 @@
+# site_limiter.py - 按站点的自适应限速器（令牌桶 + AIMD）
+# 与 site_limiter.js 共用 data/site_limits.json：文件里保存各站点的共享速率和正在取令牌的进程。
+# 每个进程在本地令牌桶里按 共享速率 / 活跃进程数 取令牌，多个 Node 脚本、工作进程和 bot 本身加起来不超过共享速率。
+# 取令牌不读写文件；只有定期同步（登记心跳、合并成功带来的增量）和风控降速时才在锁内改写文件
+import os
+import json
+import time
+import secrets
+import threading
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+STATE_FILE = "./data/site_limits.json"
+LOCK_FILE = STATE_FILE + ".lock"
+LOCK_STALE = 10.0      # 锁文件超过该秒数未释放视为持锁进程已崩溃
+SYNC_INTERVAL = 2.0    # 与共享状态同步的间隔：登记本进程、合并速率增量、读取其他进程的降速
+ACTIVE_WINDOW = 3 * SYNC_INTERVAL   # 超过该秒数没有同步的进程不再参与分配
+QUICK_SYNC = 0.2       # 活跃进程数有变化（如几个脚本同时启动）时提前再同步一次，尽快按新的进程数分配
+
+INIT_RATE = float(os.getenv("SITE_RATE_INIT", "2"))
+MIN_RATE = float(os.getenv("SITE_RATE_MIN", "0.2"))
+MAX_RATE = float(os.getenv("SITE_RATE_MAX", "8"))
+RATE_STEP = float(os.getenv("SITE_RATE_STEP", "0.1"))  # 成功后加性增长
+DECREASE = 0.5                                         # 风控后乘性下降
+BURST = 3
+COOLDOWN = 2.0  # 同一波 403 只降一次速
+
+CHALLENGE_MARKERS = ("just a moment", "cf-chl", "challenge-platform", "attention required")
+
+
+def is_throttled(status_code: int, body: Optional[str] = "") -> bool:
+    """403/429 或 Cloudflare 质询页视为风控"""
+    if status_code in (403, 429):
+        return True
+    head = (body or "")[:4000].lower()
+    return any(m in head for m in CHALLENGE_MARKERS)
+
+
+def _clamp(rate: float) -> float:
+    return min(MAX_RATE, max(MIN_RATE, rate))
+
+
+def _read_state() -> dict:
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _write_state(state: dict):
+    with tempfile.NamedTemporaryFile("w", delete=False, dir=os.path.dirname(STATE_FILE), encoding="utf-8") as tf:
+        json.dump(state, tf, indent=2)
+        tempname = tf.name
+    os.replace(tempname, STATE_FILE)
+
+
+def _break_stale_lock():
+    """锁文件超过 LOCK_STALE 未释放：先改名再确认改走的仍是旧锁，两个进程同时清理时不会误删对方刚建的锁"""
+    stale = f"{LOCK_FILE}.{os.getpid()}.{threading.get_ident()}.stale"
+    try:
+        if time.time() - os.path.getmtime(LOCK_FILE) <= LOCK_STALE:
+            return
+        os.rename(LOCK_FILE, stale)
+    except OSError:
+        return
+    try:
+        if time.time() - os.path.getmtime(stale) <= LOCK_STALE:
+            # 改走的是别人刚建的锁，放回原处；已有新锁时放弃，原持有者释放时按内容核对，不会删错
+            try:
+                os.link(stale, LOCK_FILE)
+            except OSError:
+                pass
+    finally:
+        os.unlink(stale)
+
+
+@contextmanager
+def _file_lock():
+    """跨进程互斥：O_EXCL 创建锁文件并写入本次持有的标记，Node 端用同样的方式加锁"""
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    token = f"py:{os.getpid()}:{secrets.token_hex(4)}"
+    while True:
+        try:
+            fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            _break_stale_lock()
+            time.sleep(0.002)
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(token)
+        break
+    try:
+        yield
+    finally:
+        try:
+            with open(LOCK_FILE, "r") as f:
+                mine = f.read() == token
+            if mine:
+                os.unlink(LOCK_FILE)
+        except OSError:
+            pass
+
+
+class SiteLimiter:
+    def __init__(self, site_type: str):
+        self.site_type = site_type
+        self.proc_id = f"py:{os.getpid()}:{secrets.token_hex(4)}"
+        self.rate = _clamp(_read_state().get(site_type, {}).get("rate") or INIT_RATE)  # 最近一次同步的共享速率
+        self.share = self.rate   # 本进程可用的速率
+        self.burst = BURST
+        self.tokens = 1.0
+        self.refill_at = time.monotonic()
+        self.pending = 0.0       # 尚未写回的加性增量
+        self.synced_at = None
+        self.sync_after = SYNC_INTERVAL
+        self.active = 0
+        self.successes = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def _sync(self, fn=None):
+        """在锁内读出共享状态：合并本进程的增量、登记心跳，fn 可再修改；按活跃进程数重新计算本进程的份额"""
+        with _file_lock():
+            state = _read_state()
+            entry = state.setdefault(self.site_type, {})
+            now = time.time()
+            with self._lock:
+                pending, self.pending = self.pending, 0.0
+            entry["rate"] = _clamp((entry.get("rate") or self.rate) + pending)
+            procs = {p: t for p, t in entry.get("procs", {}).items() if now - t < ACTIVE_WINDOW}
+            procs[self.proc_id] = now
+            entry["procs"] = procs
+            if fn:
+                fn(entry, now)
+            entry["updated_at"] = now
+            _write_state(state)
+        with self._lock:
+            self._refill()
+            self.rate = entry["rate"]
+            self.share = self.rate / len(procs)
+            self.burst = max(1.0, BURST / len(procs))
+            self.tokens = min(self.tokens, self.burst)
+            self.sync_after = SYNC_INTERVAL if len(procs) == self.active else QUICK_SYNC
+            self.active = len(procs)
+            self.synced_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refill_at) * self.share)
+        self.refill_at = now
+
+    def _sync_due(self) -> bool:
+        return self.synced_at is None or time.monotonic() - self.synced_at >= self.sync_after
+
+    def acquire(self):
+        """阻塞直到从本进程的份额里拿到令牌；等待期间照常同步，其他进程能看到本进程仍在使用"""
+        while True:
+            if self._sync_due():
+                self._sync()
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.share
+            time.sleep(min(wait, self.sync_after))
+
+    def on_success(self):
+        # 增量先攒在内存里，下次同步时写回
+        with self._lock:
+            self.successes += 1
+            self.pending += RATE_STEP
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.pending = 0.0
+            self.tokens = 0.0
+
+        def decrease(entry, now):
+            if now - entry.get("last_decrease", 0) < COOLDOWN:
+                return
+            entry["last_decrease"] = now
+            entry["rate"] = _clamp(entry["rate"] * DECREASE)
+
+        self._sync(decrease)
+
+    def flush(self):
+        """写回尚未提交的增量并注销本进程，进程结束前调用"""
+        with _file_lock():
+            state = _read_state()
+            entry = state.setdefault(self.site_type, {})
+            with self._lock:
+                pending, self.pending = self.pending, 0.0
+            entry["rate"] = _clamp((entry.get("rate") or self.rate) + pending)
+            entry.get("procs", {}).pop(self.proc_id, None)
+            entry["updated_at"] = time.time()
+            _write_state(state)
+        self.rate = entry["rate"]
+        self.synced_at = None
+        self.active = 0
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 3),
+            "share": round(self.share, 3),
+            "successes": self.successes,
+            "throttles": self.throttles,
+        }
+
+
+_limiters = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(site_type: str) -> SiteLimiter:
+    with _registry_lock:
+        if site_type not in _limiters:
+            _limiters[site_type] = SiteLimiter(site_type)
+        return _limiters[site_type]
+
+
+def current_rates() -> dict:
+    """各站点当前速率（请求/秒），包含 Node 脚本和其他进程最近写回的值"""
+    now = time.time()
+    rates = {
+        k: {"rate": round(v.get("rate", INIT_RATE), 3),
+            "processes": sum(1 for t in v.get("procs", {}).values() if now - t < ACTIVE_WINDOW)}
+        for k, v in _read_state().items()
+    }
+    for site_type, limiter in list(_limiters.items()):
+        rates[site_type] = {**rates.get(site_type, {}), **limiter.stats(),
+                            "rate": rates.get(site_type, {}).get("rate", round(limiter.rate, 3))}
+    return rates
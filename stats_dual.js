@@ -3,6 +3,9 @@ const fs = require('fs');
 const path = require('path');
 const cloudscraper = require('cloudscraper');
 const tough = require('tough-cookie');
+const { getLimiter, limiterStats, saveLimiterState, isThrottled } = require('./site_limiter');
+const log = require('./logger');
+const { RetryBudget, withRetry } = require('./retry_policy');
 const dayjs = require('dayjs');
 const utc = require('dayjs/plugin/utc');
 const timezone = require('dayjs/plugin/timezone');
@@ -10,41 +13,29 @@ const timezone = require('dayjs/plugin/timezone');
 dayjs.extend(utc);
 dayjs.extend(timezone);
 
-const LOG_DIR = path.join(__dirname, 'logs');
-if (!fs.existsSync(LOG_DIR)) fs.mkdirSync(LOG_DIR);
+// 每个账号的信用记录本地账本，增量同步后在本地计算统计
+const LEDGER_DIR = process.env.LEDGER_DIR || path.join(__dirname, 'data', 'ledger');
+const LEDGER_FRESH_MS = Number(process.env.LEDGER_FRESH_SECONDS || 600) * 1000;
+const LEDGER_MAX_RECORDS = 5000;
+const MAX_PAGES = 20;
+const STATS_CONCURRENCY = Number(process.env.STATS_CONCURRENCY || 4);  // 每个站点同时统计的账号数
 
-// 网站配置
+// 网站配置（NS_BASE_URL / DF_BASE_URL 可指向本地模拟站点，用于压测）
 const SITES_CONFIG = {
   ns: {
     name: 'NodeSeek',
     domain: 'www.nodeseek.com',
-    baseUrl: 'https://www.nodeseek.com',
+    baseUrl: process.env.NS_BASE_URL || 'https://www.nodeseek.com',
     emoji: '🔵'
   },
   df: {
     name: 'DeepFlood',
     domain: 'www.deepflood.com',
-    baseUrl: 'https://www.deepflood.com',
+    baseUrl: process.env.DF_BASE_URL || 'https://www.deepflood.com',
     emoji: '🟢'
   }
 };
 
-function writeLog(message) {
-  // 北京时间
-  const now = dayjs().tz("Asia/Shanghai");
-  const filePath = path.join(LOG_DIR, `${now.format("YYYY-MM-DD")}.log`);
-  const time = now.format("YYYY-MM-DD HH:mm:ss");
-  fs.appendFileSync(filePath, `[${time}] ${message}\n`);
-}
-
-function chunkString(str, length = 1000) {
-  const chunks = [];
-  for (let i = 0; i < str.length; i += length) {
-    chunks.push(str.slice(i, i + length));
-  }
-  return chunks;
-}
-
 // 统一 headers
 function buildHeaders(cookie, siteType = 'ns') {
   const siteConfig = SITES_CONFIG[siteType];
@@ -58,88 +49,281 @@ function buildHeaders(cookie, siteType = 'ns') {
   };
 }
 
+// 本次统计共用的重试预算，statsAccounts 开始时按账号数重置
+let retryBudget = null;
+
 async function fetchCreditPage(page, cookie, jar, siteType = 'ns') {
   const siteConfig = SITES_CONFIG[siteType];
   const url = `${siteConfig.baseUrl}/api/account/credit/page-${page}`;
-  
-  try {
-    const res = await cloudscraper.get({
-      uri: url,
-      headers: buildHeaders(cookie, siteType),
-      resolveWithFullResponse: true,
-      simple: false,
-      json: false,
-      jar,
-    });
-
-    const text = res.body;
-    chunkString(text, 2000).forEach((chunk, i) => {
-      writeLog(`${siteConfig.emoji} ${siteConfig.name} 信用记录第 ${page} 页 - 响应正文第 ${i + 1} 段:\n${chunk}`);
-    });
+  const limiter = getLimiter(siteType);
 
+  // 返回 [结果, 错误类别]，由 retry_policy 决定是否重试
+  const attemptFetch = async () => {
     try {
-      return JSON.parse(text);
-    } catch (e) {
-      writeLog(`⚠️ ${siteConfig.emoji} ${siteConfig.name} 信用记录解析异常: ${e.message}`);
-      return null;
+      await limiter.acquire();
+      const res = await cloudscraper.get({
+        uri: url,
+        headers: buildHeaders(cookie, siteType),
+        resolveWithFullResponse: true,
+        simple: false,
+        json: false,
+        jar,
+      });
+
+      const text = res.body;
+      if (isThrottled(res.statusCode, text)) {
+        limiter.onThrottle();
+        log.warn(`🚫 ${siteConfig.emoji} ${siteConfig.name} 信用记录第 ${page} 页被风控拦截 (HTTP ${res.statusCode}, 当前速率 ${limiter.rate.toFixed(2)}/s)`);
+        return [{ throttled: true }, 'throttled'];
+      }
+      limiter.onSuccess();
+
+      // 完整响应只在 debug 级别输出，常规运行不落盘
+      if (log.enabled('debug')) {
+        log.debug(`${siteConfig.emoji} ${siteConfig.name} 信用记录第 ${page} 页 - 响应正文:\n${text}`);
+      }
+
+      if (res.statusCode >= 500) {
+        log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} 信用记录第 ${page} 页 HTTP ${res.statusCode}`);
+        return [null, 'server'];
+      }
+
+      try {
+        return [JSON.parse(text), null];
+      } catch (e) {
+        log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} 信用记录解析异常: ${e.message}`);
+        return [null, 'auth'];
+      }
+    } catch (err) {
+      log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} 请求信用记录异常: ${err.message}`);
+      return [null, 'network'];
     }
-  } catch (err) {
-    writeLog(`⚠️ ${siteConfig.emoji} ${siteConfig.name} 请求信用记录异常: ${err.message}`);
-    return null;
+  };
+
+  return withRetry(attemptFetch, retryBudget);
+}
+
+function recordTs(record) {
+  return dayjs(record[3]).valueOf();
+}
+
+function recordKey(record) {
+  const [amount, balance, description, timestamp] = record;
+  return `${timestamp}|${amount}|${balance}|${description}`;
+}
+
+function ledgerPath(siteType, name) {
+  return path.join(LEDGER_DIR, `${siteType}_${encodeURIComponent(name)}.json`);
+}
+
+function loadLedger(siteType, name) {
+  try {
+    return JSON.parse(fs.readFileSync(ledgerPath(siteType, name), 'utf-8'));
+  } catch (e) {
+    // records 按时间倒序；complete 表示已拉到历史尽头
+    return { records: [], complete: false, page_size: 0, synced_at: 0 };
   }
 }
 
-async function getSigninStats(name, cookie, siteType = 'ns', days = 30) {
-  const siteConfig = SITES_CONFIG[siteType];
-  const maskedCookie = cookie.length > 15
-    ? cookie.slice(0, 8) + '...' + cookie.slice(-5)
-    : cookie;
+function saveLedger(siteType, name, ledger) {
+  fs.mkdirSync(LEDGER_DIR, { recursive: true });
+  const file = ledgerPath(siteType, name);
+  const tmp = `${file}.${process.pid}.tmp`;
+  fs.writeFileSync(tmp, JSON.stringify(ledger));
+  fs.renameSync(tmp, file);
+}
 
-  writeLog(`==== 开始统计收益: ${siteConfig.emoji} ${siteConfig.name} - ${name}, Cookie(部分隐藏): ${maskedCookie}, 天数: ${days} ====`);
-  const cutoff = dayjs().tz("Asia/Shanghai").subtract(days, 'day').toDate();
+// 根据上一页的时间跨度预估下一页是否仍在目标时间之后，是则提前发起请求
+function expectMorePages(prevRecords, target) {
+  if (!prevRecords || !prevRecords.length) return false;
+  const newest = recordTs(prevRecords[0]);
+  const oldest = recordTs(prevRecords[prevRecords.length - 1]);
+  return oldest - (newest - oldest) > target;
+}
 
-  const jar = new tough.CookieJar();
+function ledgerCovers(ledger, cutoff) {
+  if (ledger.complete) return true;
+  const { records } = ledger;
+  return records.length > 0 && recordTs(records[records.length - 1]) <= cutoff;
+}
 
+async function visitBoard(name, cookie, jar, siteType) {
+  const siteConfig = SITES_CONFIG[siteType];
+  const limiter = getLimiter(siteType);
   try {
-    await cloudscraper.get({
+    await limiter.acquire();
+    const res = await cloudscraper.get({
       uri: `${siteConfig.baseUrl}/board`,
       headers: buildHeaders(cookie, siteType),
       jar,
+      resolveWithFullResponse: true,
       simple: false
     });
-    writeLog(`✅ ${siteConfig.emoji} ${siteConfig.name} - ${name} 访问 /board 成功，尝试获取信用记录`);
+    if (isThrottled(res.statusCode, res.body)) {
+      limiter.onThrottle();
+      log.warn(`🚫 ${siteConfig.emoji} ${siteConfig.name} - ${name} 访问 /board 被风控拦截 (HTTP ${res.statusCode})`);
+      return;
+    }
+    limiter.onSuccess();
+    log.info(`✅ ${siteConfig.emoji} ${siteConfig.name} - ${name} 访问 /board 成功，尝试获取信用记录`);
   } catch (e) {
-    writeLog(`⚠️ ${siteConfig.emoji} ${siteConfig.name} - ${name} 访问 /board 失败: ${e.message}`);
+    log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} - ${name} 访问 /board 失败: ${e.message}`);
+  }
+}
+
+// 增量同步：从第 1 页拉到与本地记录重叠为止；本地记录不够覆盖查询窗口时再向后回填
+async function syncLedger(name, cookie, siteType, cutoff) {
+  const siteConfig = SITES_CONFIG[siteType];
+  const ledger = loadLedger(siteType, name);
+  if (Date.now() - ledger.synced_at < LEDGER_FRESH_MS && ledgerCovers(ledger, cutoff)) {
+    log.info(`📒 ${siteConfig.emoji} ${siteConfig.name} - ${name} 账本 ${Math.round((Date.now() - ledger.synced_at) / 1000)} 秒前已同步，直接使用本地记录`);
+    return { ledger, error: null };
   }
 
-  let allRecords = [];
-  for (let page = 1; page <= 20; page++) {
-    const data = await fetchCreditPage(page, cookie, jar, siteType);
-    if (!data || !data.success || !data.data) break;
+  const jar = new tough.CookieJar();
+  const known = new Set(ledger.records.map(recordKey));
+  const hadRecords = ledger.records.length > 0;
+  const wasComplete = ledger.complete;
+  const prevSyncedAt = ledger.synced_at;
+  let boardVisited = false;
+  let pagesFetched = 0;
+
+  const doFetch = async (page) => {
+    let data = await fetchCreditPage(page, cookie, jar, siteType);
+    pagesFetched++;
+    // 首次请求失败时先访问 /board 拿站点 Cookie 再试一次
+    if ((!data || !data.success) && !(data && data.throttled) && !boardVisited) {
+      boardVisited = true;
+      await visitBoard(name, cookie, jar, siteType);
+      data = await fetchCreditPage(page, cookie, jar, siteType);
+      pagesFetched++;
+    }
+    return data;
+  };
+  // 同一页只请求一次，预取的结果直接复用
+  const inflight = new Map();
+  const fetchPage = (page) => {
+    if (!inflight.has(page)) inflight.set(page, doFetch(page));
+    return inflight.get(page);
+  };
+  const newestStored = hadRecords ? recordTs(ledger.records[0]) : cutoff;
+  let prevRecords = null;
+
+  // 1. 增量
+  const fresh = [];
+  let overlap = false;
+  let exhausted = false;
+  let error = null;
+  for (let page = 1; page <= MAX_PAGES; page++) {
+    if (page === MAX_PAGES) exhausted = true;
+    if (page < MAX_PAGES && expectMorePages(prevRecords, newestStored)) fetchPage(page + 1);
+    const data = await fetchPage(page);
+    if (data && data.throttled) { error = '🚫 风控拦截，请稍后再试'; break; }
+    if (!data || !data.success || !data.data) { error = '🚫 信用记录获取失败'; exhausted = false; break; }
 
     const records = data.data;
-    if (!records.length) break;
+    if (!records.length) { ledger.complete = true; break; }
+    ledger.page_size = Math.max(ledger.page_size || 0, records.length);
+    prevRecords = records;
 
     for (const record of records) {
-      const [amount, balance, description, timestamp] = record;
-      const recordTime = dayjs(timestamp).tz("Asia/Shanghai").toDate();
-      if (recordTime >= cutoff) {
-        allRecords.push({ amount, balance, description, time: recordTime });
+      const key = recordKey(record);
+      if (known.has(key)) { overlap = true; continue; }
+      known.add(key);
+      fresh.push(record);
+    }
+    if (overlap) { exhausted = false; break; }
+    if (!hadRecords && recordTs(records[records.length - 1]) < cutoff) { exhausted = false; break; }
+  }
+
+  // 没拉到新记录，或中途失败且还没接上本地记录（合并会留下缺口），沿用本地账本
+  if (error && (!fresh.length || (hadRecords && !overlap))) {
+    log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} - ${name} 账本同步失败: ${error}`);
+    return { ledger, error };
+  }
+
+  if (hadRecords && !overlap && exhausted) {
+    // 与本地记录之间有缺口，丢弃旧记录保证账本连续
+    log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} - ${name} 账本出现缺口，重新建立`);
+    ledger.records = [];
+    ledger.complete = false;
+  }
+  ledger.records = fresh.concat(ledger.records);
+
+  // 2. 回填：从本地最早一条所在页开始往后拉
+  if (!error && !ledger.complete && !ledgerCovers(ledger, cutoff)) {
+    const pageSize = ledger.page_size || 0;
+    const startPage = pageSize ? Math.floor((ledger.records.length - 1) / pageSize) + 1 : 1;
+    const older = [];
+    prevRecords = null;
+    for (let page = startPage; page < startPage + MAX_PAGES; page++) {
+      if (expectMorePages(prevRecords, cutoff)) fetchPage(page + 1);
+      const data = await fetchPage(page);
+      if (data && data.throttled) { error = '🚫 风控拦截，请稍后再试'; break; }
+      if (!data || !data.success || !data.data) { error = '🚫 信用记录获取失败'; break; }
+      const records = data.data;
+      if (!records.length) { ledger.complete = true; break; }
+      prevRecords = records;
+      for (const record of records) {
+        const key = recordKey(record);
+        if (known.has(key)) continue;
+        known.add(key);
+        older.push(record);
       }
+      if (recordTs(records[records.length - 1]) < cutoff) break;
     }
+    ledger.records = ledger.records.concat(older);
+  }
+
+  ledger.records.sort((a, b) => recordTs(b) - recordTs(a));
+  if (ledger.records.length > LEDGER_MAX_RECORDS) {
+    ledger.records = ledger.records.slice(0, LEDGER_MAX_RECORDS);
+    ledger.complete = false;
+  }
+  if (error) {
+    // 中途失败：已拉到的连续记录照常保存，但不更新同步时间、不标记已拉完，下次重新同步
+    ledger.complete = ledger.complete && wasComplete;
+    ledger.synced_at = prevSyncedAt;
+    saveLedger(siteType, name, ledger);
+    log.warn(`⚠️ ${siteConfig.emoji} ${siteConfig.name} - ${name} 账本同步未完成: ${error}，已保存 ${ledger.records.length} 条`);
+    return { ledger, error };
+  }
+  ledger.synced_at = Date.now();
+  saveLedger(siteType, name, ledger);
+  log.info(`📒 ${siteConfig.emoji} ${siteConfig.name} - ${name} 账本同步完成: 新增 ${fresh.length} 条，请求 ${pagesFetched} 页，共 ${ledger.records.length} 条`);
+  return { ledger, error: null };
+}
+
+async function getSigninStats(name, cookie, siteType = 'ns', days = 30) {
+  const siteConfig = SITES_CONFIG[siteType];
+  const maskedCookie = cookie.length > 15
+    ? cookie.slice(0, 8) + '...' + cookie.slice(-5)
+    : cookie;
+
+  log.info(`==== 开始统计收益: ${siteConfig.emoji} ${siteConfig.name} - ${name}, Cookie(部分隐藏): ${maskedCookie}, 天数: ${days} ====`);
+  const cutoff = dayjs().tz("Asia/Shanghai").subtract(days, 'day').valueOf();
 
-    const lastTime = dayjs(records[records.length - 1][3]).tz("Asia/Shanghai").toDate();
-    if (lastTime < cutoff) break;
+  const { ledger, error } = await syncLedger(name, cookie, siteType, cutoff);
+  if (error && !ledger.records.length) {
+    return {
+      name,
+      result: error,
+      stats: { total_amount: 0, average: 0, days_count: 0, records: [] },
+      site_type: siteType
+    };
   }
 
-  const signinRecords = allRecords.filter(r =>
-    r.description.includes("签到收益") && r.description.includes("鸡腿")
-  );
+  const signinRecords = ledger.records
+    .filter(r => recordTs(r) >= cutoff)
+    .map(([amount, balance, description, timestamp]) => ({ amount, balance, description, time: dayjs(timestamp).toDate() }))
+    .filter(r => r.description.includes("签到收益") && r.description.includes("鸡腿"));
 
   if (!signinRecords.length) {
     return {
       name,
       result: `⚠️ 近 ${days} 天没有签到记录`,
+      stale: Boolean(error),
+      synced_at: ledger.synced_at,
       stats: { total_amount: 0, average: 0, days_count: 0, records: [] },
       site_type: siteType
     };
@@ -152,6 +336,8 @@ async function getSigninStats(name, cookie, siteType = 'ns', days = 30) {
   return {
     name,
     result: "✅ 查询成功",
+    stale: Boolean(error),
+    synced_at: ledger.synced_at,
     stats: {
       total_amount: totalAmount,
       average,
@@ -166,38 +352,68 @@ async function getSigninStats(name, cookie, siteType = 'ns', days = 30) {
   };
 }
 
+// 简单的并发池：同一时间最多 size 个任务
+function createPool(size) {
+  let active = 0;
+  const waiting = [];
+  const next = () => {
+    if (active >= size || !waiting.length) return;
+    active++;
+    const { fn, resolve, reject } = waiting.shift();
+    fn().then(resolve, reject).finally(() => { active--; next(); });
+  };
+  return (fn) => new Promise((resolve, reject) => { waiting.push({ fn, resolve, reject }); next(); });
+}
+
+// 所有账号并发统计（每站点受并发池和限速器约束），总耗时取决于最慢的账号
 async function statsAccounts(targets, days = 30) {
   const results = {};
+  const pools = {};
+  const tasks = [];
+
+  let count = 0;
+  for (const userId in targets) {
+    for (const siteType in targets[userId]) count += Object.keys(targets[userId][siteType]).length;
+  }
+  retryBudget = new RetryBudget(count);
   
   for (const userId in targets) {
     results[userId] = {};
     const userSites = targets[userId];
 
     for (const siteType in userSites) {
-      results[userId][siteType] = [];
-      const accounts = userSites[siteType];
-      
-      for (const [name, cookie] of Object.entries(accounts)) {
-        try {
-          const res = await getSigninStats(name, cookie, siteType, days);
-          results[userId][siteType].push(res);
-        } catch (e) {
-          const siteConfig = SITES_CONFIG[siteType] || { emoji: '❓', name: 'Unknown' };
-          results[userId][siteType].push({ 
-            name, 
-            result: `🚫 查询异常: ${e.message}`,
-            site_type: siteType
-          });
-          writeLog(`⚠️ 用户 ${userId} ${siteConfig.emoji} ${siteConfig.name} 账号 ${name} 统计异常: ${e.stack || e.message}`);
-        }
-      }
+      const accounts = Object.entries(userSites[siteType]);
+      const slots = new Array(accounts.length);
+      results[userId][siteType] = slots;
+      pools[siteType] = pools[siteType] || createPool(STATS_CONCURRENCY);
+
+      accounts.forEach(([name, cookie], i) => {
+        tasks.push(pools[siteType](async () => {
+          try {
+            slots[i] = await getSigninStats(name, cookie, siteType, days);
+          } catch (e) {
+            const siteConfig = SITES_CONFIG[siteType] || { emoji: '❓', name: 'Unknown' };
+            slots[i] = { 
+              name, 
+              result: `🚫 查询异常: ${e.message}`,
+              site_type: siteType
+            };
+            log.error(`⚠️ 用户 ${userId} ${siteConfig.emoji} ${siteConfig.name} 账号 ${name} 统计异常: ${e.stack || e.message}`);
+          }
+        }));
+      });
     }
   }
   
+  await Promise.all(tasks);
+  const budget = retryBudget.stats();
+  if (budget.used || budget.denied) {
+    log.info(`重试预算: 已用 ${budget.used}/${budget.total}，拒绝 ${budget.denied} 次`);
+  }
   return results;
 }
 
-module.exports = { statsAccounts };
+module.exports = { statsAccounts, syncLedger, getSigninStats };
 
 // CLI 入口
 if (require.main === module) {
@@ -206,9 +422,13 @@ if (require.main === module) {
       const payload = JSON.parse(process.argv[2]);
       const { targets, days } = payload;
       const results = await statsAccounts(targets, days || 30);
+      await saveLimiterState();
+      log.info(`限速器状态: ${JSON.stringify(limiterStats())}`);
+      await log.close();
       console.log(JSON.stringify(results));
     } catch (err) {
       console.error("stats_dual.js 运行出错:", err.message);
+      log.error(`stats_dual.js 运行出错: ${err.stack || err.message}`);
       process.exit(1);
     }
   })();
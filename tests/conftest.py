@@ -0,0 +1,27 @@
+# 模块都在仓库根目录，测试直接按模块名导入
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    """在临时目录中使用 bot 模块：./data 下的文件都落在 tmp_path，进程内的签到状态每个用例重新开始"""
+    pytest.importorskip("telegram")
+    monkeypatch.chdir(tmp_path)
+    import bot as module
+    import circuit_breaker
+    from job_store import JobStore
+    from quarantine import Quarantine
+    from sign_ledger import SignLedger
+
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(module, "sign_ledger", SignLedger())
+    monkeypatch.setattr(module, "credential_quarantine", Quarantine())
+    monkeypatch.setattr(module, "sign_store", JobStore())
+    monkeypatch.setattr(module, "deferred_signs", {})
+    monkeypatch.setattr(module, "inflight_signs", {})
+    return module
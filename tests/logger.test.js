@@ -0,0 +1,84 @@
+// logger.js：只轮转已停止写入的旧日志、不覆盖已有压缩包、退出时不丢异步写入中的日志
+const { test } = require('node:test');
+const assert = require('node:assert');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const zlib = require('zlib');
+const { spawnSync } = require('child_process');
+
+const LOG_DIR = fs.mkdtempSync(path.join(os.tmpdir(), 'logger-test-'));
+process.env.LOG_DIR = LOG_DIR;
+const log = require('../logger');
+
+function daysAgo(n) {
+  return new Date(Date.now() + 8 * 3600 * 1000 - n * 86400 * 1000).toISOString().slice(0, 10);
+}
+
+function writeLog(date, text, ageMs) {
+  const file = path.join(LOG_DIR, `${date}.log`);
+  fs.writeFileSync(file, text);
+  const t = (Date.now() - ageMs) / 1000;
+  fs.utimesSync(file, t, t);
+  return file;
+}
+
+function readArchive(date) {
+  return zlib.gunzipSync(fs.readFileSync(path.join(LOG_DIR, `${date}.log.gz`))).toString();
+}
+
+test('压缩已停止写入的旧日志', async () => {
+  const date = daysAgo(2);
+  const file = writeLog(date, 'old line\n', 3600 * 1000);
+  await log.rotate();
+  assert.ok(!fs.existsSync(file));
+  assert.strictEqual(readArchive(date), 'old line\n');
+});
+
+test('最近仍有写入的旧日志暂不压缩', async () => {
+  const date = daysAgo(3);
+  const file = writeLog(date, 'late line\n', 1000);
+  await log.rotate();
+  assert.ok(fs.existsSync(file));
+  assert.ok(!fs.existsSync(`${file}.gz`));
+});
+
+test('已有压缩包时追加而不是覆盖', async () => {
+  const date = daysAgo(4);
+  fs.writeFileSync(path.join(LOG_DIR, `${date}.log.gz`), zlib.gzipSync('first\n'));
+  writeLog(date, 'second\n', 3600 * 1000);
+  await log.rotate();
+  assert.strictEqual(readArchive(date), 'first\nsecond\n');
+});
+
+test('其他进程持有轮转锁时跳过', async () => {
+  const date = daysAgo(5);
+  const file = writeLog(date, 'locked\n', 3600 * 1000);
+  const lock = path.join(LOG_DIR, '.rotate.lock');
+  fs.writeFileSync(lock, '99999');
+  await log.rotate();
+  assert.ok(fs.existsSync(file));
+  // 崩溃进程留下的旧锁会被清理
+  const t = (Date.now() - 3600 * 1000) / 1000;
+  fs.utimesSync(lock, t, t);
+  await log.rotate();
+  assert.ok(!fs.existsSync(file));
+  assert.ok(!fs.existsSync(lock));
+});
+
+test('process.exit 时写完异步写入中的日志', () => {
+  const dir = fs.mkdtempSync(path.join(os.tmpdir(), 'logger-exit-'));
+  const code = `
+    const log = require(${JSON.stringify(path.join(__dirname, '..', 'logger'))});
+    for (let i = 0; i < 500; i++) log.info('line ' + i);
+    log.flush();
+    log.info('last');
+    process.exit(1);
+  `;
+  const res = spawnSync(process.execPath, ['-e', code], { env: { ...process.env, LOG_DIR: dir } });
+  assert.strictEqual(res.status, 1);
+  const text = fs.readdirSync(dir).filter(f => f.endsWith('.log'))
+    .map(f => fs.readFileSync(path.join(dir, f), 'utf-8')).join('');
+  for (let i = 0; i < 500; i++) assert.ok(text.includes(`line ${i}\n`), `missing line ${i}`);
+  assert.ok(text.includes('last\n'));
+});
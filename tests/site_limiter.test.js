@@ -0,0 +1,77 @@
+// site_limiter.js：AIMD 增减、跨实例平分速率、取令牌不读写文件、过期锁处理
+const { test, beforeEach } = require('node:test');
+const assert = require('node:assert');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+
+const dir = fs.mkdtempSync(path.join(os.tmpdir(), 'limiter-test-'));
+const STATE_FILE = path.join(dir, 'site_limits.json');
+process.env.SITE_LIMITS_FILE = STATE_FILE;
+process.env.SITE_RATE_INIT = '2';
+process.env.SITE_RATE_STEP = '0.1';
+const { SiteLimiter } = require('../site_limiter');
+
+const readState = () => JSON.parse(fs.readFileSync(STATE_FILE, 'utf-8'));
+
+beforeEach(() => {
+  fs.rmSync(STATE_FILE, { force: true });
+  fs.rmSync(`${STATE_FILE}.lock`, { force: true });
+});
+
+test('成功在下次同步时加性增长', async () => {
+  const limiter = new SiteLimiter('ns');
+  await limiter._sync();
+  for (let i = 0; i < 5; i++) limiter.onSuccess();
+  assert.strictEqual(readState().ns.rate, 2);
+  await limiter._sync();
+  assert.ok(Math.abs(readState().ns.rate - 2.5) < 1e-9);
+});
+
+test('风控减半，冷却期内只降一次', async () => {
+  const limiter = new SiteLimiter('ns');
+  await limiter.onThrottle();
+  await limiter.onThrottle();
+  assert.strictEqual(readState().ns.rate, 1);
+  assert.ok(limiter.tokens < 0.01);
+});
+
+test('多个实例平分共享速率并看到彼此的降速', async () => {
+  const a = new SiteLimiter('ns');
+  const b = new SiteLimiter('ns');
+  await a._sync();
+  await b._sync();
+  await a._sync();
+  assert.strictEqual(a.share, 1);
+  assert.strictEqual(b.share, 1);
+  await b.onThrottle();
+  await a._sync();
+  assert.strictEqual(a.rate, 1);
+  await b.flush();
+  await a._sync();
+  assert.deepStrictEqual(Object.keys(readState().ns.procs), [a.procId]);
+  assert.strictEqual(a.share, a.rate);
+});
+
+test('两次同步之间取令牌不写文件', async () => {
+  const limiter = new SiteLimiter('ns');
+  await limiter._sync();
+  const { mtimeMs } = fs.statSync(STATE_FILE);
+  limiter.tokens = 3;
+  for (let i = 0; i < 3; i++) await limiter.acquire();
+  assert.strictEqual(fs.statSync(STATE_FILE).mtimeMs, mtimeMs);
+});
+
+test('过期锁被清理，新锁不被误删', async () => {
+  const lock = `${STATE_FILE}.lock`;
+  fs.writeFileSync(lock, 'holder');
+  const limiter = new SiteLimiter('ns');
+  const pending = limiter._sync();
+  await new Promise(res => setTimeout(res, 50));
+  assert.strictEqual(fs.readFileSync(lock, 'utf-8'), 'holder');
+  const old = (Date.now() - 60 * 1000) / 1000;
+  fs.utimesSync(lock, old, old);
+  await pending;
+  assert.ok(!fs.existsSync(lock));
+  assert.ok(readState().ns.procs[limiter.procId]);
+});
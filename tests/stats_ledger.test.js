@@ -0,0 +1,84 @@
+// stats_dual.js 账本同步：某页请求失败时不能把残缺的账本当作已同步
+const { test } = require('node:test');
+const assert = require('node:assert');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+
+const tmp = fs.mkdtempSync(path.join(os.tmpdir(), 'ledger-test-'));
+process.env.LEDGER_DIR = path.join(tmp, 'ledger');
+process.env.LOG_DIR = path.join(tmp, 'logs');
+
+const cloudscraper = require('cloudscraper');
+const { getLimiter } = require('../site_limiter');
+const { syncLedger, getSigninStats } = require('../stats_dual');
+
+// 不经过共享令牌桶
+const limiter = getLimiter('ns');
+limiter.acquire = async () => {};
+limiter.onSuccess = () => {};
+limiter.onThrottle = () => {};
+
+const PAGE_SIZE = 10;
+const DAY = 86400 * 1000;
+const now = Date.now();
+// 近 25 天每天一条签到收益，按时间倒序
+const RECORDS = Array.from({ length: 25 }, (_, i) => [5, 1000 - i * 5, '签到收益5个鸡腿', new Date(now - i * DAY - 3600 * 1000).toISOString()]);
+
+let failing = new Set();
+let requests = [];
+
+cloudscraper.get = async ({ uri }) => {
+  const m = uri.match(/page-(\d+)$/);
+  if (!m) return { statusCode: 200, body: '' };   // /board
+  const page = Number(m[1]);
+  requests.push(page);
+  if (failing.has(page)) return { statusCode: 200, body: JSON.stringify({ success: false, message: 'busy' }) };
+  const data = RECORDS.slice((page - 1) * PAGE_SIZE, page * PAGE_SIZE);
+  return { statusCode: 200, body: JSON.stringify({ success: true, data }) };
+};
+
+function ledgerFile() {
+  return JSON.parse(fs.readFileSync(path.join(process.env.LEDGER_DIR, 'ns_alice.json'), 'utf-8'));
+}
+
+const cutoff = () => now - 30 * DAY;
+
+test('首次同步中途失败：保存已拉到的记录但不标记为已同步', async () => {
+  failing = new Set([2]);
+  const { ledger, error } = await syncLedger('alice', 'cookie', 'ns', cutoff());
+  assert.ok(error);
+  assert.strictEqual(ledger.records.length, PAGE_SIZE);
+  const saved = ledgerFile();
+  assert.strictEqual(saved.synced_at, 0);
+  assert.strictEqual(saved.complete, false);
+});
+
+test('残缺账本统计结果标记为 stale', async () => {
+  failing = new Set([2]);
+  const r = await getSigninStats('alice', 'cookie', 'ns', 30);
+  assert.strictEqual(r.stale, true);
+  assert.strictEqual(r.synced_at, 0);
+  assert.strictEqual(r.stats.days_count, PAGE_SIZE);
+});
+
+test('回填中途失败：保留原同步时间，下次继续回填', async () => {
+  failing = new Set([3]);
+  const { ledger, error } = await syncLedger('alice', 'cookie', 'ns', cutoff());
+  assert.ok(error);
+  assert.strictEqual(ledger.records.length, 2 * PAGE_SIZE);
+  assert.strictEqual(ledgerFile().synced_at, 0);
+  assert.strictEqual(ledgerFile().complete, false);
+});
+
+test('恢复后补齐账本并标记为最新', async () => {
+  failing = new Set();
+  requests = [];
+  const r = await getSigninStats('alice', 'cookie', 'ns', 30);
+  assert.strictEqual(r.stale, false);
+  assert.strictEqual(r.stats.days_count, RECORDS.length);
+  assert.ok(requests.includes(3));
+  const saved = ledgerFile();
+  assert.ok(saved.synced_at > 0);
+  assert.strictEqual(saved.complete, true);
+});
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import subprocess
+
+
+def account(cookie):
+    return {"cookie": cookie, "username": "a", "password": "pw"}
+
+
+def capture_node(results):
+    payloads = []
+
+    async def run_node(script, payload, timeout=None):
+        payloads.append(payload)
+        return subprocess.CompletedProcess([script], 0, json.dumps(results), "")
+    return run_node, payloads
+
+
+def test_share_cookie_updates_every_binding(bot):
+    bot.save_data({"users": {
+        "1": {"accounts": {"ns": {"a": account("old")}}},
+        "2": {"accounts": {"ns": {"a": account("old"), "b": account("b")}}},
+        "3": {"accounts": {"ns": {}, "df": {"a": account("df")}}},
+    }})
+
+    assert bot.share_cookie("ns", "a", "new") == ["1", "2"]
+
+    users = bot.load_data()["users"]
+    assert users["1"]["accounts"]["ns"]["a"]["cookie"] == "new"
+    assert users["2"]["accounts"]["ns"]["a"]["cookie"] == "new"
+    assert users["2"]["accounts"]["ns"]["b"]["cookie"] == "b"
+    assert users["3"]["accounts"]["df"]["a"]["cookie"] == "df"
+
+
+def test_account_bound_twice_signed_once(bot, monkeypatch):
+    run_node, payloads = capture_node({"1": {"ns": [{"name": "a", "result": "✅ 收益 5"}]}})
+    monkeypatch.setattr(bot, "run_node", run_node)
+    targets = {"1": {"ns": {"a": account("c")}}, "2": {"ns": {"a": account("c")}}}
+
+    results = asyncio.run(bot.run_sign_and_fix(targets, {}, {"users": {}}))
+
+    assert payloads[0]["targets"] == {"1": {"ns": {"a": "c"}}}
+    assert results["2"]["ns"][0]["result"] == "✅ 收益 5"
+    assert results["2"]["ns"][0]["shared"] and not results["2"]["ns"][0]["no_log"]
+
+
+def test_stats_queries_user_targets_as_given(bot, monkeypatch):
+    run_node, payloads = capture_node({"1": {"ns": [{"name": "a", "result": "✅ 共 3 天"}]}})
+    monkeypatch.setattr(bot, "run_node", run_node)
+    bot.get_breaker("df").trip()
+
+    results, err = asyncio.run(bot.run_stats_script({"1": {"ns": {"a": "c"}, "df": {"b": "d"}}}, 30))
+
+    assert err is None
+    assert payloads[0]["targets"] == {"1": {"ns": {"a": "c"}}}
+    assert results["1"]["ns"][0]["name"] == "a"
+    assert results["1"]["df"][0]["result"].startswith("⏸️")
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import auto_delete
+from auto_delete import DeleteScheduler
+
+
+class FakeBot:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.deleted.append((chat_id, list(message_ids)))
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(auto_delete, "DELETE_RATE", 1000)
+    return DeleteScheduler(str(tmp_path / "pending.json"))
+
+
+def record_writes(scheduler):
+    writes = []
+    write = scheduler._write
+
+    def wrapper(pending, seq):
+        writes.append((threading.get_ident(), len(pending)))
+        write(pending, seq)
+    scheduler._write = wrapper
+    return writes
+
+
+def test_burst_of_schedules_saved_once_off_loop(scheduler, monkeypatch):
+    monkeypatch.setattr(auto_delete, "SAVE_INTERVAL", 0.05)
+    writes = record_writes(scheduler)
+
+    async def scenario():
+        scheduler.start(FakeBot())
+        for message_id in range(100):
+            scheduler.schedule(1, message_id, 60)
+        await asyncio.sleep(0.2)
+        loop_thread = threading.get_ident()
+        await scheduler.stop()
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+
+    # 启动后的一次合并保存 + stop 时的最终保存
+    assert [n for _, n in writes] == [100, 100]
+    assert all(ident != loop_thread for ident, _ in writes)
+    with open(scheduler.state_file, encoding="utf-8") as f:
+        assert len(json.load(f)) == 100
+
+
+def test_older_snapshot_does_not_overwrite_newer(scheduler):
+    scheduler._write([[1.0, 1, 1], [2.0, 1, 2]], 2)
+    scheduler._write([[1.0, 1, 1]], 1)
+
+    with open(scheduler.state_file, encoding="utf-8") as f:
+        assert len(json.load(f)) == 2
+
+
+def test_only_earlier_message_wakes_scheduler(scheduler):
+    async def scenario():
+        scheduler._wake = asyncio.Event()
+        scheduler.schedule(1, 1, 60)
+        first = scheduler._wake.is_set()
+        scheduler._wake.clear()
+        scheduler.schedule(1, 2, 120)
+        later = scheduler._wake.is_set()
+        scheduler.schedule(1, 3, 10)
+        return first, later, scheduler._wake.is_set()
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+
+def test_due_messages_deleted_and_pending_survive_restart(scheduler):
+    bot = FakeBot()
+
+    async def scenario():
+        scheduler.start(bot)
+        scheduler.schedule(1, 1, 0.01)
+        scheduler.schedule(1, 2, 0.01)
+        scheduler.schedule(2, 3, 60)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+    assert bot.deleted == [(1, [1, 2])]
+    restarted = DeleteScheduler(scheduler.state_file)
+    restarted._load()
+    assert [(chat_id, message_id) for _, chat_id, message_id in restarted.heap] == [(2, 3)]
@@ -0,0 +1,105 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", c)
+    return c
+
+
+def trip(breaker):
+    for _ in range(circuit_breaker.MIN_CALLS):
+        breaker.record(False)
+
+
+def test_stays_closed_below_min_calls(clock):
+    b = CircuitBreaker("ns")
+    for _ in range(circuit_breaker.MIN_CALLS - 1):
+        b.record(False)
+    assert b.state == CLOSED
+    assert b.acquire(10) == 10
+
+
+def test_opens_when_error_ratio_reached(clock):
+    b = CircuitBreaker("ns")
+    trip(b)
+    assert b.state == OPEN
+    assert b.acquire(3) == 0
+    assert not b.allow()
+
+
+def test_successes_keep_ratio_below_threshold(clock):
+    b = CircuitBreaker("ns")
+    for _ in range(10):
+        b.record(True)
+    for _ in range(circuit_breaker.MIN_CALLS):
+        b.record(False)
+    assert b.state == CLOSED
+
+
+def test_half_open_allows_single_probe(clock):
+    b = CircuitBreaker("ns")
+    trip(b)
+    clock.now += circuit_breaker.OPEN_SECONDS
+    assert b.acquire(5) == 1
+    assert b.snapshot()["state"] == HALF_OPEN
+    assert not b.allow()
+
+
+def test_probe_success_closes(clock):
+    b = CircuitBreaker("ns")
+    trip(b)
+    clock.now += circuit_breaker.OPEN_SECONDS
+    assert b.allow()
+    b.record(True)
+    assert b.state == CLOSED
+    assert b.allow()
+
+
+def test_probe_failure_reopens(clock):
+    b = CircuitBreaker("ns")
+    trip(b)
+    clock.now += circuit_breaker.OPEN_SECONDS
+    assert b.allow()
+    b.record(False)
+    assert b.state == OPEN
+    assert not b.allow()
+
+
+def test_release_returns_probe(clock):
+    b = CircuitBreaker("ns")
+    trip(b)
+    clock.now += circuit_breaker.OPEN_SECONDS
+    assert b.allow()
+    b.release()
+    assert b.allow()
+
+
+def test_unreported_probe_expires_after_open_seconds(clock):
+    b = CircuitBreaker("ns")
+    trip(b)
+    clock.now += circuit_breaker.OPEN_SECONDS
+    assert b.allow()
+    clock.now += circuit_breaker.OPEN_SECONDS - 1
+    assert not b.allow()
+    clock.now += 1
+    assert b.allow()
+
+
+def test_trip_opens_immediately(clock):
+    b = CircuitBreaker("ns")
+    b.trip()
+    assert b.state == OPEN
+    assert b.snapshot()["retry_in"] == circuit_breaker.OPEN_SECONDS
@@ -0,0 +1,107 @@
+import pytest
+
+import job_store
+from job_store import JobStore, due_time, plan_dates
+
+
+@pytest.fixture
+def now(monkeypatch):
+    monkeypatch.setattr(job_store, "JITTER", 0)
+    start = due_time("2026-03-01", 8, 0) + 10
+    clock = [start]
+    monkeypatch.setattr(job_store.time, "time", lambda: clock[0])
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"), owner="a")
+
+
+def state_of(store, job_id):
+    with store._connect() as conn:
+        return dict(conn.execute("SELECT * FROM sign_jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def test_plan_today_and_tomorrow_once(store, now):
+    assert store.plan({"1": (8, 0)}, now[0]) == 2
+    assert store.plan({"1": (8, 0)}, now[0]) == 0
+    assert plan_dates(now[0]) == ["2026-03-01", "2026-03-02"]
+
+
+def test_plan_skips_past_catchup_window(store, now):
+    late = now[0] + job_store.CATCHUP_GRACE + 60
+    assert store.plan({"1": (8, 0)}, late) == 1
+
+
+def test_claim_is_exclusive(store, now):
+    store.plan({"1": (8, 0)}, now[0])
+    other = JobStore(store.path, owner="b")
+    assert [j[0] for j in store.claim(10, now[0])] == ["1:2026-03-01"]
+    assert other.claim(10, now[0]) == []
+
+
+def test_expired_lease_is_reclaimed(store, now):
+    store.plan({"1": (8, 0)}, now[0])
+    store.claim(10, now[0])
+    other = JobStore(store.path, owner="b")
+    later = now[0] + job_store.LEASE_SECONDS + 1
+    assert [j[0] for j in other.claim(10, later)] == ["1:2026-03-01"]
+    row = state_of(store, "1:2026-03-01")
+    assert row["lease_owner"] == "b" and row["attempts"] == 2
+    # 原持有者的租约已被接管，迟到的完成不生效
+    store.complete("1:2026-03-01")
+    assert state_of(store, "1:2026-03-01")["state"] == job_store.RUNNING
+
+
+def test_lease_expiry_gives_up_after_max_attempts(store, now, monkeypatch):
+    monkeypatch.setattr(job_store, "CATCHUP_GRACE", 10 ** 6)
+    store.plan({"1": (8, 0)}, now[0])
+    t = now[0]
+    for _ in range(job_store.MAX_ATTEMPTS):
+        assert store.claim(10, t)
+        t += job_store.LEASE_SECONDS + 1
+    assert store.claim(10, t) == []
+    row = state_of(store, "1:2026-03-01")
+    assert row["state"] == job_store.FAILED and row["error"] == "lease expired"
+
+
+def test_fail_retries_then_gives_up(store, now):
+    store.plan({"1": (8, 0)}, now[0])
+    job_id = "1:2026-03-01"
+    for attempt in range(1, job_store.MAX_ATTEMPTS + 1):
+        assert [j[0] for j in store.claim(10, now[0])] == [job_id]
+        store.fail(job_id, "boom")
+        row = state_of(store, job_id)
+        if attempt < job_store.MAX_ATTEMPTS:
+            assert row["state"] == job_store.PENDING
+            assert row["due_at"] == now[0] + job_store.RETRY_DELAY
+            now[0] = row["due_at"]
+    assert row["state"] == job_store.FAILED
+
+
+def test_complete_and_release(store, now):
+    store.plan({"1": (8, 0), "2": (8, 0)}, now[0])
+    store.claim(10, now[0])
+    store.complete("1:2026-03-01")
+    store.release()
+    assert state_of(store, "1:2026-03-01")["state"] == job_store.DONE
+    released = state_of(store, "2:2026-03-01")
+    assert released["state"] == job_store.PENDING and released["attempts"] == 0
+
+
+def test_missed_jobs_are_failed(store, now):
+    store.plan({"1": (8, 0)}, now[0])
+    late = now[0] + job_store.CATCHUP_GRACE + 60
+    assert store.claim(10, late) == []
+    assert state_of(store, "1:2026-03-01")["error"] == "missed"
+
+
+def test_reschedule_moves_pending_only(store, now):
+    store.plan({"1": (8, 0)}, now[0])
+    store.reschedule("1", 9, 30, now[0])
+    assert state_of(store, "1:2026-03-01")["due_at"] == due_time("2026-03-01", 9, 30)
+    store.claim(10, due_time("2026-03-01", 9, 30))
+    store.reschedule("1", 10, 0, now[0])
+    assert state_of(store, "1:2026-03-01")["state"] == job_store.RUNNING
+    assert state_of(store, "1:2026-03-02")["due_at"] == due_time("2026-03-02", 10, 0)
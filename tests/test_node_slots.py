@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from shard import ShardRouter  # noqa: E402
+
+
+def uids_per_worker(router, count=2):
+    """找出落在不同工作进程上的 uid"""
+    found = {}
+    for uid in range(1000):
+        found.setdefault(router.owner(str(uid)), str(uid))
+        if len(found) == count:
+            return list(found.values())
+    raise AssertionError("哈希环分布异常")
+
+
+@pytest.fixture
+def sharded(bot, monkeypatch):
+    router = ShardRouter(["http://w1", "http://w2"], shared_data=True)
+    for worker in router.configured:
+        router.ring.add(worker)
+    running = {}
+    peak = {}
+
+    async def post(worker, path, body, timeout):
+        running[worker] = running.get(worker, 0) + 1
+        peak[worker] = max(peak.get(worker, 0), running[worker])
+        peak["total"] = max(peak.get("total", 0), sum(running.values()))
+        await asyncio.sleep(0.05)
+        running[worker] -= 1
+        return {"returncode": 0, "stdout": json.dumps({uid: {} for uid in body["payload"]["targets"]}), "stderr": ""}
+
+    monkeypatch.setattr(router, "_post", post)
+    monkeypatch.setattr(bot, "shard_router", router)
+    monkeypatch.setattr(bot, "node_gates", {None: bot.node_gate})
+    monkeypatch.setattr(bot, "site_gates", {})
+    return router, peak
+
+
+def test_same_site_runs_in_parallel_on_different_workers(bot, sharded):
+    router, peak = sharded
+    a, b = uids_per_worker(router)
+    payload = {"targets": {a: {"ns": {"x": "c"}}, b: {"ns": {"y": "c"}}}}
+
+    proc = asyncio.run(bot.run_node("sign_dual.js", payload, 30))
+
+    assert proc.returncode == 0
+    assert set(json.loads(proc.stdout)) == {a, b}
+    assert peak["total"] == 2
+
+
+def test_site_cap_applies_per_worker(bot, sharded):
+    router, peak = sharded
+    a, _ = uids_per_worker(router)
+    payload = {"targets": {a: {"ns": {"x": "c"}}}}
+
+    async def run():
+        await asyncio.gather(*(bot.run_node("sign_dual.js", payload, 30) for _ in range(3)))
+
+    asyncio.run(run())
+    assert peak[router.owner(a)] == bot.NODE_SITE_CONCURRENCY
@@ -0,0 +1,136 @@
+import asyncio
+
+import priority_lanes
+from priority_lanes import PriorityGate, INTERACTIVE, SCHEDULED, BACKGROUND
+
+WEIGHTS = {INTERACTIVE: 8, SCHEDULED: 3, BACKGROUND: 1}
+
+
+async def queue_waiters(gate, lanes, order):
+    async def waiter(lane):
+        await gate.acquire(lane)
+        order.append(lane)
+
+    tasks = [asyncio.create_task(waiter(lane)) for lane in lanes]
+    await asyncio.sleep(0)
+    return tasks
+
+
+async def drain(gate, tasks, order, n):
+    for _ in range(n):
+        gate.release()
+        await asyncio.sleep(0)
+    return order[:n]
+
+
+def test_acquire_within_capacity_is_immediate():
+    async def run():
+        gate = PriorityGate(2, WEIGHTS)
+        await gate.acquire(SCHEDULED)
+        await gate.acquire(BACKGROUND)
+        assert gate.in_use == 2
+        gate.release()
+        assert gate.in_use == 1
+    asyncio.run(run())
+
+
+def test_slots_split_by_weight():
+    async def run():
+        gate = PriorityGate(1, WEIGHTS)
+        await gate.acquire(INTERACTIVE)
+        order = []
+        tasks = await queue_waiters(gate, [SCHEDULED] * 20 + [INTERACTIVE] * 20, order)
+        served = await drain(gate, tasks, order, 11)
+        assert served.count(INTERACTIVE) == 8
+        assert served.count(SCHEDULED) == 3
+        for t in tasks:
+            t.cancel()
+    asyncio.run(run())
+
+
+def test_low_weight_lane_is_not_starved():
+    async def run():
+        gate = PriorityGate(1, WEIGHTS)
+        await gate.acquire(INTERACTIVE)
+        order = []
+        tasks = await queue_waiters(gate, [INTERACTIVE] * 30 + [BACKGROUND], order)
+        served = await drain(gate, tasks, order, 10)
+        assert BACKGROUND in served
+        for t in tasks:
+            t.cancel()
+    asyncio.run(run())
+
+
+def test_idle_lane_cannot_bank_credit():
+    async def run():
+        gate = PriorityGate(1, WEIGHTS)
+        # 定时通道独占一段时间，交互通道一直空闲
+        for _ in range(30):
+            await gate.acquire(SCHEDULED)
+            gate.release()
+        await gate.acquire(SCHEDULED)
+        order = []
+        tasks = await queue_waiters(gate, [INTERACTIVE] * 20 + [SCHEDULED] * 20, order)
+        served = await drain(gate, tasks, order, 11)
+        assert served.count(SCHEDULED) >= 2
+        for t in tasks:
+            t.cancel()
+    asyncio.run(run())
+
+
+def test_max_wait_overrides_weights(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(priority_lanes, "monotonic", lambda: clock[0])
+
+    async def run():
+        gate = PriorityGate(1, WEIGHTS, max_wait=60)
+        await gate.acquire(INTERACTIVE)
+        order = []
+        tasks = await queue_waiters(gate, [BACKGROUND], order)
+        clock[0] += 61
+        tasks += await queue_waiters(gate, [INTERACTIVE] * 3, order)
+        served = await drain(gate, tasks, order, 1)
+        assert served == [BACKGROUND]
+        for t in tasks:
+            t.cancel()
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        gate = PriorityGate(1, WEIGHTS)
+        await gate.acquire(INTERACTIVE)
+        order = []
+        tasks = await queue_waiters(gate, [SCHEDULED, INTERACTIVE], order)
+        tasks[0].cancel()
+        await asyncio.sleep(0)
+        assert gate.stats()[SCHEDULED]["queued"] == 0
+        gate.release()
+        await asyncio.sleep(0)
+        assert order == [INTERACTIVE]
+        assert gate.in_use == 1
+    asyncio.run(run())
+
+
+def test_cancel_after_grant_returns_slot():
+    async def run():
+        gate = PriorityGate(1, WEIGHTS)
+        await gate.acquire(INTERACTIVE)
+        order = []
+        tasks = await queue_waiters(gate, [SCHEDULED], order)
+        gate.release()       # 名额交给等待者，但它还没来得及运行就被取消
+        tasks[0].cancel()
+        await asyncio.sleep(0)
+        assert order == []
+        assert gate.in_use == 0
+    asyncio.run(run())
+
+
+def test_slot_context_releases():
+    async def run():
+        gate = PriorityGate(1, WEIGHTS)
+        async with gate.slot(SCHEDULED):
+            assert gate.in_use == 1
+        assert gate.in_use == 0
+        assert gate.stats()[SCHEDULED]["served"] == 1
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import pytest
+
+import quarantine
+from quarantine import Quarantine
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(quarantine.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def store(tmp_path):
+    return Quarantine(str(tmp_path / "quarantine.json"))
+
+
+def test_not_blocked_below_threshold(store, clock):
+    for _ in range(quarantine.QUARANTINE_AFTER - 1):
+        store.record_failure("ns", "alice", "rejected")
+    assert store.blocked("ns", "alice") is None
+
+
+def test_blocked_after_threshold_and_expires(store, clock):
+    for _ in range(quarantine.QUARANTINE_AFTER):
+        entry = store.record_failure("ns", "alice", "rejected")
+    assert entry["until"] == clock[0] + quarantine.QUARANTINE_BASE
+    assert store.blocked("ns", "alice")["reason"] == "rejected"
+    assert store.blocked("df", "alice") is None
+    clock[0] += quarantine.QUARANTINE_BASE
+    assert store.blocked("ns", "alice") is None
+
+
+def test_duration_doubles_and_is_capped(store, clock):
+    durations = []
+    for _ in range(quarantine.QUARANTINE_AFTER + 10):
+        entry = store.record_failure("ns", "alice", "rejected")
+        durations.append(entry["until"] - clock[0])
+    grown = durations[quarantine.QUARANTINE_AFTER - 1:]
+    assert grown[1] == 2 * grown[0]
+    assert max(grown) == quarantine.QUARANTINE_MAX
+
+
+def test_success_clears_entry(store, clock):
+    for _ in range(quarantine.QUARANTINE_AFTER):
+        store.record_failure("ns", "alice", "rejected")
+    store.record_success("ns", "alice")
+    assert store.blocked("ns", "alice") is None
+    assert store.stats() == {"quarantined": 0, "tracked": 0}
+
+
+def test_take_unnotified_only_once(store, clock):
+    for _ in range(quarantine.QUARANTINE_AFTER):
+        store.record_failure("ns", "alice", "rejected")
+    store.record_failure("ns", "bob", "rejected")
+    assert list(store.take_unnotified()) == ["ns:alice"]
+    assert store.take_unnotified() == {}
+
+
+def test_state_survives_reload(store, clock):
+    for _ in range(quarantine.QUARANTINE_AFTER):
+        store.record_failure("ns", "alice", "rejected")
+    reloaded = Quarantine(store.path)
+    assert reloaded.blocked("ns", "alice") is not None
+    assert list(reloaded.take_unnotified()) == ["ns:alice"]
+
+
+def test_signin_failure_reason():
+    pytest.importorskip("curl_cffi")
+    pytest.importorskip("dotenv")
+    from nodeseek_login_dual import signin_failure_reason
+    assert signin_failure_reason({"message": "Turnstile 验证失败"}) == "solver"
+    assert signin_failure_reason({"msg": "captcha expired"}) == "solver"
+    assert signin_failure_reason({"message": "用户名或密码错误"}) == "rejected"
+    assert signin_failure_reason({}) == "rejected"
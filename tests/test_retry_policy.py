@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import retry_policy
+from retry_policy import (
+    POLICIES, RetryBudget, backoff, current_budget, retry_call, should_retry, use_budget, with_retry,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry_policy.time, "sleep", slept.append)
+
+    async def fake_sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(retry_policy.asyncio, "sleep", fake_sleep)
+    return slept
+
+
+def sequence(*results):
+    it = iter(results)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return next(it)
+
+    fn.calls = calls
+    return fn
+
+
+def classify(result):
+    return None if result == "ok" else result
+
+
+def test_budget_size():
+    assert RetryBudget(1).total == retry_policy.BUDGET_MIN
+    assert RetryBudget(100).total == 20
+
+
+def test_budget_exhaustion_counts_denials():
+    budget = RetryBudget(1)
+    for _ in range(budget.total):
+        assert budget.try_consume()
+    assert not budget.try_consume()
+    assert budget.stats() == {"total": budget.total, "used": budget.total, "denied": 1}
+
+
+def test_should_retry_follows_policy():
+    assert should_retry("network", 3)
+    assert not should_retry("network", 4)
+    assert not should_retry("throttled", 1)
+    assert not should_retry("auth", 1)
+    assert not should_retry("unknown", 1)
+
+
+def test_backoff_within_cap():
+    for attempt in range(1, 10):
+        delay = backoff("network", attempt)
+        assert 0 <= delay <= min(POLICIES["network"]["cap"], POLICIES["network"]["base"] * 2 ** (attempt - 1))
+
+
+def test_retry_call_until_success(no_sleep):
+    fn = sequence("network", "server", "ok")
+    assert retry_call(fn, classify) == "ok"
+    assert len(fn.calls) == 3 and len(no_sleep) == 2
+
+
+def test_retry_call_gives_up_per_class():
+    fn = sequence("server", "server", "server", "ok")
+    assert retry_call(fn, classify, RetryBudget(100)) == "server"
+    assert len(fn.calls) == POLICIES["server"]["retries"] + 1
+
+
+def test_no_retry_when_throttled():
+    fn = sequence("throttled", "ok")
+    assert retry_call(fn, classify) == "throttled"
+    assert len(fn.calls) == 1
+
+
+def test_shared_budget_caps_batch_retries():
+    with use_budget(1) as budget:
+        assert current_budget.get() is budget
+        calls = 0
+        for _ in range(5):
+            fn = sequence("network", "ok")
+            retry_call(fn, classify)
+            calls += len(fn.calls)
+    assert current_budget.get() is None
+    assert budget.used == budget.total
+    assert calls == 5 + budget.total
+
+
+def test_with_retry_async():
+    results = iter(["network", "ok"])
+
+    async def fn():
+        return next(results)
+
+    assert asyncio.run(with_retry(fn, classify)) == "ok"
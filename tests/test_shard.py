@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("httpx")
+
+from shard import HashRing, check_secret  # noqa: E402
+
+KEYS = [str(uid) for uid in range(2000)]
+
+
+def test_empty_ring():
+    assert HashRing().node_for("1") is None
+
+
+def test_assignment_is_stable_and_spread():
+    ring = HashRing(vnodes=100)
+    for node in ("w1", "w2", "w3"):
+        ring.add(node)
+    owners = {key: ring.node_for(key) for key in KEYS}
+    again = HashRing(vnodes=100)
+    for node in ("w3", "w1", "w2"):
+        again.add(node)
+    assert owners == {key: again.node_for(key) for key in KEYS}
+    for node in ("w1", "w2", "w3"):
+        assert list(owners.values()).count(node) > len(KEYS) / 6
+
+
+def test_adding_node_moves_only_its_share():
+    ring = HashRing(vnodes=100)
+    for node in ("w1", "w2", "w3"):
+        ring.add(node)
+    before = {key: ring.node_for(key) for key in KEYS}
+    ring.add("w4")
+    moved = [key for key in KEYS if ring.node_for(key) != before[key]]
+    assert all(ring.node_for(key) == "w4" for key in moved)
+    assert len(moved) < len(KEYS) / 2
+
+
+def test_removing_node_reassigns_only_its_keys():
+    ring = HashRing(vnodes=100)
+    for node in ("w1", "w2", "w3"):
+        ring.add(node)
+    before = {key: ring.node_for(key) for key in KEYS}
+    ring.remove("w2")
+    ring.remove("w2")
+    assert ring.nodes == {"w1", "w3"}
+    for key in KEYS:
+        if before[key] != "w2":
+            assert ring.node_for(key) == before[key]
+        else:
+            assert ring.node_for(key) in ("w1", "w3")
+
+
+def test_check_secret():
+    assert check_secret("s3cret", "s3cret")
+    assert not check_secret("wrong", "s3cret")
+    assert not check_secret(None, "s3cret")
+    assert not check_secret("", "")
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import subprocess
+import time
+
+import job_store
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return text
+
+
+class FakeApp:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.bot_data = {}
+
+
+def claim_job(bot, monkeypatch):
+    """排好用户 1 明天的任务并提前领取"""
+    monkeypatch.setattr(job_store, "JITTER", 0)
+    bot.save_data({"users": {"1": {"accounts": {"ns": {"a": {"cookie": "c", "username": "a", "password": "pw"}}}}}})
+    bot.sign_store.plan({"1": (8, 0)})
+    tomorrow = job_store.plan_dates()[1]
+    due = job_store.due_time(tomorrow, 8, 0)
+    [(job_id, uid, due_at)] = bot.sign_store.claim(10, due + 1)
+    return job_id, uid, due_at
+
+
+def job_state(bot, job_id):
+    with bot.sign_store._connect() as conn:
+        return dict(conn.execute("SELECT * FROM sign_jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def run_job(bot, monkeypatch, returncode, results=None):
+    async def run_node(script, payload, timeout=None):
+        return subprocess.CompletedProcess([script], returncode, json.dumps(results or {}), "boom")
+
+    monkeypatch.setattr(bot, "run_node", run_node)
+    job_id, uid, due_at = claim_job(bot, monkeypatch)
+    app = FakeApp()
+    asyncio.run(bot.run_sign_job(app, job_id, uid, due_at))
+    return job_state(bot, job_id), app.bot.sent
+
+
+def test_script_failure_retries_job(bot, monkeypatch):
+    state, sent = run_job(bot, monkeypatch, 1)
+
+    assert state["state"] == job_store.PENDING
+    assert state["due_at"] > time.time()
+    assert state["error"]
+    assert sent == []
+
+
+def test_site_error_retries_job(bot, monkeypatch):
+    state, sent = run_job(bot, monkeypatch, 0, {"1": {"ns": [{"name": "a", "result": "🚫 请求异常"}]}})
+
+    assert state["state"] == job_store.PENDING
+    assert len(sent) == 1
+
+
+def test_signed_job_completes(bot, monkeypatch):
+    state, _ = run_job(bot, monkeypatch, 0, {"1": {"ns": [{"name": "a", "result": "✅ 收益 5"}]}})
+
+    assert state["state"] == job_store.DONE
+
+
+def test_cookie_failure_is_not_retried(bot, monkeypatch):
+    monkeypatch.setattr(bot, "retry_sign_if_invalid", lambda uid, name, site_type, res, *args: asyncio.sleep(0, res))
+    state, _ = run_job(bot, monkeypatch, 0, {"1": {"ns": [{"name": "a", "result": "❌ Cookie 失效"}]}})
+
+    assert state["state"] == job_store.DONE
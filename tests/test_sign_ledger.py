@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+import sign_ledger
+from sign_ledger import SignLedger, is_signed
+
+
+@pytest.fixture
+def today(monkeypatch):
+    current = [datetime(2026, 3, 1, 9, 0, tzinfo=sign_ledger.beijing)]
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return current[0]
+
+    monkeypatch.setattr(sign_ledger, "datetime", FakeDatetime)
+    return current
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return SignLedger(str(tmp_path / "signed_today.json"))
+
+
+def test_is_signed():
+    assert is_signed("✅ 签到成功，获得 5 鸡腿")
+    assert is_signed("☑️ 今日已签到")
+    assert not is_signed("❌ Cookie 失效")
+
+
+def test_records_only_signed_results(ledger, today):
+    ledger.record("ns", "alice", "❌ 网络错误")
+    assert ledger.get("ns", "alice") is None
+    ledger.record("ns", "alice", "✅ 获得 5 鸡腿", uid="1")
+    entry = ledger.get("ns", "alice")
+    assert entry["result"] == "✅ 获得 5 鸡腿" and entry["time"] == "09:00"
+    assert ledger.stats() == {"entries": 1, "hits": 1}
+
+
+def test_already_signed_keeps_reward(ledger, today):
+    ledger.record("ns", "alice", "✅ 获得 5 鸡腿", uid="1")
+    ledger.record("ns", "alice", "☑️ 今日已签到", uid="2")
+    entry = ledger.get("ns", "alice")
+    assert entry["result"] == "✅ 获得 5 鸡腿"
+    assert entry["uids"] == ["1", "2"]
+
+
+def test_claim_log_once_per_user(ledger, today):
+    assert not ledger.claim_log("ns", "alice", "1")
+    ledger.record("ns", "alice", "✅ 获得 5 鸡腿", uid="1")
+    assert not ledger.claim_log("ns", "alice", "1")
+    assert ledger.claim_log("ns", "alice", "2")
+    assert not ledger.claim_log("ns", "alice", "2")
+
+
+def test_rolls_over_at_beijing_midnight(ledger, today):
+    ledger.record("ns", "alice", "✅ 获得 5 鸡腿")
+    today[0] = datetime(2026, 3, 2, 0, 1, tzinfo=sign_ledger.beijing)
+    assert ledger.get("ns", "alice") is None
+
+
+def test_flush_and_reload(ledger, today):
+    ledger.record("ns", "alice", "✅ 获得 5 鸡腿", uid="1")
+    ledger.flush()
+    reloaded = SignLedger(ledger.path)
+    assert reloaded.get("ns", "alice")["uids"] == ["1"]
+    today[0] = datetime(2026, 3, 2, 8, 0, tzinfo=sign_ledger.beijing)
+    assert SignLedger(ledger.path).get("ns", "alice") is None
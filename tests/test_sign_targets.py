@@ -0,0 +1,88 @@
+import asyncio
+import json
+import subprocess
+import time
+
+from circuit_breaker import OPEN, HALF_OPEN
+
+
+def account(name):
+    return {"cookie": f"cookie-{name}", "username": name, "password": "pw"}
+
+
+def node_result(returncode, results=None):
+    async def run_node(script, payload, timeout=None):
+        return subprocess.CompletedProcess([script], returncode, json.dumps(results or {}), "boom")
+    return run_node
+
+
+def half_open(bot, site_type):
+    breaker = bot.get_breaker(site_type)
+    breaker.state = HALF_OPEN
+    breaker.probes = 0
+    breaker.probe_started = time.monotonic()
+    return breaker
+
+
+def test_script_failure_keeps_deferred_and_reopens_breaker(bot, monkeypatch):
+    monkeypatch.setattr(bot, "run_node", node_result(1))
+    breaker = half_open(bot, "ns")
+    targets = {"1": {"ns": {"a": account("a"), "b": account("b")}}}
+
+    results = asyncio.run(bot.sign_targets(targets, {}, {"users": {}}, "manual"))
+
+    assert [r["name"] for r in results["1"]["ns"]] == ["b"]
+    assert results["1"]["ns"][0]["deferred"]
+    assert ("1", "ns", "b") in bot.deferred_signs
+    assert breaker.state == OPEN
+
+
+def test_script_failure_counts_against_closed_breaker(bot, monkeypatch):
+    monkeypatch.setattr(bot, "run_node", node_result(1))
+    targets = {"1": {"ns": {"a": account("a")}}}
+
+    assert asyncio.run(bot.sign_targets(targets, {}, {"users": {}}, "manual")) == {}
+    assert bot.get_breaker("ns").snapshot()["failures"] == 1
+
+
+def test_deferred_batch_saved_once(bot, monkeypatch):
+    saves = []
+    save = bot.save_deferred
+    monkeypatch.setattr(bot, "save_deferred", lambda: (saves.append(1), save()))
+    bot.get_breaker("ns").trip()
+    targets = {str(uid): {"ns": {f"acc{uid}": account(f"acc{uid}")}} for uid in range(50)}
+
+    results = asyncio.run(bot.sign_targets(targets, {}, {"users": {}}, "auto"))
+
+    assert all(r["deferred"] for sites in results.values() for r in sites["ns"])
+    assert len(saves) == 1
+    with open(bot.DEFERRED_FILE, encoding="utf-8") as f:
+        assert len(json.load(f)) == 50
+    assert len(bot.load_deferred()) == 50
+
+
+def test_shared_result_logged_once_per_user(bot, monkeypatch):
+    started = None
+
+    async def run_node(script, payload, timeout=None):
+        started.set()
+        await asyncio.sleep(0.05)
+        return subprocess.CompletedProcess([script], 0, json.dumps({"1": {"ns": [{"name": "a", "result": "✅ 收益 5"}]}}), "")
+
+    monkeypatch.setattr(bot, "run_node", run_node)
+
+    async def scenario():
+        nonlocal started
+        started = asyncio.Event()
+        sign = lambda uid: bot.run_sign_and_fix({uid: {"ns": {"a": account("a")}}}, {}, {"users": {}}, force=True)
+        leader = asyncio.create_task(sign("1"))
+        await started.wait()
+        return await asyncio.gather(leader, sign("1"), sign("2"), sign("2"))
+
+    leader, same_user, *other_user = asyncio.run(scenario())
+
+    assert not leader["1"]["ns"][0].get("no_log")
+    assert same_user["1"]["ns"][0]["shared"] and same_user["1"]["ns"][0]["no_log"]
+    assert sorted(r["2"]["ns"][0]["no_log"] for r in other_user) == [False, True]
+    with open(bot.sign_ledger.path, encoding="utf-8") as f:
+        assert json.load(f)["entries"]["ns:a"]["uids"] == ["1", "2"]
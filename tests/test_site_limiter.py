@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+import site_limiter
+from site_limiter import SiteLimiter
+
+
+@pytest.fixture(autouse=True)
+def state_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "site_limits.json")
+    monkeypatch.setattr(site_limiter, "STATE_FILE", path)
+    monkeypatch.setattr(site_limiter, "LOCK_FILE", path + ".lock")
+    monkeypatch.setattr(site_limiter, "_limiters", {})
+    return path
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(site_limiter.time, "time", lambda: now[0])
+    return now
+
+
+def shared(site_type="ns"):
+    return site_limiter._read_state()[site_type]
+
+
+def test_successes_increase_rate_on_sync():
+    limiter = SiteLimiter("ns")
+    limiter._sync()
+    for _ in range(5):
+        limiter.on_success()
+    assert shared()["rate"] == site_limiter.INIT_RATE
+    limiter._sync()
+    assert shared()["rate"] == pytest.approx(site_limiter.INIT_RATE + 5 * site_limiter.RATE_STEP)
+    assert limiter.rate == shared()["rate"]
+
+
+def test_rate_is_clamped():
+    limiter = SiteLimiter("ns")
+    for _ in range(1000):
+        limiter.on_success()
+    limiter._sync()
+    assert limiter.rate == site_limiter.MAX_RATE
+
+
+def test_throttle_halves_once_per_cooldown(clock):
+    limiter = SiteLimiter("ns")
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert shared()["rate"] == site_limiter.INIT_RATE * site_limiter.DECREASE
+    assert limiter.tokens < 0.01
+    clock[0] += site_limiter.COOLDOWN
+    limiter.on_throttle()
+    assert shared()["rate"] == site_limiter.INIT_RATE * site_limiter.DECREASE ** 2
+    for _ in range(20):
+        clock[0] += site_limiter.COOLDOWN
+        limiter.on_throttle()
+    assert shared()["rate"] == site_limiter.MIN_RATE
+
+
+def test_instances_share_rate(clock):
+    a, b = SiteLimiter("ns"), SiteLimiter("ns")
+    a._sync()
+    b._sync()
+    a._sync()
+    assert a.share == b.share == pytest.approx(site_limiter.INIT_RATE / 2)
+    # b 降速后 a 下次同步即可看到
+    b.on_throttle()
+    a._sync()
+    assert a.rate == site_limiter.INIT_RATE * site_limiter.DECREASE
+    # b 不再同步后让出份额
+    clock[0] += site_limiter.ACTIVE_WINDOW
+    a._sync()
+    assert a.share == a.rate
+
+
+def test_flush_unregisters_and_writes_pending():
+    a, b = SiteLimiter("ns"), SiteLimiter("ns")
+    a._sync()
+    b._sync()
+    b.on_success()
+    b.flush()
+    assert list(shared()["procs"]) == [a.proc_id]
+    a._sync()
+    assert a.share == pytest.approx(site_limiter.INIT_RATE + site_limiter.RATE_STEP)
+
+
+def test_acquire_does_not_rewrite_state_between_syncs(monkeypatch):
+    writes = []
+    write = site_limiter._write_state
+    monkeypatch.setattr(site_limiter, "_write_state", lambda state: (writes.append(1), write(state)))
+    monkeypatch.setattr(site_limiter, "INIT_RATE", 1000.0)
+    monkeypatch.setattr(site_limiter, "MAX_RATE", 1000.0)
+    limiter = SiteLimiter("ns")
+    for _ in range(50):
+        limiter.acquire()
+        limiter.on_success()
+    assert len(writes) == 1
+
+
+def test_combined_rate_across_instances(monkeypatch):
+    monkeypatch.setattr(site_limiter, "INIT_RATE", 20.0)
+    monkeypatch.setattr(site_limiter, "RATE_STEP", 0.0)
+    limiters = [SiteLimiter("ns") for _ in range(3)]
+    for limiter in limiters:
+        limiter._sync()
+    taken = []
+
+    def worker(limiter):
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            limiter.acquire()
+            taken.append(1)
+
+    threads = [threading.Thread(target=worker, args=(limiter,)) for limiter in limiters]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 1 秒共享速率 20 + 每个实例的初始令牌
+    assert len(taken) <= 20 + 2 * len(limiters) + 1
+
+
+def test_stale_lock_is_broken(state_file):
+    with open(state_file + ".lock", "w") as f:
+        f.write("dead")
+    old = time.time() - site_limiter.LOCK_STALE - 1
+    site_limiter.os.utime(state_file + ".lock", (old, old))
+    SiteLimiter("ns")._sync()
+    assert shared()["procs"]
+
+
+def test_fresh_lock_is_not_broken(state_file):
+    with open(state_file + ".lock", "w") as f:
+        f.write("holder")
+    site_limiter._break_stale_lock()
+    with open(state_file + ".lock") as f:
+        assert f.read() == "holder"
+
+
+def test_release_keeps_lock_taken_over_by_another_process(state_file):
+    with site_limiter._file_lock():
+        # 持锁过久被其他进程当作过期锁清理并重新加锁
+        with open(state_file + ".lock", "w") as f:
+            f.write("other")
+    with open(state_file + ".lock") as f:
+        assert f.read() == "other"
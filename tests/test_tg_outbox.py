@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("telegram")
+
+import tg_outbox  # noqa: E402
+from tg_outbox import Outbox  # noqa: E402
+
+
+class FakeBot:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []   # (chat_id, text, 发送时间)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, time.monotonic()))
+        await asyncio.sleep(self.delay)
+        return text
+
+
+@pytest.fixture
+def intervals(monkeypatch):
+    monkeypatch.setattr(tg_outbox, "CHAT_INTERVAL", 0.1)
+    monkeypatch.setattr(tg_outbox, "GROUP_INTERVAL", 0.3)
+
+
+def gaps(sent, chat_id):
+    times = [t for c, _, t in sent if c == chat_id]
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+def test_messages_to_one_chat_are_spaced_in_order(intervals):
+    bot = FakeBot()
+
+    async def run():
+        outbox = Outbox(bot, global_rate=100)
+        await asyncio.gather(*(outbox.send(1, f"m{i}") for i in range(4)))
+        await asyncio.gather(*(outbox.send(-5, f"g{i}") for i in range(2)))
+
+    asyncio.run(run())
+    assert [t for c, t, _ in bot.sent if c == 1] == ["m0", "m1", "m2", "m3"]
+    assert all(g >= 0.1 - 0.01 for g in gaps(bot.sent, 1))
+    assert all(g >= 0.3 - 0.01 for g in gaps(bot.sent, -5))
+
+
+def test_backlog_in_one_chat_does_not_block_others(monkeypatch):
+    monkeypatch.setattr(tg_outbox, "CHAT_INTERVAL", 1.0)
+    bot = FakeBot()
+
+    async def run():
+        # 全局只有 2 个并发名额，chat 1 积压的消息在等间隔时不能占着它们
+        outbox = Outbox(bot, global_rate=2)
+        start = time.monotonic()
+        backlog = [asyncio.create_task(outbox.send(1, f"m{i}")) for i in range(5)]
+        await asyncio.sleep(0)
+        await outbox.send(2, "other")
+        elapsed = time.monotonic() - start
+        for task in backlog:
+            task.cancel()
+        await asyncio.gather(*backlog, return_exceptions=True)
+        return elapsed
+
+    assert asyncio.run(run()) < 0.8
+
+
+def test_global_rate_is_respected(intervals):
+    bot = FakeBot()
+
+    async def run():
+        outbox = Outbox(bot, global_rate=20)
+        await asyncio.gather(*(outbox.send(chat_id, "x") for chat_id in range(1, 11)))
+        assert outbox.stats() == {"delivered": 10, "failed": 0, "retried": 0}
+        assert outbox._chats == {}
+
+    asyncio.run(run())
+    times = sorted(t for _, _, t in bot.sent)
+    assert times[-1] - times[0] >= 9 / 20 - 0.02
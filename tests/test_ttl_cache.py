@@ -0,0 +1,73 @@
+import pytest
+
+import ttl_cache
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [50.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_and_expire(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    assert cache.get("a") == 1 and "a" in cache
+    clock[0] += 5
+    assert "a" not in cache
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"]["expired"] == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_lru_eviction_keeps_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.keys() == ["a", "c"]
+    assert cache.evictions["lru"] == 1
+
+
+def test_memory_budget(clock):
+    cache = TTLCache(maxsize=100, ttl=60, max_bytes=10, sizer=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.set("c", "zzzz")
+    assert cache.keys() == ["b", "c"]
+    assert cache.bytes == 8
+    assert cache.evictions["memory"] == 1
+    # 单个条目超过预算时仍然保留最新写入的
+    cache.set("d", "x" * 20)
+    assert cache.keys() == ["d"]
+
+
+def test_expired_entries_purged_on_write(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    for key in "abc":
+        cache.set(key, key)
+    clock[0] += 5
+    cache.set("d", "d")
+    assert cache.keys() == ["d"]
+    assert cache.evictions["expired"] == 3
+
+
+def test_overwrite_extends_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    clock[0] += 3
+    cache.set("a", 2)
+    clock[0] += 3
+    cache.set("b", 0)   # 触发清理：a 的旧过期记录已失效，不能删掉新值
+    assert cache.get("a") == 2
+
+
+def test_expiry_queue_stays_bounded(clock):
+    cache = TTLCache(maxsize=4, ttl=60)
+    for i in range(1000):
+        cache.set(i % 3, i)
+    assert len(cache._expiry) <= 2 * max(len(cache), cache.maxsize) + 1
+    assert sorted(cache.keys()) == [0, 1, 2]
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+
+
+def update_from(user_id, replies=None):
+    message = None
+    if replies is not None:
+        async def reply_text(text):
+            replies.append((user_id, text))
+        message = SimpleNamespace(reply_text=reply_text)
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None,
+                           callback_query=None, effective_message=message)
+
+
+def test_queued_updates_of_one_user_do_not_hold_global_slots():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        release_a = asyncio.Event()
+        started = []
+
+        async def handler(name, wait=None):
+            started.append(name)
+            if wait:
+                await wait.wait()
+
+        tasks = [asyncio.create_task(processor.process_update(update_from(1), handler(f"a{i}", release_a)))
+                 for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(update_from(2), handler("b"))))
+        await asyncio.sleep(0.01)
+        # 用户 1 的第一条还没处理完，用户 2 的更新已经开始
+        assert started == ["a0", "b"]
+        assert processor.current_concurrent_updates == 1
+        release_a.set()
+        await asyncio.gather(*tasks)
+        assert started == ["a0", "b", "a1", "a2"]
+        assert processor.stats() == {"active_users": 0, "queued": 0, "dropped": 0}
+    asyncio.run(run())
+
+
+def test_same_user_updates_run_in_order():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        order = []
+
+        async def handler(i):
+            await asyncio.sleep(0.01 * (3 - i))
+            order.append(i)
+
+        await asyncio.gather(*(processor.process_update(update_from(1), handler(i)) for i in range(3)))
+        assert order == [0, 1, 2]
+    asyncio.run(run())
+
+
+def test_overflow_is_dropped_with_one_reply():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4, user_queue_limit=2)
+        gate = asyncio.Event()
+        replies = []
+
+        async def handler():
+            await gate.wait()
+
+        tasks = [asyncio.create_task(processor.process_update(update_from(1, replies), handler())) for _ in range(2)]
+        await asyncio.sleep(0)
+        for _ in range(3):
+            await processor.process_update(update_from(1, replies), handler())
+        assert processor.dropped == 3
+        assert len(replies) == 1
+        gate.set()
+        await asyncio.gather(*tasks)
+    asyncio.run(run())
@@ -0,0 +1,130 @@
+# tg_outbox.py - Telegram 出站消息队列：全局/单聊天限速、并发发送、遵守 RetryAfter
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+from metrics import TG_SENT, TG_SEND_FAILURES
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30        # Bot 全局每秒最多 30 条
+CHAT_INTERVAL = 1.0     # 同一私聊每秒 1 条
+GROUP_INTERVAL = 3.0    # 群组每分钟 20 条
+MAX_ATTEMPTS = 3
+
+
+def _seconds(retry_after) -> float:
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def _sleep_until(deadline: float):
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+class Outbox:
+    def __init__(self, bot, global_rate: int = GLOBAL_RATE):
+        self.bot = bot
+        self.global_rate = global_rate
+        self._sem = asyncio.Semaphore(global_rate)
+        self._next_global = 0.0
+        self._paused_until = 0.0
+        self._chat_next = {}   # chat_id -> 下一条最早的发送时间
+        self._chats = {}       # chat_id -> [聊天锁, 排队数]
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _reserve_global(self) -> float:
+        """预约全局时间槽（同步执行，并发下不会超发）"""
+        g = max(time.monotonic(), self._next_global, self._paused_until)
+        self._next_global = g + 1 / self.global_rate
+        return g
+
+    @asynccontextmanager
+    async def _chat_turn(self, chat_id):
+        """同一聊天的消息依次发送：持有聊天锁等到单聊天间隔满足，等待时不占并发名额，某个聊天积压不会挡住其他聊天"""
+        entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await _sleep_until(self._chat_next.get(chat_id, 0.0))
+                try:
+                    yield
+                finally:
+                    interval = GROUP_INTERVAL if int(chat_id) < 0 else CHAT_INTERVAL
+                    self._chat_next[chat_id] = time.monotonic() + interval
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+            if len(self._chat_next) > 10000:
+                now = time.monotonic()
+                self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+
+    async def _wait_global(self):
+        while True:
+            await _sleep_until(self._reserve_global())
+            # 等待期间收到 RetryAfter，重新排队
+            if time.monotonic() >= self._paused_until:
+                return
+
+    @traced("tg_send")
+    async def send(self, chat_id, text: str, **kwargs):
+        """发送一条消息，成功返回 Message，最终失败返回 None"""
+        reason = "retry_after"
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            backoff = 0.0
+            # 全局名额只在真正调用 API 时占用
+            async with self._chat_turn(chat_id):
+                await self._wait_global()
+                async with self._sem:
+                    try:
+                        msg = await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                        self.delivered += 1
+                        TG_SENT.inc()
+                        return msg
+                    except RetryAfter as e:
+                        wait = _seconds(e.retry_after)
+                        self._paused_until = max(self._paused_until, time.monotonic() + wait)
+                        self.retried += 1
+                        logger.warning("Telegram 限流，暂停发送 %.0f 秒", wait)
+                    except (Forbidden, BadRequest) as e:
+                        logger.warning("发送失败: %s, 错误: %s", chat_id, e)
+                        reason = "forbidden" if isinstance(e, Forbidden) else "bad_request"
+                        break
+                    except NetworkError as e:
+                        logger.warning("发送异常(第 %d 次): %s, 错误: %s", attempt, chat_id, e)
+                        self.retried += 1
+                        reason = "network"
+                        backoff = attempt
+                    except Exception as e:
+                        logger.warning("发送失败: %s, 错误: %s", chat_id, e)
+                        reason = "other"
+                        break
+            if backoff:
+                await asyncio.sleep(backoff)
+
+        self.failed += 1
+        TG_SEND_FAILURES.inc(reason=reason)
+        return None
+
+    async def broadcast(self, messages) -> dict:
+        """并发群发 [(chat_id, text, kwargs), ...]，返回投递统计"""
+        sent = await asyncio.gather(*(
+            self.send(chat_id, text, **kwargs) for chat_id, text, kwargs in messages
+        ))
+        failed_chats = [m[0] for m, r in zip(messages, sent) if r is None]
+        return {
+            "delivered": len(sent) - len(failed_chats),
+            "failed": len(failed_chats),
+            "failed_chats": failed_chats,
+        }
+
+    def stats(self) -> dict:
+        return {"delivered": self.delivered, "failed": self.failed, "retried": self.retried}
@@ -0,0 +1,132 @@
+# tracing.py - 轻量耗时追踪：每次签到流程记录各阶段 span，最近 N 次保存在环形缓冲区
+import os
+import json
+import time
+import inspect
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "200"))   # 保留最近多少次运行
+
+_runs = deque(maxlen=TRACE_BUFFER)
+_current = contextvars.ContextVar("trace_run", default=None)
+
+
+class Run:
+    __slots__ = ("name", "wall", "start", "duration", "spans")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans = []     # (阶段, 相对开始的偏移, 耗时)
+
+
+@contextmanager
+def trace(name: str):
+    """开始一次运行；内部的 span 都记到这次运行上"""
+    run = Run(name)
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+        run.duration = time.perf_counter() - run.start
+        _runs.append(run)
+
+
+@contextmanager
+def span(stage: str):
+    """记录一个阶段；不在任何运行内时不做任何事"""
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        run.spans.append((stage, start - run.start, end - start))
+
+
+def traced(stage: str):
+    """函数装饰器版本的 span，同步/异步函数都可用"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def root(name: str):
+    """装饰协程函数：每次调用作为一次运行记录"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with trace(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[idx]
+
+
+def summary(last: int = 50) -> dict:
+    """最近 last 次运行，按运行名称统计各阶段（同一次运行内累加）耗时的 p50/p95"""
+    result = {}
+    for run in list(_runs)[-last:]:
+        entry = result.setdefault(run.name, {"runs": 0, "stages": {}})
+        entry["runs"] += 1
+        totals = {"total": run.duration}
+        for stage, _, duration in run.spans:
+            totals[stage] = totals.get(stage, 0.0) + duration
+        for stage, duration in totals.items():
+            entry["stages"].setdefault(stage, []).append(duration)
+
+    for entry in result.values():
+        entry["stages"] = {
+            stage: {
+                "count": len(values),
+                "p50": _percentile(values, 0.5),
+                "p95": _percentile(values, 0.95),
+            }
+            for stage, values in entry["stages"].items()
+        }
+    return result
+
+
+def export(path: str, last: int = 50) -> int:
+    """导出为 Chrome Trace Event 格式（chrome://tracing / Perfetto 可直接打开），返回导出的运行数"""
+    runs = list(_runs)[-last:]
+    events = []
+    for tid, run in enumerate(runs, 1):
+        base = run.wall * 1e6
+        events.append({"name": run.name, "ph": "X", "pid": 1, "tid": tid,
+                       "ts": base, "dur": run.duration * 1e6})
+        for stage, offset, duration in run.spans:
+            events.append({"name": stage, "ph": "X", "pid": 1, "tid": tid,
+                           "ts": base + offset * 1e6, "dur": duration * 1e6})
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return len(runs)
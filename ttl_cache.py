@@ -0,0 +1,88 @@
+# ttl_cache.py - 带过期时间、LRU 淘汰和内存预算的有界缓存
+import json
+import time
+from collections import OrderedDict, deque
+
+
+def json_size(value) -> int:
+    """按序列化长度估算占用字节"""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, max_bytes: int = 0, sizer=json_size):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self._data = OrderedDict()   # key -> (expires_at, size, value)，按最近使用排序
+        self._expiry = deque()       # (expires_at, key)，ttl 固定，写入顺序即过期顺序
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"expired": 0, "lru": 0, "memory": 0}
+
+    def _drop(self, key, reason: str):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+        self.evictions[reason] += 1
+
+    def _purge_expired(self):
+        """只查看队首已过期的记录，均摊 O(1)；键被重新写入后旧记录的时间对不上，直接跳过"""
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = self._expiry.popleft()
+            item = self._data.get(key)
+            if item is not None and item[0] == expires_at:
+                self._drop(key, "expired")
+        # 覆盖写入和 LRU 淘汰留下的旧记录过多时按现有条目重建
+        if len(self._expiry) > 2 * max(len(self._data), self.maxsize):
+            self._expiry = deque(sorted(((exp, key) for key, (exp, _, _) in self._data.items()), key=lambda e: e[0]))
+
+    def set(self, key, value):
+        if key in self._data:
+            _, size, _ = self._data.pop(key)
+            self.bytes -= size
+        size = self.sizer(value) if self.max_bytes else 0
+        expires_at = time.monotonic() + self.ttl
+        self._data[key] = (expires_at, size, value)
+        self._expiry.append((expires_at, key))
+        self.bytes += size
+
+        self._purge_expired()
+        while len(self._data) > self.maxsize:
+            self._drop(next(iter(self._data)), "lru")
+        while self.max_bytes and self.bytes > self.max_bytes and len(self._data) > 1:
+            self._drop(next(iter(self._data)), "memory")
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        if item[0] <= time.monotonic():
+            self._drop(key, "expired")
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[2]
+
+    def __contains__(self, key):
+        item = self._data.get(key)
+        return item is not None and item[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": dict(self.evictions),
+        }
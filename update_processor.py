@@ -0,0 +1,83 @@
+# update_processor.py - 并发处理更新：不同用户并行，同一用户的更新按到达顺序依次处理，总并发有上限
+import os
+import asyncio
+import logging
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+USER_QUEUE_LIMIT = int(os.getenv("UPDATE_USER_QUEUE", "10"))   # 单个用户最多排队的更新数，超出丢弃并提示
+BUSY_TEXT = "⏳ 请求过多，请等前面的操作完成后再试"
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """同一用户（无用户时按聊天）共用一把锁，保证顺序；轮到自己时才占用基类信号量限制的全局名额"""
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES, user_queue_limit: int = USER_QUEUE_LIMIT):
+        super().__init__(max_concurrent_updates)
+        self.user_queue_limit = user_queue_limit
+        self._locks = {}     # key -> asyncio.Lock
+        self._pending = {}   # key -> 正在处理和排队的更新数
+        self._notified = set()   # 本轮排队已提示过的用户，队列清空后重新提示
+        self.dropped = 0
+
+    @staticmethod
+    def _key(update):
+        user = getattr(update, "effective_user", None)
+        if user:
+            return f"u{user.id}"
+        chat = getattr(update, "effective_chat", None)
+        if chat:
+            return f"c{chat.id}"
+        return None
+
+    async def process_update(self, update, coroutine):
+        # 先排用户锁再占全局名额：同一用户排队中的更新不占名额，刷屏的用户挤不掉其他人
+        key = self._key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        if self._pending.get(key, 0) >= self.user_queue_limit:
+            coroutine.close()
+            self.dropped += 1
+            logger.warning("用户 %s 排队更新过多，丢弃一条更新", key)
+            await self._answer_busy(key, update)
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
+                self._notified.discard(key)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def _answer_busy(self, key, update):
+        """按钮点击总是回应（否则客户端一直转圈）；消息每轮排队只提示一次，避免提示本身刷屏"""
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(BUSY_TEXT)
+            elif update.effective_message and key not in self._notified:
+                self._notified.add(key)
+                await update.effective_message.reply_text(BUSY_TEXT)
+        except TelegramError as e:
+            logger.warning("提示用户 %s 稍后再试失败: %s", key, e)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"active_users": len(self._pending), "queued": sum(self._pending.values()), "dropped": self.dropped}